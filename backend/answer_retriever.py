@@ -1,36 +1,219 @@
-import faiss
-import numpy as np
+import time
 import json
-from sentence_transformers import SentenceTransformer
+import logging
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from metrics import STAGE_DURATION, RETRIEVAL_PATHS, RERANK_OUTCOMES
+from resources import resources
+from metadata_store import open_store, ShardedStore
+from fusion import reciprocal_rank_fusion, fit_token_budget
+from bm25 import BM25Index
+from encoders import create_encoder
+from reranker import CrossEncoderReranker
+from embedding_cache import EmbeddingCache, normalize_text
+import config
+
+logger = logging.getLogger(__name__)
 
-# Load Sentence Transformer model for encoding queries
-MODEL_NAME = 'BAAI/bge-large-en-v1.5'
-model = SentenceTransformer(MODEL_NAME)
+# Query encoder (see encoders.py for the available backends)
+def load_model():
+    # Backends import torch/onnxruntime lazily, so importing this module stays cheap
+    encoder = create_encoder(
+        config.ENCODER_BACKEND,
+        onnx_dir=config.ENCODER_ONNX_DIR,
+        projection_path=config.ENCODER_PROJECTION_PATH,
+        small_model=config.ENCODER_SMALL_MODEL,
+    )
+    logger.info(f"✅ Query encoder: {encoder.identity}")
+    return encoder
+
+# Load the index manifest written by faiss_index.py
+def load_manifest(manifest_path):
+    """
+    Returns the index manifest, or a flat-index default for indexes built without one.
+    """
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"⚠️ No index manifest at {manifest_path}, assuming a flat index.")
+        return {"index_type": "flat", "search_params": {}}
 
 # Load FAISS indexes
-def load_faiss_index(index_path, embeddings_path):
+def load_faiss_index(index_path, manifest_path=None, mmap=False):
     """
-    Load FAISS index and embeddings.
+    Load a FAISS index, applying the search parameters from the manifest.
+    With `mmap`, the index data is mapped from disk and shared between processes.
     """
-    index = faiss.read_index(index_path)
-    embeddings = np.load(embeddings_path).astype(np.float32)
-    return index, embeddings
+    import faiss
+
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ Could not memory-map {index_path}, reading it into memory: {e}")
+    if index is None:
+        index = faiss.read_index(str(index_path))
+
+    manifest = load_manifest(manifest_path or Path(index_path).with_suffix(".manifest.json"))
+    search_params = manifest.get("search_params", {})
+    params = faiss.ParameterSpace()
+    if search_params.get("nprobe") and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", int(search_params["nprobe"]))
+    base = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if search_params.get("efSearch") and isinstance(base, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", int(search_params["efSearch"]))
+
+    return index, manifest
+
+# Load embeddings (not needed for search; kept for tooling such as re-indexing)
+def load_embeddings(embeddings_path, mmap=False):
+    if mmap:
+        return np.load(embeddings_path, mmap_mode="r")
+    return np.load(embeddings_path).astype(np.float32, copy=False)
 
-# Load metadata
-def load_metadata(metadata_path):
-    with open(metadata_path, "r") as f:
-        return json.load(f)
+# Load metadata (memory-mapped, rows are decoded on access)
+def load_metadata(metadata_path, legacy_json_path=None):
+    store = open_store(metadata_path, legacy_json_path)
+    logger.info(f"✅ Metadata store opened: {len(store)} QA pairs.")
+    return store
 
 # Paths to stored embeddings and indexes
-QA_INDEX_PATH = "qa_faiss.index"
-QA_EMBEDDINGS_PATH = "qa_embeddings.npy"
-QA_METADATA_PATH = "qa_metadata.json"
+BACKEND_DIR = Path(__file__).resolve().parent
+QA_INDEX_PATH = BACKEND_DIR / "qa_faiss.index"
+QA_EMBEDDINGS_PATH = BACKEND_DIR / "qa_embeddings.npy"
+QA_METADATA_PATH = BACKEND_DIR / "qa_metadata.records"
+QA_LEGACY_METADATA_PATH = BACKEND_DIR / "qa_metadata.json"
 
-# Load FAISS indexes and metadata
-qa_index, qa_embeddings = load_faiss_index(QA_INDEX_PATH, QA_EMBEDDINGS_PATH)
-qa_metadata = load_metadata(QA_METADATA_PATH)
+QA_IDS_PATH = BACKEND_DIR / "qa_ids.npy"
+QA_BM25_PATH = BACKEND_DIR / "qa_bm25.npz"
+DOC_INDEX_PATH = BACKEND_DIR / "doc_faiss.index"
+DOC_STORE_DIR = BACKEND_DIR / "doc_store"
 
-print(f"✅ FAISS indexes loaded: {qa_index.ntotal} QA embeddings.")
+class QAKnowledgeBase:
+    """
+    One consistent snapshot of the QA index, its manifest and metadata, swapped as a unit.
+
+    Id-mapped indexes return stable ids (see qapair-embedder.py); older indexes
+    return row numbers. `rows()` resolves either to metadata rows, -1 if unknown.
+    """
+
+    def __init__(self, index, manifest, metadata, ids=None, version=None, bm25=None):
+        self.index = index
+        self.manifest = manifest
+        self.metadata = metadata
+        self.version = version
+        self.bm25 = bm25  # lexical index over the metadata rows, if built
+        self._sorted_ids = None
+        if ids is not None and manifest.get("id_map"):
+            self._rows = np.argsort(ids[:, 0], kind="stable")
+            self._sorted_ids = np.asarray(ids[self._rows, 0])
+
+    def rows(self, faiss_ids):
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        if self._sorted_ids is None:
+            return np.where((faiss_ids >= 0) & (faiss_ids < len(self.metadata)), faiss_ids, -1)
+        if len(self._sorted_ids) == 0:
+            return np.full_like(faiss_ids, -1)
+        positions = np.minimum(np.searchsorted(self._sorted_ids, faiss_ids), len(self._sorted_ids) - 1)
+        found = (faiss_ids >= 0) & (self._sorted_ids[positions] == faiss_ids)
+        return np.where(found, self._rows[positions], -1)
+
+def load_qa_kb():
+    version = index_version()
+    index, manifest = load_faiss_index(QA_INDEX_PATH, mmap=config.SHARED_MEMORY_MODE)
+    metadata = load_metadata(QA_METADATA_PATH, QA_LEGACY_METADATA_PATH)
+    ids = np.load(QA_IDS_PATH, mmap_mode="r") if QA_IDS_PATH.exists() else None
+    logger.info(f"✅ FAISS index loaded: {index.ntotal} QA embeddings ({manifest['index_type']}).")
+    return QAKnowledgeBase(index, manifest, metadata, ids, version, load_bm25(len(metadata)))
+
+def load_bm25(rows):
+    if not config.HYBRID_RETRIEVAL or not QA_BM25_PATH.exists():
+        return None
+    bm25 = BM25Index.load(QA_BM25_PATH)
+    if len(bm25) != rows:
+        logger.warning(f"⚠️ {QA_BM25_PATH.name} covers {len(bm25)} rows but the metadata has {rows}, "
+                       "re-run qapair-embedder.py. Hybrid retrieval is disabled.")
+        return None
+    logger.info(f"✅ BM25 index loaded: {len(bm25.vocab)} terms.")
+    return bm25
+
+def load_doc_kb():
+    """
+    The PDF chunk index built by `faiss_index.py --doc-store`, or None if there is none.
+    """
+    version = doc_index_version()
+    if not config.DOC_RETRIEVAL_ENABLED or version is None:
+        return None
+    index, manifest = load_faiss_index(DOC_INDEX_PATH, mmap=config.SHARED_MEMORY_MODE)
+    metadata = ShardedStore(DOC_STORE_DIR, manifest.get("doc_shards", []))
+    logger.info(f"✅ FAISS index loaded: {index.ntotal} document chunks ({manifest['index_type']}).")
+    return QAKnowledgeBase(index, manifest, metadata, version=version)
+
+def load_reranker():
+    if not config.RERANK_ENABLED:
+        return None
+    reranker = CrossEncoderReranker(config.RERANK_MODEL, batch_size=config.RERANK_BATCH_SIZE)
+    logger.info(f"✅ Reranker loaded: {reranker.name}")
+    return reranker
+
+# Nothing heavy is loaded at import time; the API warms these up in the background
+resources.register("encoder", load_model)
+resources.register("qa_kb", load_qa_kb)
+resources.register("doc_kb", load_doc_kb)
+resources.register("reranker", load_reranker)
+resources.register("qa_embeddings", lambda: load_embeddings(QA_EMBEDDINGS_PATH, mmap=config.SHARED_MEMORY_MODE), warm=False)
+
+# Query embeddings of repeated questions (memory LRU + optional SQLite tier)
+embedding_cache = EmbeddingCache(
+    max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES,
+    db_path=config.EMBEDDING_CACHE_DB_PATH or None,
+    max_disk_entries=config.EMBEDDING_CACHE_DISK_MAX_ENTRIES,
+) if config.EMBEDDING_CACHE_ENABLED else None
+
+# Thread pool so the QA and document indexes are searched at the same time (FAISS releases the GIL)
+search_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="faiss-search")
+
+_reload_lock = threading.Lock()
+_reload_checked_at = {}
+
+def get_model():
+    return resources.get("encoder")
+
+def hot_reload(name, loader, version_fn):
+    """
+    Returns the current snapshot of resource `name`, hot-swapping in a new one
+    when faiss_index.py has rewritten its index (checked every few seconds).
+    """
+    kb = resources.get(name)
+
+    now = time.monotonic()
+    if now - _reload_checked_at.get(name, 0.0) < config.INDEX_RELOAD_INTERVAL_SECONDS:
+        return kb
+
+    with _reload_lock:
+        _reload_checked_at[name] = now
+        if version_fn() != (kb.version if kb is not None else None):
+            logger.info(f"♻️ {name} index changed on disk, hot-swapping it.")
+            try:
+                kb = loader()
+            except Exception:
+                logger.exception(f"❌ Failed to reload {name}, keeping the current one.")
+            else:
+                resources.replace(name, kb)
+    return kb
+
+def get_reranker():
+    return resources.get("reranker")
+
+def get_qa_kb():
+    return hot_reload("qa_kb", load_qa_kb, index_version)
+
+def get_doc_kb():
+    return hot_reload("doc_kb", load_doc_kb, doc_index_version)
 
 def apply_prompt(query, document, usr_prompt=None):
     """
@@ -53,34 +236,184 @@ def apply_prompt(query, document, usr_prompt=None):
 
     return result
 
-def retrieve_qa_context(queries, top_k=3):
+def encode_queries(queries):
     """
-    Retrieves relevant QA pairs and document text to generate structured prompts.
+    Encodes a batch of queries in a single forward pass, skipping queries
+    whose embedding is cached.
     """
-    prompt_list = []
+    model = get_model()
+    queries = list(queries)
+    if embedding_cache is None:
+        return model.encode(queries)
 
-    for query in queries:
-        # Encode query
-        query_embedding = model.encode([query], normalize_embeddings=True).astype(np.float32)
+    vectors = embedding_cache.get_many(model.identity, queries)
+    missing = {}  # normalized text -> positions; each distinct question is encoded once
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(normalize_text(queries[i]), []).append(i)
+    if missing:
+        texts = [queries[positions[0]] for positions in missing.values()]
+        encoded = model.encode(texts)
+        embedding_cache.put_many(model.identity, texts, encoded)
+        for vector, positions in zip(encoded, missing.values()):
+            for i in positions:
+                vectors[i] = vector
+    return np.stack(vectors).astype(np.float32, copy=False)
 
-        # Search FAISS QA index
-        qa_distances, qa_indices = qa_index.search(query_embedding, top_k)
-        best_qa_matches = [qa_metadata[i] for i in qa_indices[0]]
+def format_hit(hit, qa_metadata, doc_metadata):
+    """
+    Renders a ("qa" | "doc", row) hit as a context line, or None if its row is gone.
+    """
+    corpus, row = hit
+    if corpus == "qa":
+        qa = qa_metadata.get(row, ("question", "answer"))
+        return f"Q: {qa['question']} A: {qa['answer']}"
+    chunk = doc_metadata.get(row, ("content", "source", "page_number")) if doc_metadata is not None else None
+    if chunk is None:
+        return None
+    return f"[{chunk['source']}, p. {chunk['page_number']}] {chunk['content']}"
 
+def rerank_contexts(reranker, queries, contexts):
+    """
+    Rescores the fused candidates with the cross-encoder within RERANK_BUDGET_MS per
+    request. Queries that run out of budget keep the whole fused list (scored
+    candidates first), like the non-reranked path, for fit_token_budget to trim.
+    """
+    candidates = [texts[:config.RERANK_CANDIDATES] for texts in contexts]
+    with STAGE_DURATION.labels(stage="rerank").time():
+        ranked, fallbacks = reranker.rerank(queries, candidates, config.RERANK_TOP_N, config.RERANK_BUDGET_MS / 1000)
+    for q in fallbacks:
+        ranked[q] += contexts[q][config.RERANK_CANDIDATES:]
+    RERANK_OUTCOMES.labels(outcome="reranked").inc(len(queries) - len(fallbacks))
+    if fallbacks:
+        RERANK_OUTCOMES.labels(outcome="fallback").inc(len(fallbacks))
+        logger.debug(f"Rerank budget exceeded, {len(fallbacks)}/{len(queries)} queries kept the fused order")
+    return ranked
 
+def build_prompts(queries, rankings, qa_metadata, doc_metadata=None, reranker=None):
+    """
+    Builds one structured prompt per query: the per-corpus rankings are fused with
+    reciprocal-rank fusion, optionally reranked, and the best hits are kept within
+    the context token budget.
+    """
+    contexts = []
+    for query_rankings in rankings:
+        fused = reciprocal_rank_fusion(query_rankings, k=config.RRF_K)
         # Construct document text from retrieved results
-        retrieved_docs = [
-            f"Q: {qa['question']} A: {qa['answer']}" for qa in best_qa_matches
-        ]
+        contexts.append([text for text in (format_hit(hit, qa_metadata, doc_metadata) for hit in fused) if text])
+
+    if reranker is not None:
+        contexts = rerank_contexts(reranker, queries, contexts)
+
+    prompt_list = []
+    for query, retrieved_docs in zip(queries, contexts):
+        retrieved_docs = fit_token_budget(retrieved_docs, config.CONTEXT_TOKEN_BUDGET)
 
         document_text = "\n".join(retrieved_docs)
 
         # Apply prompt formatting
-        prompt = apply_prompt(query, document_text)
-        prompt_list.append(prompt)
+        prompt_list.append(apply_prompt(query, document_text))
+
+    return prompt_list
+
+def search_corpus(kb, corpus, query_embeddings, top_k):
+    """
+    Returns one ranked list of (corpus, metadata row) hits per query.
+    """
+    if kb is None or top_k <= 0 or kb.index.ntotal == 0:
+        return [[] for _ in range(len(query_embeddings))]
+    _, ids = kb.index.search(query_embeddings, top_k)
+    return [[(corpus, int(row)) for row in rows if row >= 0] for rows in kb.rows(ids)]
+
+def lexical_search(bm25, queries, top_k):
+    """
+    BM25 hits per query, plus whether each is confident enough to skip dense retrieval.
+    """
+    if bm25 is None or top_k <= 0:
+        return [[] for _ in queries], [False] * len(queries)
+
+    rankings, confident = [], []
+    for query in queries:
+        hits, confidence = bm25.search(query, top_k)
+        rankings.append([("qa", row) for row, _ in hits])
+        margin = hits[0][1] / hits[1][1] if len(hits) > 1 and hits[1][1] > 0 else float("inf")
+        confident.append(
+            config.LEXICAL_FAST_PATH and bool(hits)
+            and confidence >= config.LEXICAL_FAST_PATH_MIN_CONFIDENCE
+            and margin >= config.LEXICAL_FAST_PATH_MIN_MARGIN
+        )
+    return rankings, confident
+
+def retrieve_batch(queries, top_k=3, doc_top_k=None):
+    """
+    Runs BM25 over the QA pairs, then encodes the remaining queries at once and
+    searches the QA and document indexes in parallel with one FAISS call each.
+    Queries with a confident BM25 match skip embedding when the lexical fast
+    path is enabled. With reranking on, both indexes are over-fetched and the
+    fused candidates rescored by the cross-encoder. Returns the prompts and the
+    query embeddings (None for fast-path queries).
+    """
+    doc_top_k = config.DOC_TOP_K if doc_top_k is None else doc_top_k
+    qa_kb, doc_kb = get_qa_kb(), get_doc_kb()
+    reranker = get_reranker()
+    if reranker is not None:
+        top_k, doc_top_k = max(top_k, config.RERANK_CANDIDATES), max(doc_top_k, config.RERANK_CANDIDATES)
+
+    with STAGE_DURATION.labels(stage="bm25_search").time():
+        lexical_hits, confident = lexical_search(qa_kb.bm25, queries, config.BM25_TOP_K)
+
+    dense = [i for i, fast in enumerate(confident) if not fast]
+    query_embeddings = [None] * len(queries)
+    qa_hits = [[] for _ in queries]
+    doc_hits = [[] for _ in queries]
+
+    if dense:
+        with STAGE_DURATION.labels(stage="embedding").time():
+            dense_embeddings = encode_queries([queries[i] for i in dense])
+        with STAGE_DURATION.labels(stage="faiss_search").time():
+            doc_search = search_pool.submit(search_corpus, doc_kb, "doc", dense_embeddings, doc_top_k)
+            dense_qa_hits = search_corpus(qa_kb, "qa", dense_embeddings, top_k)
+            dense_doc_hits = doc_search.result()
+        for j, i in enumerate(dense):
+            query_embeddings[i] = dense_embeddings[j]
+            qa_hits[i], doc_hits[i] = dense_qa_hits[j], dense_doc_hits[j]
+
+    for fast in confident:
+        path = "lexical" if fast else ("hybrid" if qa_kb.bm25 is not None else "dense")
+        RETRIEVAL_PATHS.labels(path=path).inc()
 
+    rankings = [[qa, doc, lexical] for qa, doc, lexical in zip(qa_hits, doc_hits, lexical_hits)]
+    doc_metadata = doc_kb.metadata if doc_kb is not None else None
+    return build_prompts(queries, rankings, qa_kb.metadata, doc_metadata, reranker), query_embeddings
+
+def retrieve_qa_context(queries, top_k=3):
+    """
+    Retrieves relevant QA pairs and PDF chunks to generate structured prompts.
+    """
+    if not queries:
+        return []
+
+    prompt_list, _ = retrieve_batch(queries, top_k)
     return prompt_list
 
+def index_version():
+    """
+    Identifies the KB index on disk; changes whenever faiss_index.py rebuilds or updates it.
+    """
+    manifest_path = QA_INDEX_PATH.with_suffix(".manifest.json")
+    path = manifest_path if manifest_path.exists() else QA_INDEX_PATH
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def doc_index_version():
+    manifest_path = DOC_INDEX_PATH.with_suffix(".manifest.json")
+    try:
+        return manifest_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
 if __name__ == '__main__':
     queries = [
         "What factors determine the severity of a vulnerability?",
@@ -1,19 +1,51 @@
 import asyncio
+import json
 import time
 import logging
-import torch
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel
-from followup_detector import is_followup_question
-from llm_infer import get_response, augment_question
+from typing import Any, Dict, Optional
+from followup_detector import classify_followup
+from llm_infer import get_response, augment_question, record_exchange, stream_response, client as llm_client
 from routes import router as api_router
 from auth import router as auth_router
 from fastapi.middleware.cors import CORSMiddleware
-from backend.answer_retriever import retrieve_qa_context, load_faiss_index
+from retrieval_batcher import retrieval_batcher
 from ontology_validator import ontology_validation
+from answer_retriever import index_version, doc_index_version, embedding_cache
+from resources import resources
+from db import engine as db_engine, init_db
+from history_writer import history_writer
+from security import password_hasher, session_user, authorize
+from semantic_cache import SemanticCache
+from ontology_precheck import OntologyPrecheck
+from pipeline import StageTimings, race_speculative
+from metrics import CONTENT_TYPE, REQUEST_DURATION, REQUESTS_IN_FLIGHT, render as render_metrics, mark_process_dead
+import config
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts warming the encoder, FAISS index and metadata in the background so
+    the worker accepts connections immediately; /health reports when it is ready.
+    """
+    await init_db()
+    if config.HISTORY_PERSIST_ENABLED:
+        await history_writer.start()
+    if config.WARMUP_ON_STARTUP:
+        resources.start_warmup()
+    yield
+    await retrieval_batcher.close()
+    await llm_client.close()
+    await history_writer.close()
+    password_hasher.close()
+    await db_engine.dispose()
+    mark_process_dead()
 
 # Setup FastAPI
-app = FastAPI(title="CyberBot RAG API", version="1.0")
+app = FastAPI(title="CyberBot RAG API", version="1.0", lifespan=lifespan)
 app.include_router(api_router)
 app.include_router(auth_router)
 
@@ -26,10 +58,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """
+    Records request latency and in-flight requests. For streaming responses
+    this covers the time until the response starts, not the whole stream.
+    """
+    start = time.perf_counter()
+    status = 500
+    with REQUESTS_IN_FLIGHT.track_inprogress():
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        finally:
+            elapsed = time.perf_counter() - start
+            # Use the route template so /questions/{user_id} is one series, not one per user
+            route = request.scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_DURATION.labels(method=request.method, path=path, status=status).observe(elapsed)
+
+    if config.TIMING_HEADER_ENABLED:
+        timings = getattr(request.state, "timings", None)
+        entries = [f"{name};dur={ms}" for name, ms in (timings.as_dict().items() if timings else [])]
+        entries.append(f"app;dur={round(elapsed * 1000, 2)}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+    return response
+
 # Logging Configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Semantic cache for repeated non-follow-up questions
+answer_cache = SemanticCache(
+    threshold=config.SEMANTIC_CACHE_THRESHOLD,
+    max_entries=config.SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl_seconds=config.SEMANTIC_CACHE_TTL_SECONDS,
+    version_fn=lambda: (index_version(), doc_index_version()),
+)
 
 # Pydantic request/response models
 class QueryRequest(BaseModel):
@@ -42,72 +108,330 @@ class QueryResponse(BaseModel):
     generated_answer: str
     validation_result: str
     confidence_score: float
+    timings: Optional[Dict[str, float]] = None
+    # Local ontology check over the streamed answer (PIPELINED_MODE only)
+    precheck: Optional[Dict[str, Any]] = None
+
+
+NOT_PASS_MESSAGE = "⚠️ This answer could not be validated against the ontology. Please refine your question."
+FALLBACK_ANSWER = "I'm sorry, but I couldn't generate a response. Please try again."
+
 
+async def timed_retrieve(timings, stage, question):
+    with timings.stage(stage):
+        return await retrieval_batcher.retrieve(question)
 
-async def retrieve_and_answer(user_id, question):
+
+async def speculative_retrieve(user_id, question, timings):
     """
-    Augments the user question using chat history,
-    retrieves context from FAISS using the augmented question,
-    and generates an answer using the original question.
+    Retrieves for the raw and the rewritten question at the same time.
+    The rewritten result wins if it arrives within the speculation deadline.
+    """
+    raw_task = asyncio.create_task(timed_retrieve(timings, "retrieval_raw", question))
+
+    async def rewrite_and_retrieve():
+        with timings.stage("rewrite"):
+            rewritten = await augment_question(user_id, question)
+        if rewritten.strip().lower() == question.strip().lower():
+            # Shielded so that losing the race does not cancel the shared raw retrieval
+            return question, await asyncio.shield(raw_task)
+        return rewritten, await timed_retrieve(timings, "retrieval_rewritten", rewritten)
+
+    async def raw_result():
+        return question, await raw_task
+
+    (augmented_question, retrieval), winner = await race_speculative(
+        asyncio.create_task(raw_result()),
+        asyncio.create_task(rewrite_and_retrieve()),
+        config.SPECULATION_TIMEOUT_SECONDS,
+    )
+    logger.info(f"🏁 Speculative retrieval winner: {winner}")
+    return augmented_question, retrieval
+
+
+async def retrieve_context(user_id, question, timings):
+    """
+    Augments the user question using chat history and
+    retrieves context from FAISS using the augmented question.
     """
     # Step 1: Augment question for retrieval
-    is_followup, reason = is_followup_question(question)
-    if is_followup:
-        logger.info(f"✍️ Augmenting question — follow-up detected. Reason: {reason}")
-        augmented_question = await asyncio.to_thread(augment_question, user_id, question)
+    with timings.stage("followup_detection"):
+        strength, reason = classify_followup(question)
+    if strength == "borderline" and config.PIPELINED_MODE:
+        logger.info(f"🔀 Borderline follow-up, retrieving speculatively. Reason: {reason}")
+        augmented_question, (retrieved_context, query_embedding) = await speculative_retrieve(user_id, question, timings)
     else:
-        logger.info(f"✅ No augmentation — Reason: {reason}")
-        augmented_question = question
+        if strength != "none":
+            logger.info(f"✍️ Augmenting question — follow-up detected. Reason: {reason}")
+            with timings.stage("rewrite"):
+                augmented_question = await augment_question(user_id, question)
+        else:
+            logger.info(f"✅ No augmentation — Reason: {reason}")
+            augmented_question = question
 
-    # Step 2: Use augmented question for RAG context retrieval
-    prompts = retrieve_qa_context([augmented_question])  
-    retrieved_context = prompts[0]  # First retrieved prompt
-    
-    # Step 3: Use original question in prompt (not augmented version)
-    answer_prompt = f"""
+        # Step 2: Use augmented question for RAG context retrieval
+        retrieved_context, query_embedding = await timed_retrieve(timings, "retrieval", augmented_question)
+
+    return retrieved_context, augmented_question, query_embedding, strength != "none"
+
+
+def build_answer_prompt(question, retrieved_context):
+    return f"""
     You are an expert in cybersecurity and cloud computing.
     {retrieved_context}
     QUESTION: {question}
     ANSWER:
     """
+
+
+async def stream_answer_tokens(user_id, question, retrieved_context, timings, precheck=None):
+    """
+    Yields answer tokens from the model stream, feeding the ontology pre-check as they arrive.
+    """
+    answer_prompt = build_answer_prompt(question, retrieved_context)
+    first_token = True
+
+    with timings.stage("generation"):
+        try:
+            async for token in stream_response(answer_prompt, user_id, max_tokens=300):
+                if first_token:
+                    timings.mark("first_token")
+                    first_token = False
+                # `precheck_grounded` is how far into the request the local Pass was settled
+                if precheck is not None and precheck.feed(token) and "precheck_grounded" not in timings.stages:
+                    timings.mark("precheck_grounded")
+                yield token
+        except Exception:
+            logger.exception("❌ Error streaming Together AI response")
+
+
+async def generate_answer(user_id, question, retrieved_context, timings, precheck=None):
+    """
+    Generates an answer using the original question and the retrieved context.
+    """
+    # Pipelined mode streams internally so the pre-check overlaps with generation
+    if config.PIPELINED_MODE:
+        parts = [token async for token in stream_answer_tokens(user_id, question, retrieved_context, timings, precheck)]
+        return "".join(parts).strip() or FALLBACK_ANSWER
+
+    # Step 3: Use original question in prompt (not augmented version)
+    answer_prompt = build_answer_prompt(question, retrieved_context)
     
     # Step 4: Send prompt to model
-    response = await asyncio.to_thread(get_response, input_text=answer_prompt, user_id=user_id, max_tokens=300)
-    generated_answer = response.choices[0].message.content.strip() if response and response.choices else "I'm sorry, but I couldn't generate a response. Please try again."
+    with timings.stage("generation"):
+        response = await get_response(input_text=answer_prompt, user_id=user_id, max_tokens=300)
+    generated_answer = response.choices[0].message.content.strip() if response and response.choices else FALLBACK_ANSWER
+
+    return generated_answer
+
+
+async def persist_answer(user_id, question, rewritten_question, retrieved_context, generated_answer,
+                         validation_result, confidence_score, timings):
+    """
+    Queues the answered question for the write-behind history writer.
+    """
+    if not config.HISTORY_PERSIST_ENABLED:
+        return
+    await history_writer.submit({
+        "user_id": user_id,
+        "question": question,
+        "answer": generated_answer,
+        "validation_result": validation_result,
+        "confidence_score": confidence_score,
+        "rewritten_question": rewritten_question,
+        "retrieval_context": retrieved_context,
+        "timings": timings,
+    })
+
+
+async def validate_answer(rewritten_question, generated_answer, user_id, timings, precheck=None):
+    """
+    Validates the answer. With a pre-check that grounded the answer while it
+    streamed (and ONTOLOGY_LOCAL_VALIDATION on), the verdict is already known
+    and no LLM validation call is made.
+    """
+    precheck_result = None
+    if precheck is not None:
+        with timings.stage("precheck"):
+            precheck_result = precheck.finish()
+        logger.info(f"🔎 Ontology pre-check: {precheck_result}")
 
-    return retrieved_context, generated_answer, augmented_question
+    with timings.stage("validation"):
+        validation_data = await ontology_validation(rewritten_question, generated_answer, user_id, precheck)
+
+    if precheck_result is not None:
+        validation_data["precheck"] = precheck_result
+    return validation_data
+
+
+@app.get("/health")
+def health():
+    """
+    Readiness probe: 503 until the heavy resources have been loaded.
+    """
+    status = resources.status()
+    return JSONResponse(status, status_code=200 if resources.ready else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = answer_cache.stats()
+    if embedding_cache is not None:
+        stats["embedding"] = embedding_cache.stats()
+    return stats
 
 
 @app.post("/query", response_model=QueryResponse)
-async def query_cyberbot(request: QueryRequest):
+async def query_cyberbot(request: QueryRequest, http_request: Request, session_user_id: Optional[int] = Depends(session_user)):
+    authorize(request.user_id, session_user_id)
     user_id = request.user_id
     question = request.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
     logger.info(f"Received query: {question}")
+    timings = StageTimings()
+    http_request.state.timings = timings
 
-    retrieved_context, generated_answer, rewritten_question = await retrieve_and_answer(user_id, question)
+    retrieved_context, rewritten_question, query_embedding, is_followup = await retrieve_context(user_id, question, timings)
+
+    # Follow-ups depend on chat history, so only standalone questions use the cache
+    # (lexical fast-path retrievals have no embedding to look up)
+    use_cache = config.SEMANTIC_CACHE_ENABLED and not is_followup and query_embedding is not None
+    if use_cache:
+        cached = answer_cache.get(query_embedding)
+        if cached is not None:
+            await record_exchange(user_id, question, cached["generated_answer"])
+            response = QueryResponse(question=question, timings=timings.as_dict(), **cached)
+            await persist_answer(user_id, question, rewritten_question, response.retrieval_context, response.generated_answer,
+                                 response.validation_result, response.confidence_score, response.timings)
+            return response
+
+    precheck = OntologyPrecheck(rewritten_question) if config.PIPELINED_MODE else None
+    generated_answer = await generate_answer(user_id, question, retrieved_context, timings, precheck)
 
     logger.info(f"📝 Validating QA Pair:\nQuestion (validated): {rewritten_question}\nAnswer: {generated_answer}")
 
-    validation_data = await asyncio.to_thread(ontology_validation, rewritten_question, generated_answer, user_id)
+    validation_data = await validate_answer(rewritten_question, generated_answer, user_id, timings, precheck)
     validation_result = validation_data.get("validation_result")
     confidence_score = validation_data.get("confidence_score")
 
     if validation_result == "Not Pass":
-        return QueryResponse(
-            question=question,
-            retrieval_context=retrieved_context,
-            generated_answer="⚠️ This answer could not be validated against the ontology. Please refine your question.",
-            validation_result=validation_result,
-            confidence_score=confidence_score,
-        )
-
-    return QueryResponse(
+        generated_answer = NOT_PASS_MESSAGE
+
+    response = QueryResponse(
         question=question,
         retrieval_context=retrieved_context,
         generated_answer=generated_answer,
         validation_result=validation_result,
         confidence_score=confidence_score,
-    )
\ No newline at end of file
+        timings=timings.as_dict(),
+        precheck=validation_data.get("precheck"),
+    )
+    logger.info(f"⏱️ Stage timings: {response.timings}")
+    await persist_answer(user_id, question, rewritten_question, retrieved_context, generated_answer,
+                         validation_result, confidence_score, response.timings)
+
+    # Validation errors are transient, so never cache them
+    if use_cache and validation_result in ("Pass", "Not Pass"):
+        answer_cache.put(question, query_embedding, response.model_dump(exclude={"question", "timings", "precheck"}))
+
+    return response
+
+
+def ndjson_event(event, **data):
+    return json.dumps({"event": event, **data}) + "\n"
+
+
+async def stream_query_events(user_id, question):
+    """
+    Yields NDJSON events: the retrieval context, answer tokens as they arrive,
+    and the validation verdict as the final event.
+    """
+    timings = StageTimings()
+    retrieved_context, rewritten_question, query_embedding, is_followup = await retrieve_context(user_id, question, timings)
+    yield ndjson_event("context", retrieval_context=retrieved_context, rewritten_question=rewritten_question)
+
+    use_cache = config.SEMANTIC_CACHE_ENABLED and not is_followup and query_embedding is not None
+    if use_cache:
+        cached = answer_cache.get(query_embedding)
+        if cached is not None:
+            await record_exchange(user_id, question, cached["generated_answer"])
+            yield ndjson_event("token", content=cached["generated_answer"])
+            stage_timings = timings.as_dict()
+            await persist_answer(user_id, question, rewritten_question, cached["retrieval_context"], cached["generated_answer"],
+                                 cached["validation_result"], cached["confidence_score"], stage_timings)
+            yield ndjson_event(
+                "validation",
+                validation_result=cached["validation_result"],
+                confidence_score=cached["confidence_score"],
+                generated_answer=cached["generated_answer"],
+                timings=stage_timings,
+            )
+            return
+
+    precheck = OntologyPrecheck(rewritten_question) if config.PIPELINED_MODE else None
+    parts = []
+    precheck_sent = False
+    async for token in stream_answer_tokens(user_id, question, retrieved_context, timings, precheck):
+        parts.append(token)
+        yield ndjson_event("token", content=token)
+
+        # Surface the pre-check as soon as the partial answer is grounded in the question
+        if precheck is not None and not precheck_sent and precheck.grounded:
+            precheck_sent = True
+            yield ndjson_event("precheck", **precheck.result())
+
+    generated_answer = "".join(parts).strip()
+    if not generated_answer:
+        generated_answer = FALLBACK_ANSWER
+        yield ndjson_event("token", content=generated_answer)
+
+    validation_data = await validate_answer(rewritten_question, generated_answer, user_id, timings, precheck)
+    validation_result = validation_data.get("validation_result")
+    confidence_score = validation_data.get("confidence_score")
+
+    if validation_result == "Not Pass":
+        generated_answer = NOT_PASS_MESSAGE
+
+    # Queued before the final event so a client disconnecting right after it cannot skip persistence
+    stage_timings = timings.as_dict()
+    await persist_answer(user_id, question, rewritten_question, retrieved_context, generated_answer,
+                         validation_result, confidence_score, stage_timings)
+    yield ndjson_event(
+        "validation",
+        validation_result=validation_result,
+        confidence_score=confidence_score,
+        generated_answer=generated_answer,
+        timings=stage_timings,
+    )
+
+    if use_cache and validation_result in ("Pass", "Not Pass"):
+        answer_cache.put(question, query_embedding, {
+            "retrieval_context": retrieved_context,
+            "generated_answer": generated_answer,
+            "validation_result": validation_result,
+            "confidence_score": confidence_score,
+        })
+
+
+@app.post("/query/stream")
+async def query_cyberbot_stream(request: QueryRequest, session_user_id: Optional[int] = Depends(session_user)):
+    """
+    Streaming variant of /query using newline-delimited JSON events.
+    """
+    authorize(request.user_id, session_user_id)
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    logger.info(f"Received streaming query: {question}")
+    return StreamingResponse(stream_query_events(request.user_id, question), media_type="application/x-ndjson")
@@ -1,25 +1,17 @@
+import logging
 from fastapi import APIRouter, HTTPException, Depends
-from passlib.context import CryptContext
 from pydantic import BaseModel, model_validator, ValidationError
-import sqlite3
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-from pathlib import Path
+from db import get_session
+from repository import UserRepository
+from security import password_hasher, session_tokens
 
-ROOT_DIR = Path(__file__).resolve().parent
-db_path = ROOT_DIR / "backend" / "data.db"
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# Database connection
-def get_db():
-    db_path = db_path
-    conn = sqlite3.connect(db_path, timeout=10)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 class UserCreate(BaseModel):
     email: str
     username: str
@@ -47,53 +39,41 @@ class UserLogin(BaseModel):
 
 
 @router.post("/register")
-def register(user: UserCreate, db=Depends(get_db)):
+async def register(user: UserCreate, session: AsyncSession = Depends(get_session)):
     """Register a new user with email, username and a hashed password"""
-    email = user.email.strip().lower()
-    username = user.username.strip()
-    hashed_password = pwd_context.hash(user.password)
+    # bcrypt is deliberately slow, so it runs in the hashing process pool
+    hashed_password = await password_hasher.hash(user.password)
 
     try:
-        db.execute("INSERT INTO users (email, username, hashed_password) VALUES (?, ?, ?)", (email, username, hashed_password)),
-        db.commit()
-        user_id = db.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()["id"]
-        return {"message": "User registered successfully", "user_id": user_id}
-    except sqlite3.IntegrityError:
+        user_id = await UserRepository(session).create(user.email, user.username.strip(), hashed_password)
+        return {"message": "User registered successfully", "user_id": user_id, "token": session_tokens.issue(user_id)}
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Email or username already exists")
-    finally:
-        db.close()
     
 @router.post("/login")
-def login(user: UserLogin, db=Depends(get_db)):
+async def login(user: UserLogin, session: AsyncSession = Depends(get_session)):
     """Authenticate user using either case-insensitive email OR case-sensitive username and verify password"""
 
     if bool(user.email) == bool(user.username):  # XOR logic: one must be provided, not both
         raise HTTPException(status_code=400, detail="Provide either email OR username, not both")
 
-    if user.email:  # Case-insensitive email login
-        user_db = db.execute(
-            "SELECT * FROM users WHERE LOWER(email) = ?", 
-            (user.email.strip().lower(),)
-        ).fetchone()
+    users = UserRepository(session)
+    if user.email:  # Case-insensitive email login (indexed normalized column)
+        user_db = await users.by_email(user.email)
     elif user.username:  # Case-sensitive username login
-        user_db = db.execute(
-            "SELECT * FROM users WHERE username = ?", 
-            (user.username.strip(),)
-        ).fetchone()
+        user_db = await users.by_username(user.username.strip())
     else:
         raise HTTPException(status_code=400, detail="Provide either email or username")
 
-    db.close()
-
-    if not user_db or not pwd_context.verify(user.password, user_db["hashed_password"]):
+    if not user_db or not await password_hasher.verify(user.password, user_db["hashed_password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    # ✅ Debugging: Print login response
-    print(f"✅ Debug: User logged in: {dict(user_db)}")
+    logger.debug(f"User logged in: id={user_db['id']} username={user_db['username']}")
 
     return {        
         "message": "Login successful",
         "user_id": user_db["id"],  # Ensure `user_id` is returned
         "email": user_db["email"],
-        "username": user_db["username"]
+        "username": user_db["username"],
+        "token": session_tokens.issue(user_db["id"]),  # send as `Authorization: Bearer <token>`
     }
@@ -0,0 +1,82 @@
+"""
+Compares query encoder backends on kb.csv: single-query encode latency and
+recall@3 against the bge-large QA embeddings the index is built from.
+
+Queries are the held-out kb.csv questions (see encoders.is_holdout), and a hit
+means the question's own QA pair is among the top 3.
+
+    python bench_encoders.py
+    python bench_encoders.py --backends sentence-transformers onnx-int8 --latency-queries 200
+"""
+import csv
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from encoders import create_encoder, is_holdout, ENCODER_BACKENDS
+import config
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+def load_queries(kb_path):
+    with open(kb_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    held_out = [(row_number, row["Question"]) for row_number, row in enumerate(rows) if is_holdout(row["QID"])]
+    return [r for r, _ in held_out], [q for _, q in held_out]
+
+
+def top_k(query_embeddings, document_embeddings, k):
+    scores = query_embeddings @ document_embeddings.T
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+
+
+def measure_latency(encoder, queries):
+    encoder.encode(queries[:1])  # warm-up
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        encoder.encode([query])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), float(np.percentile(latencies, 95))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encode latency and recall@k per query encoder backend")
+    parser.add_argument("--backends", nargs="+", choices=ENCODER_BACKENDS, default=list(ENCODER_BACKENDS))
+    parser.add_argument("--kb", type=Path, default=BACKEND_DIR.parent / "dataset" / "kb" / "kb.csv")
+    parser.add_argument("--embeddings", type=Path, default=BACKEND_DIR / "qa_embeddings.npy")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--latency-queries", type=int, default=100, help="Queries encoded one at a time for latency")
+    args = parser.parse_args()
+
+    documents = np.load(args.embeddings, mmap_mode="r")
+    expected, queries = load_queries(args.kb)
+    expected = np.array(expected)
+    print(f"📊 {len(queries)} held-out questions, {len(documents)} QA embeddings, recall@{args.k}\n")
+    print(f"{'backend':<24}{'p50 ms':>10}{'p95 ms':>10}{'recall':>10}{'overlap':>10}")
+
+    baseline = None
+    for backend in args.backends:
+        try:
+            encoder = create_encoder(
+                backend,
+                onnx_dir=config.ENCODER_ONNX_DIR,
+                projection_path=config.ENCODER_PROJECTION_PATH,
+                small_model=config.ENCODER_SMALL_MODEL,
+            )
+        except (ImportError, OSError) as e:
+            print(f"{backend:<24}skipped: {e}")
+            continue
+
+        p50, p95 = measure_latency(encoder, queries[:args.latency_queries])
+        found = top_k(encoder.encode(queries), documents, args.k)
+        recall = float(np.mean([row in hits for row, hits in zip(expected, found)]))
+
+        # Overlap of the top-k sets with the first backend (normally bge-large)
+        if baseline is None:
+            baseline, overlap = found, 1.0
+        else:
+            overlap = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, baseline)]))
+        print(f"{backend:<24}{p50:>10.2f}{p95:>10.2f}{recall:>10.3f}{overlap:>10.3f}")
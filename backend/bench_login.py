@@ -0,0 +1,95 @@
+"""
+Login-storm benchmark: how many bcrypt verifications per second the backend
+sustains, and what latency a login sees under load.
+
+By default it verifies `--logins` passwords concurrently in-process, first on
+the event loop's thread pool (what /login did before) and then through
+PasswordHasher with 1, 2, 4, ... processes up to `--max-workers`. With `--url`
+it instead fires the logins at a running API (the user must exist):
+
+    python bench_login.py --logins 200
+    python bench_login.py --url http://localhost:8000 --username alice --password secret --concurrency 64
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from security import PasswordHasher, hash_password, verify_password
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(label, elapsed, latencies):
+    print(f"{label:<16}{len(latencies) / elapsed:>12.1f}{statistics.median(latencies) * 1000:>12.0f}"
+          f"{percentile(latencies, 0.95) * 1000:>12.0f}")
+
+
+async def storm(verify, logins, concurrency):
+    """
+    Runs `logins` calls of `verify()` with at most `concurrency` in flight; returns (elapsed, latencies).
+    """
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            await verify()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    return time.perf_counter() - start, latencies
+
+
+async def bench_local(args):
+    hashed = hash_password(args.password)
+    print(f"{'backend':<16}{'logins/s':>12}{'p50 ms':>12}{'p95 ms':>12}")
+
+    loop = asyncio.get_running_loop()
+    elapsed, latencies = await storm(lambda: loop.run_in_executor(None, verify_password, args.password, hashed),
+                                     args.logins, args.concurrency)
+    report("threads", elapsed, latencies)
+
+    workers = 1
+    while True:
+        hasher = PasswordHasher(workers=workers, max_pending=args.concurrency)
+        await hasher.verify(args.password, hashed)  # start the pool outside the timed run
+        elapsed, latencies = await storm(lambda: hasher.verify(args.password, hashed), args.logins, args.concurrency)
+        hasher.close()
+        report(f"processes={workers}", elapsed, latencies)
+        if workers >= args.max_workers:
+            break
+        workers = min(workers * 2, args.max_workers)
+
+
+async def bench_url(args):
+    import aiohttp
+
+    payload = {"username": args.username, "password": args.password}
+    async with aiohttp.ClientSession() as session:
+        async def login():
+            async with session.post(f"{args.url}/login", json=payload) as response:
+                response.raise_for_status()
+                await response.read()
+
+        print(f"{'target':<16}{'logins/s':>12}{'p50 ms':>12}{'p95 ms':>12}")
+        elapsed, latencies = await storm(login, args.logins, args.concurrency)
+        report("api", elapsed, latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bcrypt login throughput benchmark")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--url", help="Benchmark POST /login on a running API instead")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="correct horse battery staple")
+    args = parser.parse_args()
+
+    asyncio.run(bench_url(args) if args.url else bench_local(args))
@@ -0,0 +1,59 @@
+"""
+Measures backend cold-start cost: how long `import api` takes in a fresh
+interpreter, and optionally how long the background warm-up takes after it.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 3 --warm
+    python bench_startup.py --module answer_retriever
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import {module}
+result = {{"import_seconds": time.perf_counter() - start}}
+if {warm}:
+    from resources import resources
+    start = time.perf_counter()
+    resources.warm()
+    result["warm_seconds"] = time.perf_counter() - start
+    result["status"] = resources.status()
+print(json.dumps(result))
+"""
+
+
+def run_once(module, warm):
+    env = {**os.environ, "TOGETHER_API_KEY": os.getenv("TOGETHER_API_KEY", "bench")}
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module, warm=warm)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(label, values):
+    print(f"{label}: median {statistics.median(values):.3f}s, min {min(values):.3f}s, max {max(values):.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time benchmark for the backend")
+    parser.add_argument("--module", default="api", help="Module to import in a fresh interpreter")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm", action="store_true", help="Also time loading the model, index and metadata")
+    args = parser.parse_args()
+
+    results = [run_once(args.module, args.warm) for _ in range(args.runs)]
+
+    summarize(f"import {args.module}", [r["import_seconds"] for r in results])
+    if args.warm:
+        summarize("warm-up", [r["warm_seconds"] for r in results])
+        print(json.dumps(results[-1]["status"], indent=2))
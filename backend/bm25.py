@@ -0,0 +1,151 @@
+import os
+import re
+import logging
+import numpy as np
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Keeps identifiers such as "cve-2021-44228", "x.509" or "tls1.3" intact; their parts are indexed too
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how in is it its of on or that the this to was what when where
+which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(str(text).lower()):
+        if token not in STOPWORDS:
+            tokens.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p not in STOPWORDS and len(p) > 1)
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed corpus, stored as CSR postings arrays.
+
+    Postings for term t are docs[offsets[t]:offsets[t + 1]] with matching term
+    frequencies; document ids are row numbers of the corpus passed to `build`.
+    """
+
+    def __init__(self, vocab, offsets, docs, tfs, doc_lengths, k1=1.2, b=0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        n = len(doc_lengths)
+        df = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avgdl = float(doc_lengths.mean()) if n else 1.0
+        # Per-document part of the BM25 denominator, precomputed once
+        self._norm = (k1 * (1 - b + b * doc_lengths / max(avgdl, 1e-9))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts, **params):
+        postings = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.uint32)
+        for doc, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                postings.setdefault(token, []).append((doc, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for t in terms], out=offsets[1:])
+        docs = np.empty(offsets[-1], dtype=np.uint32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, term in enumerate(terms):
+            entries = np.array(postings[term], dtype=np.int64)
+            docs[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = np.minimum(entries[:, 1], np.iinfo(np.uint16).max)
+
+        return cls({t: i for i, t in enumerate(terms)}, offsets, docs, tfs, doc_lengths, **params)
+
+    def save(self, path):
+        path = Path(path)
+        terms = sorted(self.vocab, key=self.vocab.get)
+        encoded = [t.encode("utf-8") for t in terms]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in encoded], out=term_offsets[1:])
+
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(
+            tmp_path,
+            terms=np.frombuffer(b"".join(encoded), dtype=np.uint8), term_offsets=term_offsets,
+            offsets=self.offsets, docs=self.docs, tfs=self.tfs, doc_lengths=self.doc_lengths,
+            params=np.array([self.k1, self.b], dtype=np.float64),
+        )
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            blob, term_offsets = data["terms"].tobytes(), data["term_offsets"]
+            vocab = {blob[term_offsets[i]:term_offsets[i + 1]].decode("utf-8"): i for i in range(len(term_offsets) - 1)}
+            k1, b = data["params"].tolist()
+            return cls(vocab, data["offsets"], data["docs"], data["tfs"], data["doc_lengths"], k1=k1, b=b)
+
+    def search(self, query, top_k=3):
+        """
+        Returns ([(row, score), ...] best first, confidence). Confidence is the
+        share of the query's IDF mass that the top document matches; terms that
+        are not in the vocabulary count as unmatched at the highest possible IDF.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        terms = [self.vocab[t] for t in tokens if t in self.vocab]
+        if not terms or top_k <= 0:
+            return [], 0.0
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for t in terms:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            docs, tfs = self.docs[start:end], self.tfs[start:end].astype(np.float32)
+            scores[docs] += self.idf[t] * tfs * (self.k1 + 1) / (tfs + self._norm[docs])
+
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        hits = [(int(row), float(scores[row])) for row in best if scores[row] > 0]
+
+        if not hits:
+            return [], 0.0
+        top = hits[0][0]
+        unseen_idf = float(np.log1p((len(self) + 0.5) / 0.5))
+        matched = sum(float(self.idf[t]) for t in terms if self._contains(t, top))
+        total = float(self.idf[terms].sum()) + unseen_idf * (len(tokens) - len(terms))
+        return hits, matched / total
+
+    def _contains(self, term, doc):
+        # Postings are sorted by document id
+        postings = self.docs[self.offsets[term]:self.offsets[term + 1]]
+        i = np.searchsorted(postings, doc)
+        return i < len(postings) and postings[i] == doc
+
+
+if __name__ == "__main__":
+    # Rebuilds qa_bm25.npz from an existing metadata store, without re-running the embedder
+    from metadata_store import MetadataStore
+
+    backend_dir = Path(__file__).resolve().parent
+    store = MetadataStore(backend_dir / "qa_metadata.records")
+    texts = [f"{qa['question']} {qa['answer']}" for qa in (store.get(i, ("question", "answer")) for i in range(len(store)))]
+    index = BM25Index.build(texts)
+    index.save(backend_dir / "qa_bm25.npz")
+    print(f"✅ BM25 index over {len(index)} QA pairs ({len(index.vocab)} terms) saved to qa_bm25.npz")
@@ -0,0 +1,123 @@
+"""
+Calibrates the local ontology validator (ONTOLOGY_LOCAL_* in config.py).
+
+Positives are the ground-truth answers in dataset/kb/kb.csv and the "Pass"
+few-shot examples of the validation prompt. Negatives are the "Not Pass"
+examples, every KB question paired with the answer to an unrelated KB
+question, and off-topic answers that use ontology words in their everyday
+sense. For each setting it reports how many pairs are decided locally and
+how many of those decisions are wrong, then recommends the thresholds that
+decide the most pairs within the error budgets.
+
+    python calibrate_local_validation.py
+    python calibrate_local_validation.py --max-false-pass 0.01 --max-false-fail 0.005
+"""
+import os
+import re
+import csv
+import json
+import random
+import argparse
+from pathlib import Path
+
+os.environ.setdefault("TOGETHER_API_KEY", "calibration")  # importing the validator builds the LLM client
+
+from ontology_graph import OntologyGraph
+from ontology_validator import VALIDATION_PROMPT_PREFIX, local_decision
+
+KB_PATH = Path(__file__).resolve().parent.parent / "dataset" / "kb" / "kb.csv"
+
+# Off-topic answers that happen to use ontology vocabulary in its everyday sense
+OFF_TOPIC_ANSWERS = [
+    "The World Cup uses a group system; each team needs a good tool for attack and defense, and the technique of pressing wins games.",
+    "Paris is the capital of France.",
+    "A good sourdough technique is to let the dough rest overnight; the oven is the most important tool.",
+    "The city's infrastructure includes roads, bridges and a public transport system used by every user.",
+    "Photosynthesis is the process by which plants turn sunlight, water and carbon dioxide into sugar.",
+    "The team changed its attack formation in the second half and the coach used data from the first match.",
+]
+OFF_TOPIC_QUESTIONS = [
+    "Who won the last World Cup?",
+    "What is the capital of France?",
+    "How do I bake sourdough bread?",
+]
+
+
+def few_shot_examples():
+    pattern = r"QUESTION: (.*?)\nANSWER: (.*?)\nEXPECTED VALIDATION RESPONSE:\n(\{.*?\})"
+    for question, answer, response in re.findall(pattern, VALIDATION_PROMPT_PREFIX, re.DOTALL):
+        yield question, answer, json.loads(response)["validation_result"] == "Pass"
+
+
+def labelled_pairs(seed):
+    """
+    Returns [(question, answer, should_pass, source)].
+    """
+    rng = random.Random(seed)
+    with open(KB_PATH, newline="") as f:
+        rows = [row for row in csv.DictReader(f) if row["Question"].strip() and row["Answer"].strip()]
+
+    pairs = [(row["Question"], row["Answer"], True, "kb") for row in rows]
+    pairs += [(q, a, ok, "few-shot") for q, a, ok in few_shot_examples()]
+
+    for row in rows:
+        other = rng.choice(rows)
+        while other["Entity"] == row["Entity"]:
+            other = rng.choice(rows)
+        pairs.append((row["Question"], other["Answer"], False, "mismatched"))
+
+    questions = [row["Question"] for row in rng.sample(rows, 50)] + OFF_TOPIC_QUESTIONS
+    pairs += [(q, a, False, "off-topic") for q in questions for a in OFF_TOPIC_ANSWERS]
+    return pairs
+
+
+def evaluate(scored, pass_score, fail_score, min_evidence):
+    """
+    Returns (share of positives decided locally, share of negatives decided locally,
+    false pass rate over negatives, false fail rate over positives).
+    """
+    counts = {True: [0, 0, 0], False: [0, 0, 0]}  # should_pass -> [pairs, decided, wrong]
+    for grounding, should_pass in scored:
+        decision = local_decision(grounding, pass_score, fail_score, min_evidence)
+        counts[should_pass][0] += 1
+        if decision is not None:
+            counts[should_pass][1] += 1
+            counts[should_pass][2] += (decision == "Pass") != should_pass
+    (positives, positives_decided, false_fail), (negatives, negatives_decided, false_pass) = counts[True], counts[False]
+    return positives_decided / positives, negatives_decided / negatives, false_pass / negatives, false_fail / positives
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the local ontology validation thresholds")
+    parser.add_argument("--max-false-pass", type=float, default=0.01, help="Budget: negatives passed locally / negatives")
+    parser.add_argument("--max-false-fail", type=float, default=0.005, help="Budget: positives failed locally / positives")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    graph = OntologyGraph()
+    pairs = labelled_pairs(args.seed)
+    print(f"{len(pairs)} pairs: " + ", ".join(
+        f"{source} {sum(p[3] == source for p in pairs)}" for source in dict.fromkeys(p[3] for p in pairs)))
+
+    scored = [(graph.grounding(q, a), ok) for q, a, ok, _ in pairs]
+    never = 2.0  # a threshold no score reaches: that decision is never made locally
+    pass_scores = sorted({g["score"] for g, _ in scored if g["score"] > 0}) + [never]
+    fail_settings = [(-1.0, 0)] + [(0.0, n) for n in range(1, 7)]
+
+    results = []
+    print(f"\n{'pass':>6}{'fail':>6}{'min ev':>8}{'KB local':>10}{'neg local':>11}{'false pass':>12}{'false fail':>12}")
+    for pass_score in pass_scores:
+        for fail_score, min_evidence in fail_settings:
+            pos_local, neg_local, false_pass, false_fail = evaluate(scored, pass_score, fail_score, min_evidence)
+            results.append((pos_local, neg_local, pass_score, fail_score, min_evidence, false_pass, false_fail))
+            print(f"{pass_score:>6.2f}{fail_score:>6.1f}{min_evidence:>8}{pos_local:>10.1%}{neg_local:>11.1%}"
+                  f"{false_pass:>12.2%}{false_fail:>12.2%}")
+
+    # Most LLM calls saved on real (KB-like) answers within both error budgets
+    within = [r for r in results if r[5] <= args.max_false_pass and r[6] <= args.max_false_fail]
+    pos_local, neg_local, pass_score, fail_score, min_evidence, false_pass, false_fail = max(within)
+    print(f"\nRecommended (false pass <= {args.max_false_pass:.1%}, false fail <= {args.max_false_fail:.1%}):")
+    print(f"  ONTOLOGY_LOCAL_PASS_SCORE={pass_score}  ONTOLOGY_LOCAL_FAIL_SCORE={fail_score}  "
+          f"ONTOLOGY_LOCAL_FAIL_MIN_EVIDENCE={min_evidence}")
+    print(f"  decides {pos_local:.1%} of KB answers and {neg_local:.1%} of negatives locally; "
+          f"false pass {false_pass:.2%}, false fail {false_fail:.2%}")
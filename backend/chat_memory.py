@@ -0,0 +1,223 @@
+import time
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; good enough for budgeting
+    return max(1, len(text) // 4)
+
+
+class ChatMemory:
+    """
+    Bounded per-user conversation memory persisted to SQLite.
+
+    The model sees a rolling summary of older turns plus the newest turns that
+    fit in `window_tokens`. Once the turns that fell out of the window exceed
+    `summary_trigger_tokens`, they are folded into the summary and deleted.
+    Loaded windows are cached per process with LRU/idle eviction and
+    revalidated against a per-user version counter, so several uvicorn
+    workers can share the same database.
+
+    The public methods are coroutines: every SQLite call runs in a worker
+    thread, so waiting on another worker's write lock never stalls the event loop.
+    """
+
+    def __init__(self, db_path, system_prompt, window_tokens=1500, summary_trigger_tokens=1000,
+                 max_cached_users=1000, idle_seconds=1800, max_window_turns=50):
+        self.system_prompt = system_prompt
+        self.window_tokens = window_tokens
+        self.summary_trigger_tokens = summary_trigger_tokens
+        self.max_cached_users = max_cached_users
+        self.idle_seconds = idle_seconds
+        self.max_window_turns = max_window_turns
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # user_id -> (version, summary, window, last_used)
+        self._compacting = set()
+
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chat_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_chat_turns_user_id ON chat_turns (user_id, id);
+            CREATE TABLE IF NOT EXISTS chat_sessions (
+                user_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                summarized_upto INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+        """)
+
+    def _version(self, user_id):
+        row = self._conn.execute("SELECT version FROM chat_sessions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    def _load(self, user_id):
+        session = self._conn.execute(
+            "SELECT summary, summarized_upto, version FROM chat_sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        summary, summarized_upto, version = session if session else ("", 0, 0)
+
+        rows = self._conn.execute(
+            "SELECT role, content, tokens FROM chat_turns WHERE user_id = ? AND id > ? ORDER BY id DESC LIMIT ?",
+            (user_id, summarized_upto, self.max_window_turns),
+        ).fetchall()
+
+        window, budget = [], self.window_tokens
+        for role, content, tokens in rows:
+            if tokens > budget and window:
+                break
+            window.append({"role": role, "content": content})
+            budget -= tokens
+        window.reverse()
+        return version, summary, window
+
+    def _evict_idle(self, now):
+        while self._cache and len(self._cache) > self.max_cached_users:
+            self._cache.popitem(last=False)
+        for user_id in [u for u, entry in self._cache.items() if now - entry[3] > self.idle_seconds]:
+            del self._cache[user_id]
+
+    def _state(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(user_id)
+            if cached is None or cached[0] != self._version(user_id):
+                version, summary, window = self._load(user_id)
+            else:
+                version, summary, window, _ = cached
+            self._cache[user_id] = (version, summary, window, now)
+            self._cache.move_to_end(user_id)
+            self._evict_idle(now)
+            return summary, window
+
+    async def messages(self, user_id):
+        """
+        Returns the system prompt, the rolling summary (if any) and the token-bounded window.
+        """
+        summary, window = await asyncio.to_thread(self._state, user_id)
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        return messages + list(window)
+
+    async def recent(self, user_id, n):
+        summary, window = await asyncio.to_thread(self._state, user_id)
+        return list(window[-n:])
+
+    async def append(self, user_id, *turns):
+        """
+        Persists (role, content) turns and bumps the user's version.
+        """
+        await asyncio.to_thread(self._append, user_id, turns)
+
+    def _append(self, user_id, turns):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO chat_turns (user_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, role, content, estimate_tokens(content), now) for role, content in turns],
+                )
+                self._conn.execute(
+                    "INSERT INTO chat_sessions (user_id, version, updated_at) VALUES (?, 1, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at",
+                    (user_id, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache.pop(user_id, None)
+
+    def _overflow(self, user_id):
+        """
+        Returns (summary, summarized_upto, turns) that fell out of the window but are not summarized yet.
+        """
+        with self._lock:
+            return self._read_overflow(user_id)
+
+    def _read_overflow(self, user_id):
+        session = self._conn.execute(
+            "SELECT summary, summarized_upto FROM chat_sessions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not session:
+            return "", 0, []
+        summary, summarized_upto = session
+
+        rows = self._conn.execute(
+            "SELECT id, role, content, tokens FROM chat_turns WHERE user_id = ? AND id > ? ORDER BY id DESC",
+            (user_id, summarized_upto),
+        ).fetchall()
+
+        budget, kept = self.window_tokens, 0
+        for _, _, _, tokens in rows:
+            if (tokens > budget and kept) or kept >= self.max_window_turns:
+                break
+            budget -= tokens
+            kept += 1
+
+        overflow = list(reversed(rows[kept:]))
+        return summary, summarized_upto, overflow
+
+    async def compact(self, user_id, summarize):
+        """
+        Folds turns that fell out of the window into the rolling summary.
+        `summarize(previous_summary, turns)` is an async callable returning the new summary.
+        """
+        if user_id in self._compacting:
+            return
+        self._compacting.add(user_id)
+        try:
+            summary, summarized_upto, overflow = await asyncio.to_thread(self._overflow, user_id)
+            if sum(t[3] for t in overflow) < self.summary_trigger_tokens:
+                return
+
+            turns = [{"role": role, "content": content} for _, role, content, _ in overflow]
+            new_summary = await summarize(summary, turns)
+            if not new_summary:
+                return
+
+            await asyncio.to_thread(self._apply_summary, user_id, new_summary, summarized_upto, overflow[-1][0])
+            logger.info(f"🧠 Summarized {len(turns)} older turns for user {user_id}")
+        except Exception:
+            logger.exception(f"❌ Failed to compact chat memory for user {user_id}")
+        finally:
+            self._compacting.discard(user_id)
+
+    def _apply_summary(self, user_id, new_summary, summarized_upto, last_id):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another worker may have compacted meanwhile; only apply on top of what we read
+                updated = self._conn.execute(
+                    "UPDATE chat_sessions SET summary = ?, summarized_upto = ?, version = version + 1, updated_at = ? "
+                    "WHERE user_id = ? AND summarized_upto = ?",
+                    (new_summary, last_id, time.time(), user_id, summarized_upto),
+                ).rowcount
+                if updated:
+                    self._conn.execute("DELETE FROM chat_turns WHERE user_id = ? AND id <= ?", (user_id, last_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._cache.pop(user_id, None)
+
+    def close(self):
+        self._conn.close()
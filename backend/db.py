@@ -1,10 +1,78 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from config import DATABASE_URL
+import logging
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import DeclarativeBase
+from config import DATABASE_URL, DB_POOL_SIZE
 
+logger = logging.getLogger(__name__)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite pragmas for every pooled connection: WAL lets readers and the writer run concurrently
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=10000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_SIZE,
+    pool_pre_ping=True,
+)
 
-Base = declarative_base()
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+async def get_session():
+    """
+    FastAPI dependency: one pooled session per request.
+    """
+    async with SessionLocal() as session:
+        yield session
+
+
+def _upgrade(connection):
+    """
+    Brings tables created by older versions up to the models: adds missing
+    columns and indexes. New databases get everything from create_all.
+    """
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {ddl}"))
+                logger.info(f"✅ Added column {table.name}.{column.name}")
+
+        if table.name == "users":
+            connection.execute(text("UPDATE users SET email_normalized = LOWER(TRIM(email)) WHERE email_normalized IS NULL"))
+
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                logger.info(f"✅ Created index {index.name}")
+
+
+async def init_db():
+    import models  # noqa: F401  (registers the tables on Base.metadata)
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.run_sync(_upgrade)
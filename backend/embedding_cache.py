@@ -0,0 +1,159 @@
+import re
+import time
+import sqlite3
+import logging
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """
+    Cache key for a query: NFKC, case-folded, whitespace collapsed.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", str(text))).strip().casefold()
+
+
+class EmbeddingCache:
+    """
+    Query embedding cache keyed by normalized text.
+
+    An in-process LRU of `max_entries` float32 vectors sits in front of an
+    optional SQLite table at `db_path`, which survives restarts and is shared
+    by all uvicorn workers. Entries are keyed by the identity of the encoder
+    that produced them (see encoders.py: name, dimension and model file hash),
+    so workers running different encoders share the table without seeing each
+    other's vectors; rows of encoders no longer in use age out in _prune.
+    """
+
+    def __init__(self, max_entries=4096, db_path=None, max_disk_entries=100_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized text -> vector
+        self._encoder = None
+        self._puts = 0
+
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    encoder TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (encoder, text)
+                )
+            """)
+
+    def _check_encoder(self, encoder):
+        if encoder == self._encoder:
+            return
+        if self._encoder is not None:
+            logger.info(f"♻️ Query encoder changed to {encoder}, clearing the in-memory embedding cache.")
+        self._entries.clear()
+        self._encoder = encoder
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, keys):
+        if self._conn is None or not keys:
+            return {}
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT text, vector FROM query_embeddings WHERE encoder = ? AND text IN ({','.join('?' * len(chunk))})",
+                (self._encoder, *chunk),
+            ).fetchall()
+            found.update((text, np.frombuffer(vector, dtype=np.float32)) for text, vector in rows)
+        return found
+
+    def get_many(self, encoder, texts):
+        """
+        Returns one cached vector per text, or None where there is none.
+        """
+        keys = [normalize_text(text) for text in texts]
+        with self._lock:
+            self._check_encoder(encoder)
+            vectors = [self._entries.get(key) for key in keys]
+            for key, vector in zip(keys, vectors):
+                if vector is not None:
+                    self._entries.move_to_end(key)
+
+            on_disk = self._load_from_disk(list({key for key, vector in zip(keys, vectors) if vector is None}))
+            for i, key in enumerate(keys):
+                if vectors[i] is not None:
+                    self.hits += 1
+                    result = "hit"
+                elif key in on_disk:
+                    vectors[i] = on_disk[key]
+                    self._remember(key, vectors[i])
+                    self.disk_hits += 1
+                    result = "disk_hit"
+                else:
+                    self.misses += 1
+                    result = "miss"
+                CACHE_REQUESTS.labels(cache="embedding", result=result).inc()
+            return vectors
+
+    def put_many(self, encoder, texts, vectors):
+        keys = [normalize_text(text) for text in texts]
+        vectors = [np.array(vector, dtype=np.float32) for vector in vectors]
+        with self._lock:
+            self._check_encoder(encoder)
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+            if self._conn is None:
+                return
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (encoder, text, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(encoder, key, vector.tobytes(), now) for key, vector in zip(keys, vectors)],
+            )
+            self._puts += len(keys)
+            if self._puts >= 1000:
+                self._puts = 0
+                self._prune()
+
+    def _prune(self):
+        # Keeps the newest `max_disk_entries` rows
+        self._conn.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN (SELECT rowid FROM query_embeddings "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,),
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM query_embeddings")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "encoder": self._encoder,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,197 @@
+"""
+Query encoder backends. All of them return L2-normalized float32 vectors in
+the embedding space of the QA index (BAAI/bge-large-en-v1.5, 1024-d).
+
+    sentence-transformers   bge-large through sentence-transformers/torch (default)
+    onnx-int8               bge-large exported to ONNX, dynamically quantized to int8, run by ONNX Runtime
+    projected               bge-small query encoder + a linear map into the bge-large space
+
+The ONNX model and the projection are produced once with:
+
+    python encoders.py export-onnx --output onnx-bge-large
+    python encoders.py fit-projection --output encoder_projection.npy
+"""
+import zlib
+import hashlib
+import logging
+import argparse
+import numpy as np
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = Path(__file__).resolve().parent
+LARGE_MODEL_NAME = 'BAAI/bge-large-en-v1.5'
+SMALL_MODEL_NAME = 'BAAI/bge-small-en-v1.5'
+ENCODER_BACKENDS = ("sentence-transformers", "onnx-int8", "projected")
+
+
+def is_holdout(qid):
+    """
+    Deterministic 20% of kb.csv rows reserved for evaluation; fit-projection never trains on them.
+    """
+    return zlib.crc32(str(qid).encode("utf-8")) % 5 == 0
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def fingerprint(*paths):
+    """
+    Short content hash of the given files, so a re-exported model or refitted
+    projection gets a new identity even when its path is unchanged.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+# Every encoder has a display `name` and an `identity` (name, output dimension and, for
+# file-based backends, a content hash) that cached query vectors are keyed by
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name=LARGE_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.name = f"sentence-transformers:{model_name}"
+        self.identity = f"{self.name}:{self.model.get_sentence_embedding_dimension()}d"
+
+    def encode(self, texts):
+        texts = list(texts)
+        return self.model.encode(texts, batch_size=max(len(texts), 1), normalize_embeddings=True).astype(np.float32)
+
+
+class OnnxEncoder:
+    """
+    bge-large exported by `export_onnx`: CLS pooling over the last hidden state, as in sentence-transformers.
+    """
+
+    def __init__(self, model_dir, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx-int8 encoder needs onnxruntime: pip install onnxruntime") from e
+        from transformers import AutoTokenizer
+
+        model_dir = Path(model_dir)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(model_dir / "model.int8.onnx"), options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.name = f"onnx-int8:{model_dir.name}"
+        dimension = self.session.get_outputs()[0].shape[-1]
+        self.identity = f"{self.name}:{dimension}d:{fingerprint(model_dir / 'model.int8.onnx')}"
+
+    def encode(self, texts):
+        inputs = self.tokenizer(list(texts), padding=True, truncation=True, max_length=512, return_tensors="np")
+        feeds = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        last_hidden_state = self.session.run(None, feeds)[0]
+        return normalize(last_hidden_state[:, 0])
+
+
+class ProjectedEncoder:
+    """
+    Asymmetric setup: queries go through bge-small (384-d) and a learned linear
+    map into the bge-large space, so the index keeps its bge-large document embeddings.
+    """
+
+    def __init__(self, projection_path, model_name=SMALL_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.projection = np.load(projection_path).astype(np.float32)
+        self.name = f"projected:{model_name}:{Path(projection_path).name}"
+        self.identity = f"{self.name}:{self.projection.shape[1]}d:{fingerprint(projection_path)}"
+
+    def encode(self, texts):
+        texts = list(texts)
+        small = self.model.encode(texts, batch_size=max(len(texts), 1), normalize_embeddings=True)
+        return normalize(small @ self.projection)
+
+
+def create_encoder(backend, onnx_dir=None, projection_path=None, small_model=SMALL_MODEL_NAME):
+    if backend == "sentence-transformers":
+        return SentenceTransformerEncoder()
+    if backend == "onnx-int8":
+        return OnnxEncoder(onnx_dir)
+    if backend == "projected":
+        return ProjectedEncoder(projection_path, small_model)
+    raise ValueError(f"❌ Unknown encoder backend: {backend} (expected one of {', '.join(ENCODER_BACKENDS)})")
+
+
+def export_onnx(output_dir, model_name=LARGE_MODEL_NAME):
+    """
+    Exports the transformer to ONNX and writes a dynamically int8-quantized copy next to it.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = output_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), str(fp32_path),
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=17,
+        )
+    quantize_dynamic(str(fp32_path), str(output_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    tokenizer.save_pretrained(output_dir)
+    return output_dir
+
+
+def fit_projection(texts, small_model=SMALL_MODEL_NAME, large_model=LARGE_MODEL_NAME, ridge=1e-2):
+    """
+    Least-squares (ridge) map W from bge-small to bge-large embeddings of the same texts.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    small = SentenceTransformer(small_model).encode(texts, batch_size=64, normalize_embeddings=True)
+    large = SentenceTransformer(large_model).encode(texts, batch_size=64, normalize_embeddings=True)
+    gram = small.T @ small + ridge * np.eye(small.shape[1], dtype=np.float32)
+    return np.linalg.solve(gram, small.T @ large).astype(np.float32)
+
+
+if __name__ == "__main__":
+    import csv
+
+    parser = argparse.ArgumentParser(description="Prepare alternative query encoders")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export-onnx", help="Export bge-large to ONNX and quantize it to int8")
+    export.add_argument("--output", type=Path, default=BACKEND_DIR / "onnx-bge-large")
+
+    fit = commands.add_parser("fit-projection", help="Fit the bge-small -> bge-large projection on kb.csv questions")
+    fit.add_argument("--kb", type=Path, default=BACKEND_DIR.parent / "dataset" / "kb" / "kb.csv")
+    fit.add_argument("--output", type=Path, default=BACKEND_DIR / "encoder_projection.npy")
+    fit.add_argument("--small-model", default=SMALL_MODEL_NAME)
+    fit.add_argument("--ridge", type=float, default=1e-2)
+    args = parser.parse_args()
+
+    if args.command == "export-onnx":
+        print(f"✅ ONNX int8 encoder written to {export_onnx(args.output)}")
+    else:
+        with open(args.kb, newline="") as f:
+            # Queries look like KB questions, so fit on those (and the answers, for coverage)
+            rows = [row for row in csv.DictReader(f) if not is_holdout(row["QID"])]
+        texts = [text for row in rows for text in (row["Question"], row["Answer"])]
+        projection = fit_projection(texts, args.small_model, ridge=args.ridge)
+        np.save(args.output, projection)
+        print(f"✅ Projection {projection.shape} saved to {args.output}")
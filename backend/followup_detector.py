@@ -39,10 +39,13 @@ STARTER_PHRASES = [
     "is that right", "am i correct", "so you mean"
 ]
 
-def is_followup_question(question: str) -> Tuple[bool, str]:
+def classify_followup(question: str) -> Tuple[str, str]:
     """
-    Classifies whether a question is likely a follow-up.
-    Returns (True/False, reason_string)
+    Grades how likely a question is a follow-up.
+    Returns ("strong" | "borderline" | "none", reason_string)
+
+    Borderline verdicts come from weak signals (generic keywords, short length)
+    that also fire on many standalone questions.
     """
     question = question.strip().lower()
     words = set(question.split())
@@ -50,35 +53,43 @@ def is_followup_question(question: str) -> Tuple[bool, str]:
     # Rule 1: Exact phrase match (starter phrases)
     for phrase in STARTER_PHRASES:
         if phrase in question:
-            return True, f"Matched starter phrase: '{phrase}'"
+            return "strong", f"Matched starter phrase: '{phrase}'"
 
     # Rule 2: Presence of vague/interactive keywords
     keyword_matches = words.intersection(FOLLOWUP_KEYWORDS)
     if keyword_matches:
-        return True, f"Matched follow-up keywords: {', '.join(keyword_matches)}"
+        return "borderline", f"Matched follow-up keywords: {', '.join(keyword_matches)}"
 
     # Rule 3: Pronouns used in short question
     if len(words) <= 6 and words.intersection(PRONOUNS):
-        return True, f"Short question with pronoun(s): {', '.join(words.intersection(PRONOUNS))}"
+        return "strong", f"Short question with pronoun(s): {', '.join(words.intersection(PRONOUNS))}"
 
     # Rule 4: Short ambiguous questions
     if len(words) <= 6:
-        return True, "Question is very short and likely ambiguous"
+        return "borderline", "Question is very short and likely ambiguous"
 
     # Rule 5: Starts with discourse markers
     if re.match(r"^(so|well|then|also|but|okay)\\b", question):
-        return True, "Starts with discourse marker"
+        return "strong", "Starts with discourse marker"
 
     # Rule 6: Referential phrases
     for phrase in REFERENTIAL_PHRASES:
         if phrase in question:
-            return True, f"Matched referential phrase: '{phrase}'"
+            return "strong", f"Matched referential phrase: '{phrase}'"
 
     #  Rule 7: Context-dependent starters
     if question.startswith("is there a way") or question.startswith("what kind of"):
-        return True, "Generic follow-up phrasing detected"
+        return "borderline", "Generic follow-up phrasing detected"
+
+    return "none", "No follow-up indicators detected"
 
-    return False, "No follow-up indicators detected"
+def is_followup_question(question: str) -> Tuple[bool, str]:
+    """
+    Classifies whether a question is likely a follow-up.
+    Returns (True/False, reason_string)
+    """
+    strength, reason = classify_followup(question)
+    return strength != "none", reason
 
 
 # Example usage / test block
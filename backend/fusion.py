@@ -0,0 +1,31 @@
+from chat_memory import estimate_tokens
+
+
+def reciprocal_rank_fusion(rankings, k=60, weights=None):
+    """
+    Merges ranked lists of hashable hits: score(hit) = sum of weight / (k + rank).
+    Returns the hits ordered by fused score; ties keep first-seen order.
+    """
+    scores = {}
+    for i, ranking in enumerate(rankings):
+        weight = weights[i] if weights else 1.0
+        for rank, hit in enumerate(ranking, start=1):
+            scores[hit] = scores.get(hit, 0.0) + weight / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def fit_token_budget(texts, budget):
+    """
+    Keeps texts in order until the token budget is spent. The first text is
+    truncated rather than dropped, so the context is never empty.
+    """
+    kept, remaining = [], budget
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if not kept:
+                kept.append(text[:remaining * 4])
+            break
+        kept.append(text)
+        remaining -= tokens
+    return kept
@@ -0,0 +1,440 @@
+import os
+import json
+import time
+import fcntl
+import asyncio
+import logging
+import threading
+from pathlib import Path
+from sqlalchemy.exc import IntegrityError
+from db import SessionLocal
+from repository import QARepository
+from metrics import HISTORY_ROWS, HISTORY_BATCH_SIZE
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """
+    Append-only, per-process journal of history rows.
+
+    Rows go to segments of up to `segment_rows` lines named
+    `<pid>.<time_ns>.ndjson` and are identified by (segment, line). Committed
+    lines are listed in `<segment>.ack`, and a segment is deleted together with
+    its ack file once every line in it is acknowledged. Each process holds a
+    flock on `<pid>.lock` while it runs, which is how recover() tells the
+    segments of stopped processes from those of live ones.
+
+    Methods block on disk I/O and are thread-safe; HistoryWriter calls them
+    through asyncio.to_thread.
+    """
+
+    def __init__(self, directory, segment_rows=1000, fsync=False):
+        self.directory = Path(directory)
+        self.segment_rows = segment_rows
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._segment = None
+        self._segment_file = None
+        self._segment_rows = 0
+        self._outstanding = {}  # segment -> lines not yet acknowledged
+
+    def open(self):
+        with self._lock:
+            self._open()
+
+    def _open(self):
+        if self._lock_fd is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock_fd = os.open(self.directory / f"{os.getpid()}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:  # another journal in this process already holds it
+            pass
+
+    def append(self, rows):
+        """
+        Appends rows with one flush (and fsync); returns their (segment, line) positions.
+        """
+        with self._lock:
+            self._open()
+            positions = []
+            for row in rows:
+                if self._segment_file is None or self._segment_rows >= self.segment_rows:
+                    self._rotate()
+                self._segment_file.write(json.dumps(row) + "\n")
+                positions.append((self._segment, self._segment_rows))
+                self._segment_rows += 1
+                self._outstanding[self._segment] += 1
+            self._sync()
+            return positions
+
+    def _sync(self):
+        if self._segment_file is not None:
+            self._segment_file.flush()
+            if self.fsync:
+                os.fsync(self._segment_file.fileno())
+
+    def _rotate(self):
+        if self._segment_file is not None:
+            self._sync()
+            self._segment_file.close()
+            if not self._outstanding[self._segment]:
+                self._remove(self._segment)
+        self._segment = self.directory / f"{os.getpid()}.{time.time_ns()}.ndjson"
+        self._segment_file = open(self._segment, "a")
+        self._segment_rows = 0
+        self._outstanding[self._segment] = 0
+
+    def ack(self, positions):
+        """
+        Records rows as committed or rejected, so they are never replayed.
+        """
+        lines = {}
+        for segment, line in positions:
+            lines.setdefault(segment, []).append(line)
+        with self._lock:
+            for segment, acked in lines.items():
+                if segment not in self._outstanding:  # closed meanwhile; replayed from the file instead
+                    continue
+                self._outstanding[segment] -= len(acked)
+                if self._outstanding[segment] > 0:
+                    with open(_ack_path(segment), "a") as f:
+                        f.write(",".join(map(str, acked)) + "\n")
+                    continue
+                if segment == self._segment:
+                    # Idle: close the current segment rather than keep an empty file around
+                    self._segment_file.close()
+                    self._segment = self._segment_file = None
+                self._remove(segment)
+
+    def _remove(self, segment):
+        self._outstanding.pop(segment, None)
+        segment.unlink(missing_ok=True)
+        _ack_path(segment).unlink(missing_ok=True)
+
+    def close(self):
+        """
+        Closes the current segment; segments with unacknowledged rows stay for recover().
+        """
+        with self._lock:
+            if self._segment_file is not None:
+                self._sync()
+                self._segment_file.close()
+                if not self._outstanding[self._segment]:
+                    self._remove(self._segment)
+            self._segment = self._segment_file = None
+            self._outstanding = {}
+            if self._lock_fd is not None:
+                (self.directory / f"{os.getpid()}.lock").unlink(missing_ok=True)
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def recover(self):
+        """
+        Moves the unacknowledged rows of stopped processes (including an earlier
+        process with our pid) into this journal; returns [(position, row)].
+        """
+        self.open()
+        owners = {segment.name.split(".")[0] for segment in self.directory.glob("*.ndjson")}
+        recovered = []
+        for owner in sorted(owners):
+            lock_fd = None
+            if owner != str(os.getpid()):
+                lock_fd = os.open(self.directory / f"{owner}.lock", os.O_CREAT | os.O_RDWR, 0o600)
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:  # still running
+                    os.close(lock_fd)
+                    continue
+            try:
+                # Listed again under the lock: another worker may have recovered them in the meantime
+                for segment in sorted(self.directory.glob(f"{owner}.*.ndjson")):
+                    with self._lock:
+                        if segment in self._outstanding:  # our own
+                            continue
+                    rows = _unacknowledged(segment)
+                    if rows is None:
+                        continue
+                    recovered.extend(zip(self.append(rows), rows))
+                    # Only removed once its rows are journaled again here
+                    segment.unlink(missing_ok=True)
+                    _ack_path(segment).unlink(missing_ok=True)
+                    logger.info(f"♻️ Replaying {len(rows)} journaled QA pairs from {segment.name}")
+            finally:
+                if lock_fd is not None:
+                    (self.directory / f"{owner}.lock").unlink(missing_ok=True)
+                    os.close(lock_fd)
+        return recovered
+
+
+def _ack_path(segment):
+    return segment.with_name(segment.name + ".ack")
+
+
+def _unacknowledged(segment):
+    """
+    Rows of a segment that were never acknowledged, or None if it no longer exists.
+    """
+    acked = set()
+    try:
+        with open(_ack_path(segment)) as f:
+            for line in f:
+                if line.endswith("\n"):  # an unterminated line may be cut short
+                    acked.update(int(n) for n in line.split(","))
+    except FileNotFoundError:
+        pass
+
+    rows = []
+    try:
+        with open(segment) as f:
+            for number, line in enumerate(f):
+                if number in acked:
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:  # a write cut short by a crash
+                    logger.warning(f"⚠️ Skipping a truncated line in {segment}")
+    except FileNotFoundError:
+        return None
+    return rows
+
+
+class HistoryWriter:
+    """
+    Write-behind persistence for answered questions.
+
+    `/query` journals a row, enqueues it and returns; a background task
+    inserts the queue in batches of up to `batch_size` rows, or whatever
+    arrived within `max_wait_ms`, one transaction per batch.
+
+    Delivery is at least once when `journal_dir` is set. submit() returns once
+    the row is in the Journal (flushed to the OS; also fsynced with `fsync`).
+    Rows submitted while a journal write is in progress are written together
+    in the next one, off the event loop. Committed and rejected rows are
+    acknowledged in the journal, and rows that were never acknowledged (the
+    worker crashed, was killed, fell behind with a full queue or shut down with
+    the database unreachable) are replayed by the next worker to start. A row
+    is written twice only if the process dies between a commit and its
+    acknowledgement, or a commit succeeded but was reported as failed. Rows the
+    database rejects outright (e.g. an unknown user_id) are dropped. Without a
+    journal, rows only live in memory until written, so a crash loses them.
+    """
+
+    def __init__(self, batch_size=100, max_wait_ms=200, max_queue=10000, journal_dir=None, max_retries=5,
+                 segment_rows=1000, fsync=False):
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.journal = Journal(journal_dir, segment_rows, fsync) if journal_dir else None
+        self.max_retries = max_retries
+        self._queue = None
+        self._worker = None
+        self._pending = []  # (position, row) pairs of the batch currently being written
+        self._closing = False
+        self._unjournaled = []  # (row, future) waiting for the next journal write
+        self._journal_task = None
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running event loop, so start them lazily
+        if self._worker is None or self._worker.done():
+            if self._queue is None:
+                self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def start(self):
+        self._ensure_worker()
+        if self.journal is not None:
+            for item in await asyncio.to_thread(self.journal.recover):
+                await self._queue.put(item)
+
+    async def submit(self, row):
+        """
+        Journals and queues a row of qa_pairs column values. Only waits for the
+        journal write: if the queue is full (the database is down or far
+        behind), the row is kept in the journal until the next start.
+        """
+        self._ensure_worker()
+        if self.journal is None:
+            self._enqueue([(None, row)])
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._unjournaled.append((row, future))
+        if self._journal_task is None or self._journal_task.done():
+            self._journal_task = asyncio.get_running_loop().create_task(self._write_journal())
+        # Shielded: the row is queued by _write_journal even if the request goes away
+        await asyncio.shield(future)
+
+    async def _write_journal(self):
+        while self._unjournaled:
+            waiting, self._unjournaled = self._unjournaled, []
+            rows = [row for row, _ in waiting]
+            try:
+                positions = await asyncio.to_thread(self.journal.append, rows)
+            except Exception:
+                # Better to keep the rows in memory than to fail the request
+                logger.exception(f"❌ Could not journal {len(rows)} QA pairs; they are lost if the process dies")
+                positions = [None] * len(rows)
+            self._enqueue(list(zip(positions, rows)))
+            for _, future in waiting:
+                if not future.done():
+                    future.set_result(None)
+
+    def _enqueue(self, items):
+        deferred = 0
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except asyncio.QueueFull:
+                deferred += 1
+        if deferred:
+            self._defer(deferred)
+
+    async def _collect(self):
+        # Rows go straight into _pending so that close() still sees them if the worker is cancelled here
+        batch = self._pending
+        deadline = None
+
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                item = await self._queue.get()
+                deadline = asyncio.get_running_loop().time() + self.max_wait
+            else:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:  # shutdown sentinel from close()
+                self._closing = True
+                break
+            batch.append(item)
+
+    async def _write(self, rows):
+        """
+        Inserts rows in one transaction; returns how many were written.
+        """
+        async with SessionLocal() as session:
+            repository = QARepository(session)
+            try:
+                await repository.add_many(rows)
+                return len(rows)
+            except IntegrityError:
+                pass
+
+            # One bad row must not block the rest: insert individually and drop rejects
+            written = 0
+            for row in rows:
+                try:
+                    await repository.add_many([row])
+                    written += 1
+                except IntegrityError as e:
+                    HISTORY_ROWS.labels(outcome="rejected").inc()
+                    logger.error(f"❌ Dropping QA pair the database rejected (user_id={row.get('user_id')}): {e.orig}")
+            return written
+
+    async def _write_with_retries(self, rows, retries):
+        delay = 0.5
+        for attempt in range(retries + 1):
+            try:
+                HISTORY_ROWS.labels(outcome="written").inc(await self._write(rows))
+                return True
+            except Exception:
+                if attempt == retries:
+                    break
+                HISTORY_ROWS.labels(outcome="retried").inc(len(rows))
+                logger.exception(f"⚠️ Writing {len(rows)} QA pairs failed, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+        return False
+
+    async def _run(self):
+        while not (self._closing and self._queue.empty()):
+            await self._collect()
+            if not self._pending:
+                continue
+            HISTORY_BATCH_SIZE.observe(len(self._pending))
+            rows = [row for _, row in self._pending]
+            # Keep retrying while the service runs; once shutting down, give up and leave the rows journaled
+            while not await self._write_with_retries(rows, 2 if self._closing else self.max_retries):
+                if self._closing:
+                    self._defer(len(self._pending) + len(self._drain()))
+                    self._pending = []
+                    return
+            await self._acknowledge(self._pending)
+            self._pending = []
+
+    async def _acknowledge(self, items):
+        positions = [position for position, _ in items if position is not None]
+        if self.journal is None or not positions:
+            return
+        try:
+            await asyncio.to_thread(self.journal.ack, positions)
+        except Exception:
+            logger.exception(f"⚠️ Could not acknowledge {len(positions)} QA pairs; they will be written again on the next start")
+
+    def _drain(self):
+        items = []
+        while self._queue is not None and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                items.append(item)
+        return items
+
+    async def close(self, timeout=10.0):
+        """
+        Lets the worker write everything still queued; whatever it cannot write
+        within `timeout` seconds stays in the journal for the next start.
+        """
+        if self._journal_task is not None:
+            await self._journal_task
+            self._journal_task = None
+        if self._worker is None or self._worker.done():
+            left = len(self._pending) + len(self._drain())
+        else:
+            self._closing = True
+            # Wakes the worker if it is waiting for rows; if the queue is full it drains before exiting anyway
+            try:
+                self._queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+                left = 0
+            except asyncio.TimeoutError:
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+                left = len(self._pending) + len(self._drain())
+        self._worker = None
+        self._pending = []
+        self._closing = False
+        if left:
+            self._defer(left)
+        if self.journal is not None:
+            await asyncio.to_thread(self.journal.close)
+
+    def _defer(self, count):
+        if self.journal is None:
+            HISTORY_ROWS.labels(outcome="lost").inc(count)
+            logger.error(f"❌ Could not persist {count} QA pairs and no journal is configured")
+            return
+        HISTORY_ROWS.labels(outcome="deferred").inc(count)
+        logger.warning(f"⚠️ Left {count} unwritten QA pairs in {self.journal.directory}; they are retried on the next start")
+
+
+# Shared writer used by the API
+history_writer = HistoryWriter(
+    batch_size=config.HISTORY_WRITE_BATCH_SIZE,
+    max_wait_ms=config.HISTORY_WRITE_MAX_WAIT_MS,
+    max_queue=config.HISTORY_QUEUE_SIZE,
+    journal_dir=config.HISTORY_JOURNAL_DIR or None,
+    fsync=config.HISTORY_JOURNAL_FSYNC,
+)
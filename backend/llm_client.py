@@ -0,0 +1,224 @@
+import json
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+from types import SimpleNamespace
+from metrics import LLM_REQUESTS, LLM_DURATION, LLM_TOKENS, LLM_IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMClientError(Exception):
+    """Raised when a chat-completions call fails after all retries."""
+
+
+class RetryableError(LLMClientError):
+    pass
+
+
+def to_namespace(data):
+    """
+    Converts a JSON response into attribute-style objects, e.g. response.choices[0].message.content
+    """
+    if isinstance(data, dict):
+        return SimpleNamespace(**{k: to_namespace(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return [to_namespace(v) for v in data]
+    return data
+
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter: `rate` requests per second with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncLLMClient:
+    """
+    Async client for an OpenAI-compatible chat-completions API (Together AI).
+
+    All calls share one pooled HTTP session and go through a per-process
+    concurrency semaphore and a token-bucket rate limiter. Failed calls are
+    retried with jittered exponential backoff, within a per-call deadline.
+    """
+
+    def __init__(self, base_url, api_key, max_concurrency=16, requests_per_second=10.0, burst=20,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0, timeout=60.0, pool_size=32):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._bucket = TokenBucket(requests_per_second, burst)
+        self._session = None
+
+    def _get_session(self):
+        # Created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            )
+        return self._session
+
+    def _backoff(self, attempt):
+        # Full jitter: uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _post(self, payload, remaining):
+        session = self._get_session()
+        return await session.post(
+            f"{self.base_url}/chat/completions",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=remaining),
+        )
+
+    @staticmethod
+    async def _check_status(response):
+        if response.status < 400:
+            return
+        body = await response.text()
+        response.release()
+        if response.status in RETRYABLE_STATUS:
+            raise RetryableError(f"HTTP {response.status}: {body[:200]}")
+        raise LLMClientError(f"HTTP {response.status}: {body[:200]}")
+
+    async def _with_retries(self, call, deadline, limited=True):
+        """
+        Runs `call(remaining_seconds)` until it succeeds, retrying transient failures.
+        With `limited`, every attempt goes through the rate limiter and the semaphore.
+        """
+        attempt = 0
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMClientError("Deadline exceeded before the call could complete")
+
+            try:
+                if not limited:
+                    return await asyncio.wait_for(call(remaining), remaining)
+                await self._bucket.acquire()
+                async with self._semaphore:
+                    return await asyncio.wait_for(call(remaining), remaining)
+            except (RetryableError, aiohttp.ClientConnectionError, aiohttp.ServerTimeoutError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise LLMClientError(f"Chat completion failed after {attempt + 1} attempts: {e}") from e
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise LLMClientError(f"Deadline exceeded while retrying: {e}") from e
+                logger.warning(f"⚠️ LLM call failed ({e}), retrying in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _record_usage(call, usage):
+        if usage:
+            LLM_TOKENS.labels(call=call, kind="prompt").inc(usage.get("prompt_tokens") or 0)
+            LLM_TOKENS.labels(call=call, kind="completion").inc(usage.get("completion_tokens") or 0)
+
+    async def chat(self, model, messages, timeout=None, call="chat", **params):
+        """
+        Returns the completion as attribute-style objects, e.g. response.choices[0].message.content
+        `call` names the purpose of the request in metrics (answer, rewrite, validation, ...).
+        """
+        payload = {"model": model, "messages": messages, **{k: v for k, v in params.items() if v is not None}}
+
+        async def attempt(remaining):
+            response = await self._post(payload, remaining)
+            await self._check_status(response)
+            async with response:
+                return await response.json()
+
+        outcome = "error"
+        with LLM_IN_FLIGHT.track_inprogress(), LLM_DURATION.labels(call=call).time():
+            try:
+                data = await self._with_retries(attempt, time.monotonic() + (timeout or self.timeout))
+                outcome = "ok"
+            finally:
+                LLM_REQUESTS.labels(call=call, outcome=outcome).inc()
+
+        self._record_usage(call, data.get("usage"))
+        return to_namespace(data)
+
+    async def stream_chat(self, model, messages, timeout=None, call="chat", **params):
+        """
+        Yields content deltas as they arrive. Only connection setup is retried;
+        a stream that fails midway raises LLMClientError.
+        """
+        payload = {"model": model, "messages": messages, "stream": True,
+                   **{k: v for k, v in params.items() if v is not None}}
+        deadline = time.monotonic() + (timeout or self.timeout)
+
+        async def attempt(remaining):
+            response = await self._post(payload, remaining)
+            await self._check_status(response)
+            return response
+
+        outcome, usage, deltas = "error", None, 0
+        start = time.perf_counter()
+
+        # Streams hold a concurrency slot for their whole lifetime
+        await self._bucket.acquire()
+        async with self._semaphore:
+            LLM_IN_FLIGHT.inc()
+            try:
+                response = await self._with_retries(attempt, deadline, limited=False)
+                async with response:
+                    async for raw_line in response.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        error = chunk.get("error")
+                        if error:  # the upstream failed after the stream started
+                            raise LLMClientError(f"Stream failed: {error.get('message') if isinstance(error, dict) else error}")
+                        usage = chunk.get("usage") or usage
+                        for choice in chunk.get("choices", []):
+                            token = (choice.get("delta") or {}).get("content")
+                            if token:
+                                deltas += 1
+                                yield token
+                        if time.monotonic() > deadline:
+                            raise LLMClientError("Deadline exceeded while streaming")
+                outcome = "ok"
+            except aiohttp.ClientError as e:
+                raise LLMClientError(f"Stream interrupted: {e}") from e
+            finally:
+                LLM_IN_FLIGHT.dec()
+                LLM_DURATION.labels(call=call).observe(time.perf_counter() - start)
+                LLM_REQUESTS.labels(call=call, outcome=outcome).inc()
+                # Without a usage block, count streamed deltas as completion tokens
+                self._record_usage(call, usage or {"completion_tokens": deltas})
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -1,7 +1,9 @@
 import os
+import asyncio
 import logging
-from together import Together
-from collections import defaultdict
+from llm_client import AsyncLLMClient, LLMClientError
+from chat_memory import ChatMemory
+import config
 from utils import extract_user_question, extract_model_answer
 
 # Logging Configuration
@@ -16,31 +18,82 @@ if not TOGETHER_API_KEY:
 # Define Model for Answering
 MODEL_NAME = "meta-llama/Llama-3.3-70B-Instruct-Turbo"
 
-# Initialize Client
-client = Together(api_key=TOGETHER_API_KEY)
+# Initialize Client (shared connection pool, concurrency and rate limits)
+client = AsyncLLMClient(
+    base_url=config.TOGETHER_BASE_URL,
+    api_key=TOGETHER_API_KEY,
+    max_concurrency=config.LLM_MAX_CONCURRENCY,
+    requests_per_second=config.LLM_REQUESTS_PER_SECOND,
+    burst=config.LLM_BURST,
+    max_retries=config.LLM_MAX_RETRIES,
+    timeout=config.LLM_TIMEOUT_SECONDS,
+    pool_size=config.LLM_POOL_SIZE,
+)
+
+SYSTEM_PROMPT = "You are an expert assistant in cybersecurity and cloud computing. Answer user queries clearly and helpfully."
+
+# Maintain bounded, persistent per-user chat memory
+chat_memory = ChatMemory(
+    db_path=config.CHAT_MEMORY_DB_PATH,
+    system_prompt=SYSTEM_PROMPT,
+    window_tokens=config.CHAT_MEMORY_WINDOW_TOKENS,
+    summary_trigger_tokens=config.CHAT_MEMORY_SUMMARY_TRIGGER_TOKENS,
+    max_cached_users=config.CHAT_MEMORY_MAX_CACHED_USERS,
+    idle_seconds=config.CHAT_MEMORY_IDLE_SECONDS,
+)
+
+async def summarize_turns(previous_summary, turns):
+    """
+    Folds older chat turns into the rolling conversation summary.
+    """
+    transcript = "\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in turns)
+    response = await client.chat(
+        model=MODEL_NAME,
+        messages=[
+            {"role": "system", "content": "You summarize tutoring conversations. Keep the topics, key facts and open questions. No commentary."},
+            {"role": "user", "content": f"PREVIOUS SUMMARY:\n{previous_summary or '(none)'}\n\nNEW TURNS:\n{transcript}\n\nUPDATED SUMMARY (max 150 words):"}
+        ],
+        max_tokens=200,
+        temperature=0.3,
+        top_p=1.0,
+        call="summary"
+    )
+    if response and response.choices:
+        return response.choices[0].message.content.strip()
+    return None
 
-# Maintain per-user chat history
-chat_histories = defaultdict(lambda: [
-    {"role": "system", "content": "You are an expert assistant in cybersecurity and cloud computing. Answer user queries clearly and helpfully."}
-])
+# Background compactions; the loop only keeps weak references to tasks, so hold them until they finish
+compaction_tasks = set()
 
-def get_response(input_text, user_id, max_tokens=None, skip_history_append=False):
+def _compaction_done(task):
+    compaction_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("❌ Chat memory compaction failed", exc_info=task.exception())
+
+async def remember(user_id, question, answer):
+    """
+    Stores a finished exchange and folds older turns into the summary in the background.
+    """
+    await chat_memory.append(user_id, ("user", question), ("assistant", answer))
+    task = asyncio.get_running_loop().create_task(chat_memory.compact(user_id, summarize_turns))
+    compaction_tasks.add(task)
+    task.add_done_callback(_compaction_done)
+
+async def get_response(input_text, user_id, max_tokens=None, skip_history_append=False, timeout=None, call="answer"):
     try:
         clean_question = extract_user_question(input_text)
 
-        # Only store clean question in memory
-        if not skip_history_append:
-            chat_histories[user_id].append({"role": "user", "content": clean_question})
-
         # Model sees chat memory + full prompt for current turn
-        full_messages = chat_histories[user_id][:-1] + [{"role": "user", "content": str(input_text)}]
+        full_messages = await chat_memory.messages(user_id) + [{"role": "user", "content": str(input_text)}]
 
-        response = client.chat.completions.create(
+        response = await client.chat(
             model=MODEL_NAME,
             messages=full_messages,
             max_tokens=max_tokens,
             temperature=0.7,
-            top_p=1.0
+            top_p=1.0,
+            timeout=timeout,
+            call=call
         )
 
         if response is None or not hasattr(response, "choices") or not response.choices:
@@ -51,8 +104,9 @@ def get_response(input_text, user_id, max_tokens=None, skip_history_append=False
         full_answer = response.choices[0].message.content.strip()
         clean_answer = extract_model_answer(full_answer)
 
+        # Only store clean question and answer in memory
         if not skip_history_append:
-            chat_histories[user_id].append({"role": "assistant", "content": clean_answer})
+            await remember(user_id, clean_question, clean_answer)
 
         return response
 
@@ -60,14 +114,43 @@ def get_response(input_text, user_id, max_tokens=None, skip_history_append=False
         logger.exception("❌ Error calling Together AI API")
         return None
 
-def augment_question(user_id, current_question, max_tokens=100):
+async def stream_response(input_text, user_id, max_tokens=None):
+    """
+    Streams answer tokens from Together AI as they arrive.
+    The full answer is added to the chat history once the stream ends.
+    """
+    clean_question = extract_user_question(input_text)
+    full_messages = await chat_memory.messages(user_id) + [{"role": "user", "content": str(input_text)}]
+
+    parts = []
+    async for token in client.stream_chat(
+        model=MODEL_NAME,
+        messages=full_messages,
+        max_tokens=max_tokens,
+        temperature=0.7,
+        top_p=1.0,
+        call="answer"
+    ):
+        parts.append(token)
+        yield token
+
+    full_answer = "".join(parts).strip()
+    await remember(user_id, clean_question, extract_model_answer(full_answer))
+
+async def record_exchange(user_id, question, answer):
+    """
+    Appends a question/answer turn that was served without calling the model.
+    """
+    await remember(user_id, question, answer)
+
+async def augment_question(user_id, current_question, max_tokens=100):
     """
     Use LLM to generate an intent-aware version of the current user question
     based on chat history context.
     """
     # Build the last 2 user-assistant exchanges (up to 4 messages)
     memory = ""
-    for msg in chat_histories[user_id][-4:]:
+    for msg in await chat_memory.recent(user_id, 4):
         memory += f"{msg['role'].capitalize()}: {msg['content']}\n"
 
     rewrite_prompt = f"""You are an assistant that rewrites vague or follow-up user questions based on previous conversation history.
@@ -84,16 +167,22 @@ def augment_question(user_id, current_question, max_tokens=100):
 
     # print(f"\n📤 Prompt sent to LLM for question rewriting (user {user_id}):\n{rewrite_prompt.strip()}\n")
 
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=[
-            {"role": "system", "content": "You are a rewrite assistant. You ONLY return rewritten user questions, nothing else. No commentary."},
-            {"role": "user", "content": rewrite_prompt}
-        ],
-        max_tokens=max_tokens,
-        temperature=0.5,
-        top_p=1.0
-    )
+    try:
+        response = await client.chat(
+            model=MODEL_NAME,
+            messages=[
+                {"role": "system", "content": "You are a rewrite assistant. You ONLY return rewritten user questions, nothing else. No commentary."},
+                {"role": "user", "content": rewrite_prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=0.5,
+            top_p=1.0,
+            timeout=config.LLM_REWRITE_TIMEOUT_SECONDS,
+            call="rewrite"
+        )
+    except LLMClientError as e:
+        logger.warning(f"⚠️ Question rewrite failed, using the original question: {e}")
+        return current_question
 
     if response and response.choices:
         rewritten_question = response.choices[0].message.content.strip()
@@ -106,8 +195,13 @@ def augment_question(user_id, current_question, max_tokens=100):
 
 # Optional test block
 if __name__ == "__main__":
-    response = get_response("What is a vulnerability in cybersecurity?", max_tokens=100)
-    print(response.choices[0].message.content.strip() if response else "❌ Failed to get response.")
+    async def main():
+        response = await get_response("What is a vulnerability in cybersecurity?", user_id=0, max_tokens=100)
+        print(response.choices[0].message.content.strip() if response else "❌ Failed to get response.")
+
+        response = await get_response("How can attackers exploit it?", user_id=0, max_tokens=100)
+        print(response.choices[0].message.content.strip() if response else "❌ Failed to get response.")
+
+        await client.close()
 
-    response = get_response("How can attackers exploit it?", max_tokens=100)
-    print(response.choices[0].message.content.strip() if response else "❌ Failed to get response.")
+    asyncio.run(main())
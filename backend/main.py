@@ -1,11 +1,11 @@
-from db import engine, Base, SessionLocal
-import models
+import asyncio
+from db import init_db
 
 
-def init_db():
+async def main():
     print("Creating tables...")
-    Base.metadata.create_all(bind=engine)
+    await init_db()
     print("Database initialized.")
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+import os
+import json
+import mmap
+import struct
+import logging
+import hashlib
+import numpy as np
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Layout: header | schema (JSON column names) | per column: (count + 1) uint64 offsets, UTF-8 values.
+# Every value is stored as a string, so any row/field is an O(1) slice of the mapped file.
+MAGIC = b"CBMD"
+VERSION = 2
+HEADER = struct.Struct("<4sIQI")  # magic, version, row count, schema length
+ALIGNMENT = 8
+
+
+def stable_id(qid):
+    """
+    Non-negative int64 FAISS id derived from a QID, so a row keeps its id across re-ingestion.
+    """
+    digest = hashlib.blake2b(str(qid).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def content_hash(*fields):
+    """
+    Signed int64 hash of a row's embedded text; a changed hash means the row must be re-embedded.
+    """
+    digest = hashlib.blake2b("\x1f".join(str(f) for f in fields).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def save_array(array, path):
+    """
+    np.save through a temporary file, so processes that memory-map `path` never see a partial write.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp{path.suffix}")
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _pad(length):
+    return -length % ALIGNMENT
+
+
+def write_store(records, path, columns=None):
+    """
+    Writes records column by column; readers see either the old or the new file.
+    """
+    path = Path(path)
+    records = list(records)
+    if columns is None:
+        columns = list(dict.fromkeys(key for record in records for key in record))
+
+    schema = json.dumps(columns).encode("utf-8")
+    tmp_path = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records), len(schema)))
+        f.write(schema + b"\0" * _pad(HEADER.size + len(schema)))
+
+        for column in columns:
+            values = [str(record.get(column, "")).encode("utf-8") for record in records]
+            offsets = np.zeros(len(values) + 1, dtype="<u8")
+            np.cumsum([len(value) for value in values], out=offsets[1:])
+            data = b"".join(values)
+            f.write(offsets.tobytes())
+            f.write(data + b"\0" * _pad(len(data)))
+
+    os.replace(tmp_path, path)
+    return path
+
+
+class MetadataStore:
+    """
+    Read-only, memory-mapped view of a metadata file written by `write_store`.
+
+    Opening only reads the header and schema, so it is O(1) in the number of
+    rows, and the pages are shared through the OS page cache by every worker
+    that maps the same file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, schema_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"❌ {self.path} is not a v{VERSION} metadata store.")
+
+        self._count = count
+        self.columns = json.loads(self._mmap[HEADER.size:HEADER.size + schema_length])
+
+        # column -> (offsets, start of the column's values)
+        self._columns = {}
+        position = HEADER.size + schema_length + _pad(HEADER.size + schema_length)
+        for column in self.columns:
+            offsets = np.frombuffer(self._mmap, dtype="<u8", count=count + 1, offset=position)
+            data_start = position + offsets.nbytes
+            self._columns[column] = (offsets, data_start)
+            data_length = int(offsets[-1])
+            position = data_start + data_length + _pad(data_length)
+
+    def __len__(self):
+        return self._count
+
+    def value(self, i, column):
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        offsets, data_start = self._columns[column]
+        return self._mmap[data_start + int(offsets[i]):data_start + int(offsets[i + 1])].decode("utf-8")
+
+    def get(self, i, fields=None):
+        """
+        Returns row `i` as a dict, decoding only `fields` when given.
+        """
+        if i < 0:
+            i += self._count
+        return {column: self.value(i, column) for column in (fields or self.columns)}
+
+    def __getitem__(self, i):
+        return self.get(i)
+
+    def __iter__(self):
+        return (self.get(i) for i in range(self._count))
+
+
+class ShardedStore:
+    """
+    Concatenation of several metadata stores (doc-chunking.py shards) addressed by global row.
+
+    `shards` is a list of (name, row count) in row order, as recorded in the
+    index manifest. Missing shard files yield None rows instead of failing.
+    """
+
+    def __init__(self, directory, shards):
+        self.directory = Path(directory)
+        self._stores = []
+        for name, _ in shards:
+            try:
+                self._stores.append(MetadataStore(self.directory / f"{name}.records"))
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Skipping shard {name}: {e}")
+                self._stores.append(None)
+        self._starts = np.concatenate([[0], np.cumsum([count for _, count in shards])]).astype(np.int64)
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def get(self, i, fields=None):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        shard = int(np.searchsorted(self._starts, i, side="right")) - 1
+        store = self._stores[shard]
+        local = i - int(self._starts[shard])
+        if store is None or local >= len(store):
+            return None
+        return store.get(local, fields)
+
+
+def open_store(store_path, legacy_json_path=None):
+    """
+    Opens the metadata store. A store missing, outdated or older than
+    `legacy_json_path` (a qa_metadata.json from older embedder runs) is
+    rebuilt from that JSON when it exists.
+    """
+    store_path = Path(store_path)
+    legacy_json_path = Path(legacy_json_path) if legacy_json_path else None
+    has_json = legacy_json_path is not None and legacy_json_path.exists()
+
+    if has_json and store_path.exists() and legacy_json_path.stat().st_mtime_ns <= store_path.stat().st_mtime_ns:
+        try:
+            return MetadataStore(store_path)
+        except ValueError as e:
+            logger.warning(f"⚠️ {e} Rebuilding it.")
+    elif not has_json:
+        return MetadataStore(store_path)
+
+    logger.info(f"⚡ Building metadata store {store_path.name} from {legacy_json_path.name}...")
+    with open(legacy_json_path, "r") as f:
+        write_store(json.load(f), store_path)
+    return MetadataStore(store_path)
@@ -0,0 +1,62 @@
+import os
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest, multiprocess)
+
+# With several uvicorn workers each process keeps its own metric values. When the
+# PROMETHEUS_MULTIPROC_DIR environment variable is set (before the workers start, to an
+# empty directory) prometheus_client writes them to memory-mapped files there instead,
+# and /metrics aggregates the files of every worker.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, from sub-millisecond FAISS searches to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def render():
+    """
+    Prometheus text exposition of all metrics, summed over workers in multiprocess mode.
+    """
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid=None):
+    """
+    Drops a stopped worker's live gauges (in-flight counts) from the aggregate.
+    """
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+# Request level
+REQUEST_DURATION = Histogram("cyberbot_request_duration_seconds", "HTTP request latency.", ["method", "path", "status"],
+                             buckets=DEFAULT_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("cyberbot_requests_in_flight", "HTTP requests currently being handled.",
+                           multiprocess_mode="livesum")
+
+# Pipeline stages (follow-up detection, rewrite, embedding, FAISS, generation, validation, ...)
+STAGE_DURATION = Histogram("cyberbot_stage_duration_seconds", "Latency of each /query pipeline stage.", ["stage"],
+                           buckets=DEFAULT_BUCKETS)
+RETRIEVAL_PATHS = Counter("cyberbot_retrieval_path_total", "Queries by retrieval path (dense, hybrid, lexical).", ["path"])
+RERANK_OUTCOMES = Counter("cyberbot_rerank_total", "Reranked queries by outcome (reranked, fallback).", ["outcome"])
+RETRIEVAL_BATCH_SIZE = Histogram("cyberbot_retrieval_batch_size", "Queries per micro-batched retrieval.",
+                                 buckets=(1, 2, 4, 8, 16, 32, 64))
+
+# LLM calls
+LLM_REQUESTS = Counter("cyberbot_llm_requests_total", "LLM calls by purpose and outcome.", ["call", "outcome"])
+LLM_DURATION = Histogram("cyberbot_llm_request_duration_seconds", "LLM call latency.", ["call"], buckets=DEFAULT_BUCKETS)
+LLM_TOKENS = Counter("cyberbot_llm_tokens_total", "LLM tokens by purpose and kind.", ["call", "kind"])
+LLM_IN_FLIGHT = Gauge("cyberbot_llm_in_flight", "LLM calls currently in flight.", multiprocess_mode="livesum")
+
+# Caches and validation
+CACHE_REQUESTS = Counter("cyberbot_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+VALIDATIONS = Counter("cyberbot_validations_total", "Ontology validations by validator and verdict.", ["validator", "result"])
+
+# Write-behind QA history persistence
+HISTORY_ROWS = Counter("cyberbot_history_rows_total", "QA pairs by persistence outcome (written, retried, rejected, deferred to the journal, lost).", ["outcome"])
+HISTORY_BATCH_SIZE = Histogram("cyberbot_history_batch_size", "QA pairs per history insert transaction.",
+                               buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
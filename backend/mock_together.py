@@ -0,0 +1,130 @@
+"""
+Local stand-in for the Together chat-completions API.
+
+Run it and point the backend at it:
+
+    python mock_together.py --port 8001 --latency 0.2 --failure-rate 0.1
+    TOGETHER_BASE_URL=http://127.0.0.1:8001/v1 TOGETHER_API_KEY=mock uvicorn api:app
+
+Tests start it in-process with `create_app(build_parser().parse_args([...]))`
+and read the request counters it keeps in `app[STATS]`.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+VALIDATION_REPLY = json.dumps({
+    "validation_result": "Pass",
+    "confidence_score": 0.9,
+    "reasoning": "Mock validation: answer maps to 'attacker, can_exploit, vulnerability'."
+})
+
+
+SETTINGS = web.AppKey("settings", argparse.Namespace)
+STATS = web.AppKey("stats", dict)
+
+
+def reply_for(messages):
+    """
+    Picks a canned reply that matches what the backend expects for each prompt type.
+    """
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    prompt = messages[-1]["content"] if messages else ""
+
+    if "Return ONLY a JSON response" in prompt:
+        return VALIDATION_REPLY
+    if "rewrite assistant" in system:
+        return prompt.split("CURRENT QUESTION:")[-1].split("REWRITTEN QUESTION:")[0].strip()
+    return "A vulnerability is a weakness in a system that an attacker can exploit to compromise its security."
+
+
+def completion(model, content, prompt_tokens):
+    completion_tokens = len(content.split())
+    return {
+        "id": f"mock-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+async def chat_completions(request):
+    settings = request.app[SETTINGS]
+    stats = request.app[STATS]
+    stats["requests"] += 1
+    stats["started"].append(time.monotonic())
+
+    if stats["requests"] <= settings.fail_first or random.random() < settings.failure_rate:
+        return web.json_response({"error": {"message": "mock overload"}}, status=settings.failure_status)
+
+    stats["in_flight"] += 1
+    stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+    try:
+        return await respond(request, settings)
+    finally:
+        stats["in_flight"] -= 1
+
+
+async def respond(request, settings):
+    body = await request.json()
+    messages = body.get("messages", [])
+    content = reply_for(messages)
+    prompt_tokens = sum(len(m["content"].split()) for m in messages)
+    await asyncio.sleep(settings.latency)
+
+    if not body.get("stream"):
+        return web.json_response(completion(body.get("model"), content, prompt_tokens))
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for i, word in enumerate(content.split(" ")):
+        if settings.stream_error_after is not None and i == settings.stream_error_after:
+            # Same shape as an upstream failure reported inside an open stream
+            await response.write(f"data: {json.dumps({'error': {'message': 'mock stream failure'}})}\n\n".encode())
+            await response.write_eof()
+            return response
+        chunk = {"choices": [{"index": 0, "delta": {"content": word + " "}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await asyncio.sleep(settings.token_delay)
+    final = completion(body.get("model"), content, prompt_tokens)
+    await response.write(f"data: {json.dumps({'choices': [], 'usage': final['usage']})}\n\n".encode())
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def create_app(settings):
+    app = web.Application()
+    app[SETTINGS] = settings
+    app[STATS] = {"requests": 0, "started": [], "in_flight": 0, "max_in_flight": 0}
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock Together chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with --failure-status")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with --failure-status")
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--stream-error-after", type=int, default=None,
+                        help="Send an error event instead of the Nth streamed token and end the stream")
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    web.run_app(create_app(args), host=args.host, port=args.port)
@@ -1,23 +1,36 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import JSON, DateTime, ForeignKey, Index, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 from db import Base
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    username = Column(String, unique=True, index=True, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
-    hashed_password = Column(String, nullable=False)
+    id: Mapped[int] = mapped_column(primary_key=True, index=True, autoincrement=True)
+    username: Mapped[str] = mapped_column(String, unique=True, index=True)
+    email: Mapped[str] = mapped_column(String, unique=True, index=True)
+    # Lower-cased, trimmed email; login looks users up by this column
+    email_normalized: Mapped[Optional[str]] = mapped_column(String, unique=True, index=True)
+    hashed_password: Mapped[str] = mapped_column(String)
 
-    questions = relationship("QuestionAnswer", back_populates="user")
+    questions: Mapped[List["QuestionAnswer"]] = relationship(back_populates="user")
 
 class QuestionAnswer(Base):
     __tablename__ = "qa_pairs"
+    # History is read per user in id order
+    __table_args__ = (Index("ix_qa_pairs_user_id", "user_id", "id"),)
 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    question = Column(Text, nullable=False)
-    answer = Column(Text, nullable=False)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"))
+    question: Mapped[str] = mapped_column(Text)
+    answer: Mapped[str] = mapped_column(Text)
+    validation_result: Mapped[Optional[str]] = mapped_column(String)
+    confidence_score: Mapped[Optional[float]]
+    # Written by /query for later analysis: standalone rewrite, context sent to the model, stage timings (ms)
+    rewritten_question: Mapped[Optional[str]] = mapped_column(Text)
+    retrieval_context: Mapped[Optional[str]] = mapped_column(Text)
+    timings: Mapped[Optional[dict]] = mapped_column(JSON)
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, server_default=func.now())
 
-    user = relationship("User", back_populates="questions")
\ No newline at end of file
+    user: Mapped["User"] = relationship(back_populates="questions")
@@ -0,0 +1,260 @@
+import re
+import ast
+import csv
+import logging
+from collections import deque
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+ONTOLOGY_DIR = ROOT_DIR / "dataset" / "ontology"
+ONTOLOGY_CSV_PATH = ONTOLOGY_DIR / "ontology.csv"
+ONTOLOGY_TXT_PATH = ONTOLOGY_DIR / "ontology.txt"
+
+
+def split_camel_case(name):
+    # "securityTeam" -> "security team"
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", name).lower().strip()
+
+
+def surface_forms(term):
+    """
+    Lowercased spelling variants matched in text: singular/plural for nouns.
+    """
+    term = term.lower()
+    forms = {term}
+    if term.endswith("s"):
+        forms.add(term[:-1])
+    elif term.endswith("y"):
+        forms.add(term[:-1] + "ies")
+    else:
+        forms.add(term + "s")
+    return {f for f in forms if len(f) > 2}
+
+
+def relation_forms(relation):
+    """
+    Verb variants for a relation name, e.g. can_exploit -> exploit, exploits, exploited, exploiting.
+    """
+    words = [w for w in relation.lower().split("_") if w not in ("can", "is", "has", "a", "of")]
+    if not words:
+        return {relation.replace("_", " ")}
+    verb = words[0]
+    stem = verb[:-1] if verb.endswith("e") else verb
+    return {verb, verb + "s", stem + "ed", stem + "ing", relation.replace("_", " ")}
+
+
+def extract_literal(text, name):
+    """
+    Reads a Python literal assigned in ontology.txt, e.g. `entities = {...}`.
+    Returns a list with one value per assignment of `name`.
+    """
+    values = []
+    for match in re.finditer(rf"^{name}\s*=\s*([\[{{])", text, re.MULTILINE):
+        opening = match.group(1)
+        closing = "}" if opening == "{" else "]"
+        depth, start = 0, match.start(1)
+        for i in range(start, len(text)):
+            if text[i] == opening:
+                depth += 1
+            elif text[i] == closing:
+                depth -= 1
+                if depth == 0:
+                    try:
+                        values.append(ast.literal_eval(text[start:i + 1]))
+                    except (ValueError, SyntaxError) as e:
+                        logger.warning(f"⚠️ Could not parse `{name}` in ontology.txt: {e}")
+                    break
+    return values
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher over lowercased text; reports whole-word matches only.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+    def add(self, pattern, value):
+        node = 0
+        for ch in pattern:
+            if ch not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][ch] = len(self._goto) - 1
+            node = self._goto[node][ch]
+        self._output[node].append((len(pattern), value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0) if self._goto[fail].get(ch, 0) != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+        return self
+
+    def find(self, text):
+        """
+        Yields (start, end, value) for each whole-word match in `text`.
+        """
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, value in self._output[node]:
+                start, end = i - length + 1, i + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                    yield start, end, value
+
+
+class OntologyGraph:
+    """
+    In-memory triple graph built from ontology.csv and ontology.txt, with an
+    entity/relation matcher used to score how well an answer is grounded.
+    """
+
+    def __init__(self, csv_path=ONTOLOGY_CSV_PATH, txt_path=ONTOLOGY_TXT_PATH):
+        self.triples = set()      # (type1, relation, type2)
+        self.entity_types = set()
+        self.instances = {}       # instance surface text -> entity type
+        self.relations = set()
+
+        self._load_csv(csv_path)
+        self._load_txt(txt_path)
+        self._build_matcher()
+
+        logger.info(f"✅ Ontology graph loaded: {len(self.triples)} triples, "
+                    f"{len(self.entity_types)} entity types, {len(self.instances)} instances.")
+
+    def _add_triple(self, type1, relation, type2):
+        type1, type2 = split_camel_case(type1), split_camel_case(type2)
+        self.triples.add((type1, relation, type2))
+        self.entity_types.update((type1, type2))
+        self.relations.add(relation)
+
+    def _load_csv(self, path):
+        try:
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self._add_triple(row["Type1"].strip(), row["Relation"].strip(), row["Type2"].strip())
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to load {path}: {e}")
+
+    def _load_txt(self, path):
+        try:
+            with open(path, "r") as f:
+                text = f.read()
+        except OSError as e:
+            logger.warning(f"⚠️ Failed to load {path}: {e}")
+            return
+
+        # Cybersecurity triples are listed one per line as `type1,relation,type2`
+        for line in text.splitlines():
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) == 3 and all(re.fullmatch(r"\w+", p) for p in parts):
+                self._add_triple(*parts)
+
+        for entities in extract_literal(text, "entities"):
+            for domain in entities.values():
+                for entity_type, instances in domain.items():
+                    entity_type = split_camel_case(entity_type)
+                    self.entity_types.add(entity_type)
+                    for instance in instances:
+                        self.instances[instance.lower()] = entity_type
+
+        for relations in extract_literal(text, "relations"):
+            self.relations.update(relations)
+
+        for cloud_triples in extract_literal(text, "cloud_triples"):
+            for relation, mappings in cloud_triples.items():
+                for _, type1, _, type2 in mappings:
+                    self._add_triple(type1, relation, type2)
+
+    def _build_matcher(self):
+        # Values are ("entity", type, name, specific) or ("relation", relation). Only named instances
+        # ("sql injection", "load balancing") and multi-word types ("public cloud") are specific;
+        # one-word type names ("system", "tool", "attack") are everyday words and prove nothing alone
+        self.matcher = AhoCorasick()
+        for entity_type in self.entity_types:
+            for form in surface_forms(entity_type):
+                self.matcher.add(form, ("entity", entity_type, entity_type, " " in entity_type))
+        for instance, entity_type in self.instances.items():
+            for form in surface_forms(instance):
+                self.matcher.add(form, ("entity", entity_type, instance, True))
+        for relation in self.relations:
+            for form in relation_forms(relation):
+                self.matcher.add(form, ("relation", relation))
+        self.matcher.build()
+        self.neighbors = {}
+        for t1, _, t2 in self.triples:
+            self.neighbors.setdefault(t1, set()).add(t2)
+            self.neighbors.setdefault(t2, set()).add(t1)
+
+    def match(self, text):
+        """
+        Returns (entity_types, relations) mentioned in `text`.
+        """
+        entities, relations = set(), set()
+        for _, _, value in self.matcher.find(text.lower()):
+            if value[0] == "entity":
+                entities.add(value[1])
+            else:
+                relations.add(value[1])
+        return entities, relations
+
+    def specific_mentions(self, text):
+        """
+        Returns {name: entity_type} for the specific entities (see _build_matcher) mentioned in `text`.
+        """
+        return {value[2]: value[1] for _, _, value in self.matcher.find(text.lower()) if value[0] == "entity" and value[3]}
+
+    def related(self, entity_type, types):
+        """
+        Whether `entity_type` is one of `types` or linked to one of them by a triple.
+        """
+        return entity_type in types or bool(self.neighbors.get(entity_type, set()) & types)
+
+    def supported_triples(self, entities, relations=None):
+        """
+        Triples whose endpoints are both mentioned (and whose relation is, if `relations` is given).
+        """
+        return {
+            (t1, r, t2) for t1, r, t2 in self.triples
+            if t1 in entities and t2 in entities and (relations is None or r in relations)
+        }
+
+    def grounding(self, question, answer):
+        """
+        Scores in [0, 1] how well the answer is grounded in the ontology *and* in the question:
+        0.5 per specific entity in the answer (at most two count) whose type is, or is linked
+        by a triple to, an entity type of the question. `evidence` counts every
+        specific entity in the answer, related or not, so a low score can be told apart from
+        an answer that simply names few ontology entities.
+        """
+        q_entities, q_relations = self.match(question)
+        a_entities, a_relations = self.match(answer)
+        mentions = self.specific_mentions(answer)
+        related = sorted(name for name, entity_type in mentions.items() if self.related(entity_type, q_entities))
+        related_types = {mentions[name] for name in related}
+        triples = self.supported_triples(q_entities | related_types, q_relations | a_relations)
+
+        return {
+            "score": min(1.0, len(related) / 2),
+            "evidence": len(mentions),
+            "related_entities": related,
+            "question_entities": sorted(q_entities),
+            "answer_entities": sorted(a_entities),
+            "relations": sorted(q_relations | a_relations),
+            "triples": sorted(triples),
+        }
@@ -0,0 +1,82 @@
+import logging
+from ontology_registry import ontology_registry
+import config
+
+logger = logging.getLogger(__name__)
+
+# Longest surface form the matcher may need to see across a token boundary
+_OVERLAP = 40
+
+
+class OntologyPrecheck:
+    """
+    Incremental form of the local validation Pass rule (OntologyGraph.grounding),
+    run over partial answer tokens while they stream in.
+
+    Only specific entities named in the answer count, and only those whose
+    type is, or is linked by a triple to, an entity type of the question. Once
+    enough of them have appeared (`pass_score`, as in local validation) the
+    answer is grounded; more text cannot undo that, so with
+    ONTOLOGY_LOCAL_VALIDATION on the Pass verdict is settled before generation
+    ends and the LLM validation call is skipped.
+    """
+
+    def __init__(self, question="", pass_score=None):
+        self.pass_score = config.ONTOLOGY_LOCAL_PASS_SCORE if pass_score is None else pass_score
+        self.question_types = ontology_registry.graph.match(question)[0]
+        self.related_entities = {}  # name -> entity type
+        self._text = ""
+        self._scanned = 0
+
+    def _scan(self, end):
+        # Re-scan a term-length overlap, from a word start, so terms split across tokens are still found
+        graph = ontology_registry.graph
+        start = self._text.rfind(" ", 0, max(0, self._scanned - _OVERLAP)) + 1
+        for name, entity_type in graph.specific_mentions(self._text[start:end]).items():
+            if graph.related(entity_type, self.question_types):
+                self.related_entities[name] = entity_type
+        self._scanned = end
+
+    def feed(self, token):
+        """
+        Adds a streamed token; only whole words are scanned until finish() is called.
+        """
+        self._text += token.lower()
+        boundary = max(self._text.rfind(" "), self._text.rfind("\n"))
+        if boundary > self._scanned:
+            self._scan(boundary)
+        return self.grounded
+
+    def finish(self):
+        self._scan(len(self._text))
+        return self.result()
+
+    @property
+    def score(self):
+        # Same scale as OntologyGraph.grounding: two related entities make a full score
+        return min(1.0, len(self.related_entities) / 2)
+
+    @property
+    def grounded(self):
+        return self.score >= self.pass_score
+
+    def result(self):
+        return {
+            "grounded": self.grounded,
+            "score": self.score,
+            "related_entities": sorted(self.related_entities),
+            "question_entities": sorted(self.question_types),
+        }
+
+    def validation(self):
+        """
+        The local Pass verdict once the answer is grounded, otherwise None.
+        """
+        if not self.grounded:
+            return None
+        return {
+            "validation_result": "Pass",
+            "confidence_score": self.score,
+            "reasoning": f"Local check: answer mentions {', '.join(sorted(self.related_entities))}.",
+            "validator": "local",
+        }
@@ -0,0 +1,110 @@
+import os
+import time
+import logging
+import threading
+from ontology_graph import OntologyGraph, ONTOLOGY_CSV_PATH, ONTOLOGY_TXT_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class OntologyRegistry:
+    """
+    Process-wide holder for the parsed ontology.
+
+    Files are read once and reloaded only when their mtime changes (checked at
+    most every `check_interval` seconds). Besides the graph, it precomputes the
+    full ontology prompt section and selects the sub-graph relevant to a
+    question/answer pair so validation prompts stay small.
+    """
+
+    def __init__(self, csv_path=ONTOLOGY_CSV_PATH, txt_path=ONTOLOGY_TXT_PATH, check_interval=1.0, max_triples=40):
+        self.csv_path = csv_path
+        self.txt_path = txt_path
+        self.check_interval = check_interval
+        self.max_triples = max_triples
+
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._checked_at = 0.0
+        self._graph = None
+        self._full_text = ""
+        self._reload()
+
+    def _current_mtimes(self):
+        mtimes = []
+        for path in (self.csv_path, self.txt_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _reload(self):
+        mtimes = self._current_mtimes()
+        graph = OntologyGraph(self.csv_path, self.txt_path)
+        try:
+            with open(self.txt_path, "r") as f:
+                full_text = f.read().strip()
+        except OSError as e:
+            logger.error(f"⚠️ Failed to load ontology file: {e}")
+            full_text = self._full_text
+
+        # Swap in the new state only once it is fully built
+        self._graph, self._full_text, self._mtimes = graph, full_text, mtimes
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self._current_mtimes() != self._mtimes:
+                logger.info("♻️ Ontology files changed, reloading.")
+                self._reload()
+
+    @property
+    def graph(self):
+        self._refresh()
+        return self._graph
+
+    @property
+    def full_text(self):
+        self._refresh()
+        return self._full_text
+
+    def relevant_subgraph(self, question, answer):
+        """
+        Renders only the triples and entity instances touching entities mentioned
+        in the question or answer; falls back to the full ontology when nothing matches.
+        """
+        graph = self.graph
+        q_entities, q_relations = graph.match(question)
+        a_entities, a_relations = graph.match(answer)
+        entities = q_entities | a_entities
+        relations = q_relations | a_relations
+
+        if not entities:
+            return self.full_text
+
+        # Triples with both endpoints mentioned come first, then those touching one endpoint
+        touching = [t for t in graph.triples if t[0] in entities or t[2] in entities]
+        touching.sort(key=lambda t: (-(t[0] in entities and t[2] in entities), -(t[1] in relations), t))
+        triples = touching[:self.max_triples]
+
+        lines = ["Relevant ontology triples (type, relation, type):"]
+        lines += [f"{t1},{r},{t2}" for t1, r, t2 in triples]
+
+        instances = {}
+        for instance, entity_type in graph.instances.items():
+            if entity_type in entities:
+                instances.setdefault(entity_type, []).append(instance)
+        if instances:
+            lines.append("")
+            lines.append("Known entity instances:")
+            lines += [f"{entity_type}: {', '.join(sorted(names))}" for entity_type, names in sorted(instances.items())]
+
+        return "\n".join(lines)
+
+
+# Loaded once per process, hot-reloaded when the files change
+ontology_registry = OntologyRegistry()
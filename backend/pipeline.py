@@ -0,0 +1,57 @@
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from metrics import STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """
+    Records wall-clock duration per pipeline stage, in milliseconds, and feeds
+    the per-stage latency histogram. Stages may overlap when they run concurrently.
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = round(elapsed * 1000, 2)
+            STAGE_DURATION.labels(stage=name).observe(elapsed)
+
+    def mark(self, name):
+        """
+        Records the time elapsed since the request started, e.g. time-to-first-token.
+        """
+        self.stages[name] = round((time.perf_counter() - self._start) * 1000, 2)
+
+    def as_dict(self):
+        return {**self.stages, "total": round((time.perf_counter() - self._start) * 1000, 2)}
+
+
+async def race_speculative(fallback_task, speculative_task, timeout):
+    """
+    Prefers the speculative result if it arrives within `timeout` seconds,
+    otherwise (or if it fails) returns the fallback result. The loser is cancelled.
+    Returns (result, "speculative" | "fallback").
+    """
+    try:
+        result = await asyncio.wait_for(speculative_task, timeout)
+    except asyncio.TimeoutError:
+        logger.info("⏱️ Speculative path missed its deadline, using fallback.")
+    except Exception:
+        logger.exception("❌ Speculative path failed, using fallback.")
+    else:
+        if not fallback_task.done():
+            fallback_task.cancel()
+        return result, "speculative"
+
+    return await fallback_task, "fallback"
@@ -0,0 +1,126 @@
+from functools import lru_cache
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import User, QuestionAnswer
+
+# Statements are built once with bound parameters; SQLAlchemy caches their
+# compiled form, so each call only binds values
+USER_COLUMNS = (User.id, User.username, User.email, User.hashed_password)
+USER_BY_ID = select(User.id).where(User.id == bindparam("user_id"))
+USER_BY_EMAIL = select(*USER_COLUMNS).where(User.email_normalized == bindparam("email"))
+USER_BY_USERNAME = select(*USER_COLUMNS).where(User.username == bindparam("username"))
+ALL_USERS = select(User.id, User.username, User.email)
+INSERT_USER = insert(User).returning(User.id)
+
+QA_FIELDS = {column.key: column for column in QuestionAnswer.__table__.columns}
+INSERT_QA_PAIR = insert(QuestionAnswer)
+
+
+@lru_cache(maxsize=256)
+def qa_page_statement(fields, by_user, descending, after):
+    """
+    Keyset page over qa_pairs: `fields` are projected server-side (id is always
+    included as the cursor), rows come in id order starting after :after_id,
+    and :limit bounds the work. Served by the primary key, or by
+    ix_qa_pairs_user_id when scoped to a user.
+    """
+    statement = select(QA_FIELDS["id"], *(QA_FIELDS[name] for name in fields if name != "id"))
+    if by_user:
+        statement = statement.where(QA_FIELDS["user_id"] == bindparam("user_id"))
+    if after:
+        cursor = bindparam("after_id")
+        statement = statement.where(QA_FIELDS["id"] < cursor if descending else QA_FIELDS["id"] > cursor)
+    order = QA_FIELDS["id"].desc() if descending else QA_FIELDS["id"]
+    return statement.order_by(order).limit(bindparam("limit"))
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class UserRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create(self, email, username, hashed_password):
+        """
+        Inserts a user and returns its id. Raises IntegrityError for a duplicate email or username.
+        """
+        email = normalize_email(email)
+        try:
+            result = await self.session.execute(INSERT_USER, {
+                "email": email, "email_normalized": email, "username": username, "hashed_password": hashed_password,
+            })
+            user_id = result.scalar_one()
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+        return user_id
+
+    async def by_email(self, email):
+        result = await self.session.execute(USER_BY_EMAIL, {"email": normalize_email(email)})
+        return result.mappings().first()
+
+    async def by_username(self, username):
+        result = await self.session.execute(USER_BY_USERNAME, {"username": username})
+        return result.mappings().first()
+
+    async def exists(self, user_id):
+        result = await self.session.execute(USER_BY_ID, {"user_id": user_id})
+        return result.scalar_one_or_none() is not None
+
+    async def list(self):
+        result = await self.session.execute(ALL_USERS)
+        return [dict(row) for row in result.mappings()]
+
+
+class QARepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def add(self, user_id, question, answer, validation_result, confidence_score):
+        await self.add_many([{
+            "user_id": user_id, "question": question, "answer": answer,
+            "validation_result": validation_result, "confidence_score": confidence_score,
+        }])
+
+    async def add_many(self, rows):
+        """
+        Bulk insert in one executemany round trip; rows are dicts of column values.
+        """
+        if not rows:
+            return
+        try:
+            await self.session.execute(INSERT_QA_PAIR, rows)
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            raise
+
+    async def page(self, fields, limit, after_id=None, user_id=None, descending=False):
+        """
+        Returns (rows, next_cursor): up to `limit` rows after the `after_id` cursor
+        in id order (newest first if `descending`), and the cursor of the next
+        page, or None on the last page.
+        """
+        statement = qa_page_statement(tuple(fields), user_id is not None, descending, after_id is not None)
+        params = {"limit": limit + 1, "user_id": user_id, "after_id": after_id}
+        result = await self.session.execute(statement, {k: v for k, v in params.items() if v is not None})
+        rows = [dict(row) for row in result.mappings()]
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1]["id"]
+        return rows, None
+
+    async def stream(self, fields, batch_size=1000):
+        """
+        Yields every row in id order, one bounded keyset query per batch.
+        """
+        after_id = None
+        while True:
+            rows, after_id = await self.page(fields, batch_size, after_id)
+            for row in rows:
+                yield row
+            if after_id is None:
+                return
@@ -0,0 +1,61 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """
+    Second-stage reranker: scores (query, candidate) pairs with a small CPU
+    cross-encoder, in batches across all queries of a retrieval micro-batch.
+
+    Scoring runs under a per-request time budget. The queries of a micro-batch
+    arrived together, so their candidates are interleaved by rank (every
+    query's first candidate, then every query's second, ...) and each query
+    gets an even share of the budget. Before each batch the reranker checks
+    that it is expected to finish in time (from the slowest batch so far). A
+    query that was not fully scored has its scored candidates reordered and
+    the rest kept in first-stage order behind them.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, batch_size=16, max_length=256):
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.batch_size = batch_size
+        self.name = model_name
+
+    def rerank(self, queries, candidates, top_n, budget_seconds):
+        """
+        Reorders each query's candidate texts by cross-encoder score. Fully scored
+        queries keep their best `top_n`; the others keep every candidate.
+        Returns (ranked lists, indices of the queries that were not fully scored).
+        """
+        # (query index, candidate index) in rank-interleaved order
+        order = [(q, i) for i in range(max(map(len, candidates), default=0))
+                 for q, texts in enumerate(candidates) if i < len(texts)]
+        scores = [{} for _ in candidates]
+        deadline = time.perf_counter() + budget_seconds
+        slowest = 0.0
+
+        for start in range(0, len(order), self.batch_size):
+            now = time.perf_counter()
+            if now + slowest > deadline:
+                break
+            batch = order[start:start + self.batch_size]
+            predicted = self.model.predict([(queries[q], candidates[q][i]) for q, i in batch], batch_size=self.batch_size)
+            for (q, i), score in zip(batch, predicted.tolist()):
+                scores[q][i] = score
+            slowest = max(slowest, time.perf_counter() - now)
+
+        ranked, fallbacks = [], []
+        for q, texts in enumerate(candidates):
+            # Scored candidates are always a prefix of the first-stage order
+            scored = sorted(scores[q], key=scores[q].get, reverse=True)
+            if len(scored) == len(texts):
+                ranked.append([texts[i] for i in scored[:top_n]])
+            else:
+                fallbacks.append(q)
+                ranked.append([texts[i] for i in scored] + texts[len(scored):])
+        return ranked, fallbacks
@@ -0,0 +1,92 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceContainer:
+    """
+    Lazily loaded, process-wide heavy objects (encoder model, FAISS index, metadata).
+
+    Modules register a loader per name at import time, which is cheap. The
+    object is built on first `get()`, or ahead of time by `start_warmup()` in
+    a background thread while /health reports that the service is warming up.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._errors = {}
+        self._load_seconds = {}
+        self._locks = {}
+        self._warmup_thread = None
+
+    def register(self, name, loader, warm=True):
+        """
+        `warm=False` resources are only built on first use, never during warm-up.
+        """
+        self._loaders[name] = (loader, warm)
+        self._locks[name] = threading.Lock()
+
+    def get(self, name):
+        value = self._values.get(name)
+        if value is not None:
+            return value
+
+        with self._locks[name]:
+            if name not in self._values:
+                loader, _ = self._loaders[name]
+                start = time.perf_counter()
+                try:
+                    self._values[name] = loader()
+                except Exception as e:
+                    self._errors[name] = repr(e)
+                    raise
+                self._errors.pop(name, None)
+                self._load_seconds[name] = round(time.perf_counter() - start, 3)
+                logger.info(f"✅ Loaded {name} in {self._load_seconds[name]}s")
+            return self._values[name]
+
+    def replace(self, name, value):
+        """
+        Atomically swaps a loaded resource, e.g. after an index rebuild.
+        """
+        with self._locks[name]:
+            self._values[name] = value
+
+    def loaded(self, name):
+        return name in self._values
+
+    def warm(self):
+        for name, (_, warm) in self._loaders.items():
+            if not warm:
+                continue
+            try:
+                self.get(name)
+            except Exception:
+                logger.exception(f"❌ Failed to warm {name}")
+
+    def start_warmup(self):
+        if self._warmup_thread is None:
+            self._warmup_thread = threading.Thread(target=self.warm, name="resource-warmup", daemon=True)
+            self._warmup_thread.start()
+
+    @property
+    def ready(self):
+        return all(self.loaded(name) for name, (_, warm) in self._loaders.items() if warm)
+
+    def status(self):
+        resources = {}
+        for name in self._loaders:
+            if name in self._values:
+                resources[name] = {"state": "loaded", "load_seconds": self._load_seconds.get(name)}
+            elif name in self._errors:
+                resources[name] = {"state": "error", "error": self._errors[name]}
+            else:
+                resources[name] = {"state": "pending"}
+        return {"status": "ready" if self.ready else "warming", "resources": resources}
+
+
+# Shared container for the serving process
+resources = ResourceContainer()
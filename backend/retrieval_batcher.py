@@ -0,0 +1,105 @@
+import asyncio
+import logging
+from answer_retriever import retrieve_batch
+from metrics import RETRIEVAL_BATCH_SIZE
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalBatcher:
+    """
+    Micro-batching front end for retrieve_batch.
+
+    Concurrent callers are queued for at most `max_wait_ms`, then encoded as one
+    batch and searched with a single FAISS call in a worker thread.
+    """
+
+    def __init__(self, max_batch_size=32, max_wait_ms=5, top_k=3):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.top_k = top_k
+        self._queue = None
+        self._worker = None
+        self._batch = []  # (query, future) pairs being collected or retrieved
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running event loop, so start them lazily
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def retrieve(self, query):
+        """
+        Returns the structured prompt and query embedding for a single query,
+        batched with its neighbours.
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _collect(self):
+        # Requests go straight into _batch so that they are failed, not lost, if the worker is cancelled here
+        self._batch = batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        try:
+            await self._serve()
+        except asyncio.CancelledError:
+            # Callers of the batch in flight and those still queued would otherwise wait forever
+            pending = self._batch
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, future in pending:
+                future.cancel()
+            self._batch = []
+            raise
+
+    async def _serve(self):
+        while True:
+            batch = await self._collect()
+            queries = [query for query, _ in batch]
+            RETRIEVAL_BATCH_SIZE.observe(len(batch))
+
+            try:
+                prompts, embeddings = await asyncio.to_thread(retrieve_batch, queries, self.top_k)
+            except Exception as e:
+                logger.exception("❌ Batched retrieval failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug(f"Retrieved context for a batch of {len(batch)} queries")
+            for (_, future), prompt, embedding in zip(batch, prompts, embeddings):
+                if not future.done():
+                    future.set_result((prompt, embedding))
+
+    async def close(self):
+        """
+        Stops the worker; callers still waiting for a result are cancelled.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+# Shared batcher used by the API
+retrieval_batcher = RetrievalBatcher(top_k=config.QA_TOP_K)
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import sqlite3
-from auth import get_db
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_session, SessionLocal
+from repository import UserRepository, QARepository, QA_FIELDS
+from security import session_user, authorize, require_admin
+import config
 
 router = APIRouter()
 
@@ -12,60 +19,73 @@ class QuestionCreate(BaseModel):
     validation_result: str
     confidence_score: float
 
-@router.get("/users/")
-def get_users(db=Depends(get_db)):
+def parse_fields(fields, default):
+    """
+    Comma-separated projection, e.g. `fields=question,answer`; `id` is always returned.
+    """
+    if not fields:
+        return default
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in QA_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(QA_FIELDS)}")
+    return names
+
+# Columns returned when no projection is given; the analysis columns (retrieval_context, timings, ...) are opt-in
+DEFAULT_FIELDS = ("user_id", "question", "answer", "validation_result", "confidence_score")
+
+Limit = Query(config.HISTORY_PAGE_SIZE, ge=1, le=config.HISTORY_MAX_PAGE_SIZE)
+
+@router.get("/users/", dependencies=[Depends(require_admin)])
+async def get_users(session: AsyncSession = Depends(get_session)):
     """Get all users"""
-    users = db.execute("SELECT id, username, email FROM users").fetchall()
+    return await UserRepository(session).list()
 
-    if not users:
-        return []
-    
-    return [{"id": user["id"], "username": user["username"], "email": user["email"]} for user in users]
+@router.get("/questions/", dependencies=[Depends(require_admin)])
+async def get_all_questions(limit: int = Limit, after_id: Optional[int] = None, fields: Optional[str] = None,
+                            session: AsyncSession = Depends(get_session)):
+    """Page through all stored question-answer pairs, oldest first; pass `next_cursor` back as `after_id`"""
+    items, next_cursor = await QARepository(session).page(parse_fields(fields, DEFAULT_FIELDS), limit, after_id)
+    return {"items": items, "next_cursor": next_cursor}
 
-@router.get("/questions/")
-def get_all_questions(db=Depends(get_db)):
-    """Retrieve all stored question-answer pairs"""
-    qa_pairs = db.execute("SELECT id, user_id, question, answer, validation_result, confidence_score FROM qa_pairs").fetchall()
+@router.get("/questions/export", dependencies=[Depends(require_admin)])
+async def export_questions(fields: Optional[str] = None):
+    """Stream every stored question-answer pair as NDJSON, one bounded keyset query per batch"""
+    fields = parse_fields(fields, DEFAULT_FIELDS)
 
-    if not qa_pairs:
-        return []
+    async def rows():
+        # The session has to outlive the handler, so the stream opens its own
+        async with SessionLocal() as session:
+            async for row in QARepository(session).stream(fields, config.EXPORT_BATCH_SIZE):
+                yield json.dumps(row, default=str) + "\n"
 
-    return [{
-        "id": qa["id"],
-        "user_id": qa["user_id"],
-        "question": qa["question"],
-        "answer": qa["answer"],
-        "validation_result": qa["validation_result"],
-        "confidence_score": qa["confidence_score"]
-    } for qa in qa_pairs]
+    return StreamingResponse(rows(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": "attachment; filename=qa_pairs.ndjson"})
 
 @router.post("/questions/")
-def store_question_answer(question_data: QuestionCreate, db=Depends(get_db)):
+async def store_question_answer(question_data: QuestionCreate, session: AsyncSession = Depends(get_session),
+                                session_user_id: Optional[int] = Depends(session_user)):
     """Store a new question-answer pair"""
+    authorize(question_data.user_id, session_user_id)
     # Check if user exists
-    user = db.execute("SELECT id FROM users WHERE id = ?", (question_data.user_id,)).fetchone()
-    if not user:
+    if not await UserRepository(session).exists(question_data.user_id):
         raise HTTPException(status_code=400, detail="Invalid user_id: User does not exist")
 
     try:
-        db.execute("INSERT INTO qa_pairs (user_id, question, answer, validation_result, confidence_score) VALUES (?, ?, ?, ?, ?)",
-                   (question_data.user_id, question_data.question, question_data.answer, question_data.validation_result, question_data.confidence_score))
-        db.commit()
+        await QARepository(session).add(**question_data.model_dump())
         return {"message": "Stored successfully"}
-    except sqlite3.IntegrityError:
-        db.rollback()
+    except IntegrityError:
         raise HTTPException(status_code=400, detail="Error storing data")
-    
+
 @router.get("/questions/{user_id}")
-def get_questions(user_id: int, db=Depends(get_db)):
-    """Get all questions for a user"""
-    questions = db.execute("SELECT id, question, answer, validation_result, confidence_score FROM qa_pairs WHERE user_id = ?", (user_id,)).fetchall()
-    if not questions:
+async def get_questions(user_id: int, limit: int = Limit, after_id: Optional[int] = None, fields: Optional[str] = None,
+                        order: Literal["desc", "asc"] = "desc", session: AsyncSession = Depends(get_session),
+                        session_user_id: Optional[int] = Depends(session_user)):
+    """Page through a user's questions, newest first by default; pass `next_cursor` back as `after_id`"""
+    authorize(user_id, session_user_id)
+    items, next_cursor = await QARepository(session).page(
+        parse_fields(fields, DEFAULT_FIELDS[1:]), limit, after_id, user_id=user_id, descending=order == "desc",
+    )
+    if not items and after_id is None:
         raise HTTPException(status_code=404, detail="No questions found for this user")
-    return [{
-        "id": q["id"],
-        "question": q["question"],
-        "answer": q["answer"],
-        "validation_result": q["validation_result"],
-        "confidence_score": q["confidence_score"],
-    } for q in questions]
\ No newline at end of file
+    return {"items": items, "next_cursor": next_cursor}
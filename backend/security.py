@@ -0,0 +1,229 @@
+import os
+import hmac
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import secrets
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+from fastapi import Depends, Header, HTTPException
+from metrics import CACHE_REQUESTS
+import config
+
+_pwd_context = None
+
+
+def _context():
+    # Built lazily in each pool process
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def hash_password(password):
+    return _context().hash(password)
+
+
+def verify_password(password, hashed_password):
+    return _context().verify(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a pool of `workers` processes, so a login storm uses every
+    core instead of serializing on the request worker (bcrypt holds the GIL
+    for most of its ~100+ ms). At most `max_pending` jobs are queued; further
+    callers wait for a slot.
+    """
+
+    def __init__(self, workers=None, max_pending=256):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # Spawned rather than forked: workers do not inherit the event loop, models or DB connections
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            pool = self._executor()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool for the next call
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                raise
+
+    async def hash(self, password):
+        return await self._run(hash_password, password)
+
+    async def verify(self, password, hashed_password):
+        return await self._run(verify_password, password, hashed_password)
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def load_secret(path):
+    """
+    Signing key shared by all workers: SESSION_SECRET if set, otherwise a
+    random key created once in `path`.
+    """
+    if config.SESSION_SECRET:
+        return config.SESSION_SECRET.encode("utf-8")
+    path = Path(path)
+    if not path.exists():
+        # Written to a temporary file and linked into place, so concurrent workers agree on one key
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            tmp_path.unlink()
+    return path.read_bytes()
+
+
+class SessionTokens:
+    """
+    Stateless session tokens: base64url(JSON payload) + "." + base64url(HMAC-SHA256).
+
+    Verification is a constant-time HMAC check plus an expiry check, with no
+    database access. Verified tokens are kept in an LRU of `cache_size`
+    entries, so repeat requests skip the HMAC and JSON decoding.
+    """
+
+    def __init__(self, secret, ttl_seconds=86400, cache_size=10000):
+        self._secret = secret  # bytes, or a function returning them that is called on first use
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # token -> (user_id, expires_at)
+
+    @property
+    def secret(self):
+        if callable(self._secret):
+            with self._lock:
+                if callable(self._secret):
+                    self._secret = self._secret()
+        return self._secret
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id):
+        now = int(time.time())
+        payload = _b64encode(json.dumps({"sub": user_id, "iat": now, "exp": now + int(self.ttl_seconds)},
+                                        separators=(",", ":")).encode("utf-8"))
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token):
+        """
+        Returns the user id the token was issued to, or None if it is invalid or expired.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None:
+                if cached[1] > now:
+                    self._cache.move_to_end(token)
+                    CACHE_REQUESTS.labels(cache="session", result="hit").inc()
+                    return cached[0]
+                del self._cache[token]
+        CACHE_REQUESTS.labels(cache="session", result="miss").inc()
+
+        payload, _, signature = token.partition(".")
+        try:
+            if not payload or not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            claims = json.loads(_b64decode(payload))
+            user_id, expires_at = int(claims["sub"]), float(claims["exp"])
+        except (ValueError, KeyError, TypeError):  # includes non-ASCII and malformed base64/JSON
+            return None
+        if expires_at <= now:
+            return None
+
+        with self._lock:
+            self._cache[token] = (user_id, expires_at)
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user_id
+
+
+password_hasher = PasswordHasher(workers=config.AUTH_HASH_WORKERS or None, max_pending=config.AUTH_HASH_MAX_PENDING)
+# The key is loaded (or created) on the first login, not when the module is imported
+session_tokens = SessionTokens(lambda: load_secret(config.SESSION_SECRET_PATH), config.SESSION_TTL_SECONDS,
+                               config.SESSION_CACHE_SIZE)
+
+
+def session_user(authorization: Optional[str] = Header(None)):
+    """
+    FastAPI dependency: the user id from an `Authorization: Bearer <token>` header,
+    or None without one. An invalid or expired token is a 401.
+    """
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    user_id = session_tokens.verify(token.strip()) if scheme.lower() == "bearer" else None
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session", headers={"WWW-Authenticate": "Bearer"})
+    return user_id
+
+
+def authorize(user_id, session_user_id):
+    """
+    Checks that the request may act as `user_id`. Without a token this only
+    passes when AUTH_REQUIRED is off (clients that predate session tokens).
+    """
+    if session_user_id is None:
+        if config.AUTH_REQUIRED:
+            raise HTTPException(status_code=401, detail="Not logged in", headers={"WWW-Authenticate": "Bearer"})
+        return
+    if session_user_id != user_id:
+        raise HTTPException(status_code=403, detail="Session does not belong to this user")
+
+
+def require_admin(session_user_id: Optional[int] = Depends(session_user)):
+    """
+    FastAPI dependency for routes that expose every user's data: the session
+    must belong to one of ADMIN_USER_IDS, whatever AUTH_REQUIRED says.
+    """
+    if session_user_id is None:
+        raise HTTPException(status_code=401, detail="Not logged in", headers={"WWW-Authenticate": "Bearer"})
+    if session_user_id not in config.ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return session_user_id
@@ -0,0 +1,126 @@
+import copy
+import time
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Answer cache keyed by normalized query embeddings.
+
+    A lookup hits when the cosine similarity between the query and a cached
+    question is at least `threshold`. Entries are evicted LRU once `max_entries`
+    is reached, expire after `ttl_seconds`, and are all dropped when the KB
+    index version changes.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=1024, ttl_seconds=3600, version_fn=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_fn = version_fn
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # slot -> (question, value, created_at)
+        self._vectors = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._created = np.zeros(max_entries, dtype=np.float64)
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._version = version_fn() if version_fn else None
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            logger.info("♻️ KB index changed, invalidating semantic cache.")
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._valid[:] = False
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _evict(self, slot):
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def _evict_expired(self):
+        expired = np.flatnonzero(self._valid & (time.monotonic() - self._created > self.ttl_seconds))
+        for slot in expired:
+            self._evict(int(slot))
+
+    def _miss(self):
+        self.misses += 1
+        CACHE_REQUESTS.labels(cache="semantic", result="miss").inc()
+
+    def get(self, embedding):
+        """
+        Returns the cached value for the closest question above the threshold, or None.
+        """
+        with self._lock:
+            self._check_version()
+            # Expired entries go first, so a stale best match cannot hide a fresh one above the threshold
+            self._evict_expired()
+
+            if self._vectors is None or not self._entries:
+                self._miss()
+                return None
+
+            similarities = self._vectors @ np.asarray(embedding, dtype=np.float32)
+            similarities[~self._valid] = -np.inf
+            slot = int(np.argmax(similarities))
+
+            if similarities[slot] < self.threshold:
+                self._miss()
+                return None
+
+            question, value, _ = self._entries[slot]
+            self._entries.move_to_end(slot)
+            self.hits += 1
+            CACHE_REQUESTS.labels(cache="semantic", result="hit").inc()
+            logger.info(f"🎯 Semantic cache hit (similarity {similarities[slot]:.3f}): {question}")
+            # A copy, so callers cannot change what later hits return
+            return copy.deepcopy(value)
+
+    def put(self, question, embedding, value):
+        with self._lock:
+            self._check_version()
+
+            embedding = np.asarray(embedding, dtype=np.float32)
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, embedding.shape[0]), dtype=np.float32)
+
+            if not self._free_slots:
+                lru_slot = next(iter(self._entries))
+                self._evict(lru_slot)
+
+            slot = self._free_slots.pop()
+            self._vectors[slot] = embedding
+            self._valid[slot] = True
+            self._created[slot] = now = time.monotonic()
+            self._entries[slot] = (question, value, now)
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
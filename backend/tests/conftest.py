@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Backend modules import each other by bare name, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# Importing llm_infer needs an API key and opens the chat memory database; keep both away from real ones
+os.environ.setdefault("TOGETHER_API_KEY", "test")
+# A fixed signing key, so no .session_secret file is created in the working tree
+os.environ.setdefault("SESSION_SECRET", "test")
+_scratch = tempfile.mkdtemp(prefix="cyberbot-tests-")
+os.environ.setdefault("CHAT_MEMORY_DB_PATH", os.path.join(_scratch, "chat_memory.db"))
+# Importing answer_retriever opens the embedding cache database
+os.environ.setdefault("EMBEDDING_CACHE_DB_PATH", os.path.join(_scratch, "embedding_cache.db"))
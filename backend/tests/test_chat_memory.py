@@ -0,0 +1,40 @@
+import asyncio
+from chat_memory import ChatMemory
+
+
+def make_memory(tmp_path, **options):
+    return ChatMemory(str(tmp_path / "chat_memory.db"), "system prompt", **options)
+
+
+def test_window_is_token_bounded(tmp_path):
+    async def scenario():
+        memory = make_memory(tmp_path, window_tokens=30)
+        for i in range(10):
+            await memory.append(1, ("user", f"question {i} " + "x" * 40), ("assistant", f"answer {i}"))
+        messages = await memory.messages(1)
+        assert messages[0] == {"role": "system", "content": "system prompt"}
+        assert messages[-1]["content"] == "answer 9"
+        assert sum(len(m["content"]) // 4 for m in messages[1:]) <= 30
+        assert await memory.messages(2) == messages[:1]
+
+    asyncio.run(scenario())
+
+
+def test_compaction_folds_overflow_into_summary(tmp_path):
+    async def summarize(previous, turns):
+        return f"{len(turns)} turns"
+
+    async def scenario():
+        memory = make_memory(tmp_path, window_tokens=20, summary_trigger_tokens=20)
+        for i in range(6):
+            await memory.append(1, ("user", "q" * 40), ("assistant", f"answer {i}"))
+        await memory.compact(1, summarize)
+        messages = await memory.messages(1)
+        assert messages[1]["content"].startswith("Summary of the earlier conversation:")
+        assert messages[-1]["content"] == "answer 5"
+
+        # A second process sees the same state
+        other = make_memory(tmp_path, window_tokens=20)
+        assert await other.messages(1) == messages
+
+    asyncio.run(scenario())
@@ -0,0 +1,20 @@
+import numpy as np
+from embedding_cache import EmbeddingCache
+
+
+def test_hits_by_normalized_text(tmp_path):
+    cache = EmbeddingCache(max_entries=8, db_path=str(tmp_path / "cache.db"))
+    cache.put_many("enc-a", ["What is  XSS?"], [np.ones(4)])
+    assert np.array_equal(cache.get_many("enc-a", ["what is xss?"])[0], np.ones(4, dtype=np.float32))
+
+
+def test_encoders_are_scoped_not_deleted(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    first, second = EmbeddingCache(db_path=db_path), EmbeddingCache(db_path=db_path)
+    first.put_many("enc-a:4d:aaaa", ["question"], [np.ones(4)])
+    second.put_many("enc-a:4d:bbbb", ["question"], [np.zeros(4)])
+
+    # Same question, different model file: neither worker sees the other's vector
+    assert first.get_many("enc-a:4d:aaaa", ["question"])[0].sum() == 4
+    assert EmbeddingCache(db_path=db_path).get_many("enc-a:4d:bbbb", ["question"])[0].sum() == 0
+    assert EmbeddingCache(db_path=db_path).get_many("enc-a:4d:cccc", ["question"]) == [None]
@@ -0,0 +1,128 @@
+import os
+import json
+import fcntl
+import asyncio
+import history_writer
+from history_writer import HistoryWriter, Journal
+
+
+class RecordingWriter(HistoryWriter):
+    """
+    Stores rows in a list instead of the database; `fail` makes every batch fail.
+    """
+
+    def __init__(self, journal_dir, fail=False, **options):
+        super().__init__(batch_size=10, max_wait_ms=10, journal_dir=journal_dir, max_retries=1, **options)
+        self.fail = fail
+        self.written = []
+
+    async def _write(self, rows):
+        if self.fail:
+            raise ConnectionError("database down")
+        self.written.extend(rows)
+        return len(rows)
+
+
+def journal_rows(journal_dir):
+    return [json.loads(line) for segment in sorted(journal_dir.glob("*.ndjson")) for line in segment.open()]
+
+
+def test_rows_are_journaled_until_committed(tmp_path):
+    async def scenario():
+        writer = RecordingWriter(tmp_path)
+        await writer.start()
+        await writer.submit({"question": "q1"})
+        # Journaled before submit() returns, before the batch is written
+        assert journal_rows(tmp_path) == [{"question": "q1"}]
+        await asyncio.sleep(0.1)
+        assert writer.written == [{"question": "q1"}]
+        assert journal_rows(tmp_path) == []
+        await writer.close()
+
+    asyncio.run(scenario())
+
+
+def test_segments_rotate_and_only_unacknowledged_rows_are_recovered(tmp_path):
+    journal = Journal(tmp_path, segment_rows=3)
+    positions = journal.append([{"n": n} for n in range(10)])
+    assert len(list(tmp_path.glob("*.ndjson"))) == 4
+    journal.ack(positions[:3] + positions[4:6])
+    # The first segment is fully acknowledged, so it is gone
+    assert len(list(tmp_path.glob("*.ndjson"))) == 3
+    journal.close()
+
+    successor = Journal(tmp_path)
+    assert [row["n"] for _, row in successor.recover()] == [3, 6, 7, 8, 9]
+    successor.close()
+
+
+def test_deferred_rows_are_replayed_once(tmp_path):
+    async def scenario():
+        full = RecordingWriter(tmp_path, max_queue=2)
+        await full.start()
+        # Journaled together; only two fit in the queue
+        await asyncio.gather(*(full.submit({"n": n}) for n in range(5)))
+        await full.close()
+        assert [row["n"] for row in full.written] == [0, 1]
+
+        restarted = RecordingWriter(tmp_path)
+        await restarted.start()
+        await restarted.close()
+        assert [row["n"] for row in restarted.written] == [2, 3, 4]
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(scenario())
+
+
+def test_unwritten_rows_are_replayed_on_next_start(tmp_path):
+    async def scenario():
+        down = RecordingWriter(tmp_path, fail=True)
+        await down.start()
+        await down.submit({"question": "q1"})
+        await down.submit({"question": "q2"})
+        await down.close(timeout=1.0)
+        assert down.written == []
+
+        up = RecordingWriter(tmp_path)
+        await up.start()
+        await up.close()
+        assert up.written == [{"question": "q1"}, {"question": "q2"}]
+        assert journal_rows(tmp_path) == []
+
+    asyncio.run(scenario())
+
+
+def test_crashed_worker_is_replayed_and_live_worker_is_not(tmp_path):
+    # Journals left by two other workers: 111 has exited, 222 still holds its lock
+    (tmp_path / "111.1.ndjson").write_text('{"question": "crashed"}\n{"question": "committed"}\n{"question": "cut sh')
+    (tmp_path / "111.1.ndjson.ack").write_text("1\n")
+    (tmp_path / "222.1.ndjson").write_text('{"question": "running"}\n')
+    live_lock = os.open(tmp_path / "222.lock", os.O_CREAT | os.O_RDWR)
+    fcntl.flock(live_lock, fcntl.LOCK_EX)
+
+    async def scenario():
+        writer = RecordingWriter(tmp_path)
+        await writer.start()
+        await writer.close()
+        assert writer.written == [{"question": "crashed"}]
+
+    try:
+        asyncio.run(scenario())
+        assert not (tmp_path / "111.1.ndjson").exists()
+        assert journal_rows(tmp_path) == [{"question": "running"}]
+    finally:
+        os.close(live_lock)
+
+
+def test_segment_recovered_by_another_worker_meanwhile_is_skipped(tmp_path, monkeypatch):
+    (tmp_path / "111.1.ndjson").write_text('{"question": "q1"}\n')
+    unacknowledged = history_writer._unacknowledged
+
+    def recovered_elsewhere(segment):
+        segment.unlink()
+        return unacknowledged(segment)
+
+    monkeypatch.setattr(history_writer, "_unacknowledged", recovered_elsewhere)
+    journal = Journal(tmp_path)
+    assert journal.recover() == []
+    journal.close()
@@ -0,0 +1,158 @@
+"""
+AsyncLLMClient against mock_together.py, started in-process on a free port.
+
+    cd backend && python -m pytest tests
+"""
+import time
+import random
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+from aiohttp import web
+from llm_client import AsyncLLMClient, LLMClientError, TokenBucket
+from mock_together import STATS, build_parser, create_app
+
+MESSAGES = [{"role": "user", "content": "What is a vulnerability?"}]
+ANSWER = "A vulnerability is a weakness in a system that an attacker can exploit to compromise its security."
+
+
+@asynccontextmanager
+async def mock_together(*args, **client_options):
+    """
+    Yields (client, stats) for a mock server started with the given CLI arguments.
+    """
+    app = create_app(build_parser().parse_args(["--latency", "0", "--token-delay", "0", *args]))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    options = {"backoff_base": 0.01, "backoff_max": 0.05, "requests_per_second": 1000, "burst": 1000, **client_options}
+    client = AsyncLLMClient(f"http://127.0.0.1:{port}/v1", "test", **options)
+    try:
+        yield client, app[STATS]
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_transient_errors(status):
+    async def scenario():
+        async with mock_together("--fail-first", "2", "--failure-status", str(status)) as (client, stats):
+            response = await client.chat("mock", MESSAGES)
+            assert response.choices[0].message.content == ANSWER
+            assert stats["requests"] == 3
+
+    run(scenario())
+
+
+def test_gives_up_after_max_retries():
+    async def scenario():
+        async with mock_together("--fail-first", "100", max_retries=2) as (client, stats):
+            with pytest.raises(LLMClientError, match="after 3 attempts"):
+                await client.chat("mock", MESSAGES)
+            assert stats["requests"] == 3
+
+    run(scenario())
+
+
+def test_does_not_retry_client_errors():
+    async def scenario():
+        async with mock_together("--fail-first", "1", "--failure-status", "400") as (client, stats):
+            with pytest.raises(LLMClientError, match="HTTP 400"):
+                await client.chat("mock", MESSAGES)
+            assert stats["requests"] == 1
+
+    run(scenario())
+
+
+def test_backoff_is_jittered_and_capped():
+    client = AsyncLLMClient("http://127.0.0.1:9/v1", "test", backoff_base=0.5, backoff_max=4.0)
+    random.seed(0)
+    for attempt in range(6):
+        delays = [client._backoff(attempt) for _ in range(50)]
+        cap = min(4.0, 0.5 * 2 ** attempt)
+        assert all(0 <= delay <= cap for delay in delays)
+        assert len(set(delays)) > 1
+
+
+def test_per_call_deadline():
+    async def scenario():
+        async with mock_together("--latency", "2") as (client, stats):
+            start = time.monotonic()
+            with pytest.raises(LLMClientError):
+                await client.chat("mock", MESSAGES, timeout=0.3)
+            assert time.monotonic() - start < 1.0
+
+    run(scenario())
+
+
+def test_semaphore_caps_concurrent_calls():
+    async def scenario():
+        async with mock_together("--latency", "0.1", max_concurrency=2) as (client, stats):
+            await asyncio.gather(*(client.chat("mock", MESSAGES) for _ in range(6)))
+            assert stats["requests"] == 6
+            assert stats["max_in_flight"] == 2
+
+    run(scenario())
+
+
+def test_token_bucket_limits_request_rate():
+    async def scenario():
+        async with mock_together(requests_per_second=10, burst=2) as (client, stats):
+            await asyncio.gather(*(client.chat("mock", MESSAGES) for _ in range(6)))
+            # Two requests fit the burst, the other four wait 0.1 s each for a token
+            assert stats["started"][-1] - stats["started"][0] >= 0.35
+
+    run(scenario())
+
+
+def test_token_bucket_refills():
+    async def scenario():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert 0.09 <= run(scenario()) < 0.5
+
+
+def test_stream_chat_parses_sse():
+    async def scenario():
+        async with mock_together() as (client, stats):
+            tokens = [token async for token in client.stream_chat("mock", MESSAGES)]
+            assert len(tokens) == len(ANSWER.split(" "))
+            assert "".join(tokens).strip() == ANSWER
+
+    run(scenario())
+
+
+def test_stream_chat_retries_connection_setup():
+    async def scenario():
+        async with mock_together("--fail-first", "1", "--failure-status", "429") as (client, stats):
+            tokens = [token async for token in client.stream_chat("mock", MESSAGES)]
+            assert "".join(tokens).strip() == ANSWER
+            assert stats["requests"] == 2
+
+    run(scenario())
+
+
+def test_stream_chat_error_mid_stream():
+    async def scenario():
+        async with mock_together("--stream-error-after", "3") as (client, stats):
+            tokens = []
+            with pytest.raises(LLMClientError, match="mock stream failure"):
+                async for token in client.stream_chat("mock", MESSAGES):
+                    tokens.append(token)
+            # Tokens already yielded stay with the caller; the stream is not retried
+            assert tokens == [word + " " for word in ANSWER.split(" ")[:3]]
+            assert stats["requests"] == 1
+
+    run(scenario())
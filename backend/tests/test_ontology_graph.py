@@ -0,0 +1,32 @@
+from ontology_graph import OntologyGraph
+from ontology_validator import local_decision
+
+graph = OntologyGraph()
+
+
+def decide(question, answer, pass_score=1.0, fail_score=0.0, min_evidence=3):
+    return local_decision(graph.grounding(question, answer), pass_score, fail_score, min_evidence)
+
+
+def test_generic_words_are_not_evidence():
+    grounding = graph.grounding(
+        "Who won the last World Cup?",
+        "The World Cup uses a group system; each team needs a good tool for attack and defense.",
+    )
+    assert grounding["evidence"] == 0
+    assert grounding["score"] == 0
+
+
+def test_specific_related_entities_pass():
+    assert decide("What techniques are used for load distribution in cloud computing?",
+                  "Load balancing and auto-scaling are common techniques.") == "Pass"
+
+
+def test_sparse_matches_go_to_the_llm():
+    assert decide("What is phishing?", "Phishing tricks users into revealing credentials.") is None
+    assert decide("What is a CVE?", "A CVE is a public identifier for a disclosed security flaw.") is None
+
+
+def test_unrelated_specific_entities_fail():
+    assert decide("What does GDPR Compliance require from a cloud provider?",
+                  "SQL injection, theft and intrusion are the most common attacks on a web app.") == "Not Pass"
@@ -0,0 +1,33 @@
+from ontology_precheck import OntologyPrecheck
+
+
+def stream(precheck, answer):
+    """
+    Feeds the answer in small chunks; returns how many chars were fed when it became grounded.
+    """
+    for i in range(0, len(answer), 3):
+        if precheck.feed(answer[i:i + 3]):
+            return i + 3
+    precheck.finish()
+    return None
+
+
+def test_question_terms_alone_do_not_ground():
+    precheck = OntologyPrecheck("How does SQL injection attack a web application system?")
+    assert not precheck.grounded
+    assert stream(precheck, "") is None
+
+
+def test_generic_words_do_not_ground():
+    precheck = OntologyPrecheck("What is the capital of France?")
+    assert stream(precheck, "The system uses a tool for attack") is None
+    assert precheck.validation() is None
+
+
+def test_related_entities_ground_before_the_answer_ends():
+    precheck = OntologyPrecheck("What techniques are used for load distribution in cloud computing?")
+    answer = "Load balancing and auto-scaling are common techniques, often managed with a lot of configuration."
+    grounded_at = stream(precheck, answer)
+    assert grounded_at is not None and grounded_at < len(answer)
+    assert precheck.validation()["validation_result"] == "Pass"
+    assert precheck.result()["related_entities"] == ["auto-scaling", "load balancing"]
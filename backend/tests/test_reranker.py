@@ -0,0 +1,44 @@
+import time
+import numpy as np
+from reranker import CrossEncoderReranker
+
+
+class LengthModel:
+    """
+    Scores a pair by the candidate's length, taking `delay` seconds per call.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    def predict(self, pairs, batch_size):
+        time.sleep(self.delay)
+        self.calls.append(pairs)
+        return np.array([float(len(text)) for _, text in pairs])
+
+
+def make_reranker(model, batch_size=2):
+    reranker = CrossEncoderReranker.__new__(CrossEncoderReranker)
+    reranker.model, reranker.batch_size, reranker.name = model, batch_size, "test"
+    return reranker
+
+
+def test_fully_scored_queries_keep_top_n():
+    ranked, fallbacks = make_reranker(LengthModel()).rerank(["q"], [["a", "ccc", "bb"]], top_n=2, budget_seconds=1.0)
+    assert ranked == [["ccc", "bb"]]
+    assert fallbacks == []
+
+
+def test_batched_queries_share_the_budget_evenly():
+    model = LengthModel(delay=0.02)
+    candidates = [[f"q{q}-{'x' * i}" for i in range(6)] for q in range(3)]
+    ranked, fallbacks = make_reranker(model).rerank(["a", "b", "c"], candidates, top_n=2, budget_seconds=0.05)
+
+    # Interleaved by rank: the first batch mixes queries instead of finishing the first one
+    assert {pair[0] for pair in model.calls[0]} == {"a", "b"}
+    assert fallbacks == [0, 1, 2]
+    for texts, result in zip(candidates, ranked):
+        # Nothing is dropped: scored candidates first, the rest in first-stage order
+        assert sorted(result) == sorted(texts)
+        assert result[-1] == texts[-1]
@@ -0,0 +1,41 @@
+import time
+import asyncio
+import retrieval_batcher
+from retrieval_batcher import RetrievalBatcher
+
+
+def test_close_cancels_callers_instead_of_leaving_them_waiting(monkeypatch):
+    def slow_retrieve_batch(queries, top_k):
+        time.sleep(0.2)
+        return [f"prompt for {q}" for q in queries], [None] * len(queries)
+
+    monkeypatch.setattr(retrieval_batcher, "retrieve_batch", slow_retrieve_batch)
+
+    async def scenario():
+        batcher = RetrievalBatcher(max_batch_size=2, max_wait_ms=1)
+        calls = [asyncio.create_task(batcher.retrieve(q)) for q in ("a", "b", "c")]
+        await asyncio.sleep(0.05)  # "a" and "b" are being retrieved, "c" is queued
+        await batcher.close()
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 1.0)
+        assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_batches_concurrent_queries(monkeypatch):
+    batches = []
+
+    def record(queries, top_k):
+        batches.append(list(queries))
+        return [f"prompt for {q}" for q in queries], [None] * len(queries)
+
+    monkeypatch.setattr(retrieval_batcher, "retrieve_batch", record)
+
+    async def scenario():
+        batcher = RetrievalBatcher(max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(*(batcher.retrieve(q) for q in ("a", "b")))
+        await batcher.close()
+        return results
+
+    assert [prompt for prompt, _ in asyncio.run(scenario())] == ["prompt for a", "prompt for b"]
+    assert batches == [["a", "b"]]
@@ -0,0 +1,34 @@
+import pytest
+from fastapi import HTTPException
+import config
+from security import SessionTokens, require_admin
+
+
+def test_tokens_round_trip_and_reject_tampering():
+    tokens = SessionTokens(b"secret", ttl_seconds=60)
+    token = tokens.issue(7)
+    assert tokens.verify(token) == 7
+    assert tokens.verify(token[:-2] + "xx") is None
+    assert tokens.verify("é.é") is None
+    assert SessionTokens(b"other").verify(token) is None
+
+
+def test_admin_routes_need_an_admin_session(monkeypatch):
+    monkeypatch.setattr(config, "ADMIN_USER_IDS", {1})
+    monkeypatch.setattr(config, "AUTH_REQUIRED", False)
+    assert require_admin(1) == 1
+    with pytest.raises(HTTPException) as error:
+        require_admin(2)
+    assert error.value.status_code == 403
+    # No legacy token-less access, even with AUTH_REQUIRED off
+    with pytest.raises(HTTPException) as error:
+        require_admin(None)
+    assert error.value.status_code == 401
+
+
+def test_secret_is_loaded_on_first_use():
+    calls = []
+    tokens = SessionTokens(lambda: calls.append(1) or b"lazy")
+    assert calls == []
+    assert tokens.verify(tokens.issue(3)) == 3
+    assert calls == [1]
@@ -1,9 +1,16 @@
 import os
-import glob
+import sys
+import json
+import queue
+import hashlib
 import logging
+import argparse
+import threading
+import multiprocessing
 import PyPDF2
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 from pathlib import Path
 
@@ -11,10 +18,16 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Directory containing PDF files
+# Directory containing PDF files, and where the chunk store is written
 ROOT_DIR = Path(__file__).resolve().parent
 KB_DIRECTORY = ROOT_DIR / "dataset" / "kb"
-PDF_FILES = glob.glob(os.path.join(KB_DIRECTORY, "*.pdf"))
+DOC_STORE_DIR = ROOT_DIR / "backend" / "doc_store"
+CHECKPOINT_NAME = "checkpoint.json"
+MODEL_NAME = 'BAAI/bge-large-en-v1.5'
+METADATA_COLUMNS = ["content", "source", "page_number", "category"]
+
+sys.path.insert(0, str(ROOT_DIR / "backend"))
+from metadata_store import write_store, save_array
 
 # Define chunking function
 def chunk_text(text: str, chunk_size: int = 500) -> List[str]:
@@ -51,86 +64,255 @@ class Document:
         self.source = source
         self.page_number = page_number
         self.category = category
-        self.embedding = None  # Placeholder for embedding
 
-# Process PDFs and create document chunks
-documents = []
-for pdf_path in PDF_FILES:
-    logger.info(f"Processing: {os.path.basename(pdf_path)}")
+    def as_record(self):
+        return {"content": self.content, "source": self.source, "page_number": self.page_number, "category": self.category}
 
+def count_pages(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def extract_pages(pdf_path, start, end, chunk_size=500):
+    """
+    Extracts and chunks pages [start, end) of a PDF. Runs in a worker process.
+    """
+    documents = []
     with open(pdf_path, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
+        for page_num in range(start, end):
+            text = pdf_reader.pages[page_num].extract_text() or ""
+            for chunk in chunk_text(text, chunk_size):
+                documents.append(Document(content=chunk, source=os.path.basename(pdf_path), page_number=page_num + 1))
+    return documents
+
+def fingerprint(pdf_path):
+    stat = os.stat(pdf_path)
+    return [stat.st_size, stat.st_mtime_ns]
 
-        for page_num in range(len(pdf_reader.pages)):
-            text = pdf_reader.pages[page_num].extract_text()
-            chunks = chunk_text(text)
+class Checkpoint:
+    """
+    Per-file progress, saved after every completed file:
+    {"settings": {...}, "files": {name: {"fingerprint": [size, mtime], "shards": [...], "chunks": n}}}
+    Files appear in completion order, which is also the row order of the chunk store.
+    """
 
-            logger.info(f"Page {page_num + 1}: {len(chunks)} chunks created.")
+    def __init__(self, path, settings, restart=False):
+        self.path = Path(path)
+        self.settings = settings
+        self.files = {}
+        if self.path.exists() and not restart:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            if state.get("settings") == settings:
+                self.files = state.get("files", {})
+            else:
+                logger.info("Chunking settings or model changed, starting over.")
 
-            for chunk in chunks:
-                doc = Document(
-                    content=chunk,
-                    source=os.path.basename(pdf_path),
-                    page_number=page_num + 1
-                )
-                documents.append(doc)
+    def is_done(self, name, file_fingerprint):
+        entry = self.files.get(name)
+        return entry is not None and entry["fingerprint"] == file_fingerprint
 
-logger.info(f"Total documents created: {len(documents)}")
+    def mark_done(self, name, file_fingerprint, shards, chunks):
+        self.files[name] = {"fingerprint": file_fingerprint, "shards": shards, "chunks": chunks}
+        self.save()
 
-# Display sample chunks
-for i in range(min(3, len(documents))):
-    logger.info(f"Document {i+1}:")
-    logger.info(f"Source: {documents[i].source}")
-    logger.info(f"Page: {documents[i].page_number}")
-    logger.info(f"Content preview: {documents[i].content[:200]}...")
+    def forget(self, name):
+        return self.files.pop(name, {}).get("shards", [])
 
-# Initialize the embedding model
-logger.info("Loading embedding model...")
-model = SentenceTransformer('BAAI/bge-large-en-v1.5')
+    def save(self):
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"settings": self.settings, "files": self.files}, f, indent=4)
+        os.replace(tmp_path, self.path)
 
-def create_embeddings_batch(docs, batch_size=8):
+class FileShards:
     """
-    Generates embeddings for document chunks in batches.
+    Buffers the embedded chunks of one PDF and writes them out every `shard_size` chunks.
     """
-    logger.info(f"Creating embeddings for {len(docs)} documents in batches of {batch_size}")
 
-    for i in range(0, len(docs), batch_size):
-        batch = docs[i:i + batch_size]
-        texts = [doc.content for doc in batch]
+    def __init__(self, output_dir, name, shard_size):
+        self.output_dir = output_dir
+        self.prefix = hashlib.blake2b(name.encode("utf-8"), digest_size=6).hexdigest()
+        self.shard_size = shard_size
+        self.vectors, self.records, self.shards = [], [], []
+        self.chunks = 0
 
-        # Generate embeddings
-        embeddings = model.encode(texts, normalize_embeddings=True)
+    def add(self, document, embedding):
+        self.vectors.append(embedding)
+        self.records.append(document.as_record())
+        self.chunks += 1
+        if len(self.records) >= self.shard_size:
+            self.flush()
 
-        # Assign embeddings to documents
-        for doc, embedding in zip(batch, embeddings):
-            doc.embedding = embedding
+    def flush(self):
+        if not self.records:
+            return
+        shard = f"{self.prefix}-{len(self.shards):05d}"
+        save_array(np.stack(self.vectors).astype(np.float32), self.output_dir / f"{shard}.npy")
+        write_store(self.records, self.output_dir / f"{shard}.records", columns=METADATA_COLUMNS)
+        self.shards.append(shard)
+        self.vectors, self.records = [], []
 
-        logger.info(f"Processed batch {i//batch_size + 1}, documents {i} to {min(i+batch_size, len(docs))}")
+def remove_stale_shards(output_dir, checkpoint, pdf_files):
+    """
+    Forgets files that were deleted or modified, and deletes shards no checkpoint entry refers to
+    (left behind by an interrupted run).
+    """
+    current = {pdf.name: fingerprint(pdf) for pdf in pdf_files}
+    for name in list(checkpoint.files):
+        if not checkpoint.is_done(name, current.get(name)):
+            checkpoint.forget(name)
+    checkpoint.save()
+
+    referenced = {shard for entry in checkpoint.files.values() for shard in entry["shards"]}
+    for path in list(output_dir.glob("*-[0-9][0-9][0-9][0-9][0-9].npy")) + list(output_dir.glob("*-[0-9][0-9][0-9][0-9][0-9].records")):
+        if path.stem not in referenced:
+            path.unlink()
+
+def load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(MODEL_NAME)
 
-        # Print shape of first embedding in batch as a sanity check
-        if i == 0:
-            logger.info(f"Embedding shape: {embeddings[0].shape}")
+def embed_worker(chunk_queue, model, output_dir, checkpoint, batch_size, shard_size):
+    """
+    Consumes ("chunks", name, docs) / ("done", name, fingerprint) / ("failed", name) items,
+    embeds chunks in large batches across files and checkpoints each finished file.
+    """
+    pending = []   # (name, document) waiting for the next batch
+    writers = {}
 
-# Generate embeddings for all documents
-create_embeddings_batch(documents)
+    def embed(count):
+        batch, pending[:] = pending[:count], pending[count:]
+        embeddings = model.encode([doc.content for _, doc in batch], batch_size=batch_size, normalize_embeddings=True)
+        for (name, doc), embedding in zip(batch, embeddings):
+            writers[name].add(doc, embedding)
 
-# Verify embeddings
-logger.info("Embedding verification:")
-logger.info(f"First document embedding shape: {documents[0].embedding.shape}")
-logger.info(f"First document embedding sample: {documents[0].embedding[:5]}...")
+    while True:
+        item = chunk_queue.get()
+        if item is None:
+            break
 
-# Save embeddings for later use
-np.save("document_embeddings.npy", np.array([doc.embedding for doc in documents]))
-logger.info("Embeddings saved to document_embeddings.npy")
+        kind, name = item[0], item[1]
+        if kind == "chunks":
+            writers.setdefault(name, FileShards(output_dir, name, shard_size))
+            pending.extend((name, doc) for doc in item[2])
+            while len(pending) >= batch_size:
+                embed(batch_size)
+        elif kind == "done":
+            if pending:
+                embed(len(pending))
+            writer = writers.pop(name, None) or FileShards(output_dir, name, shard_size)
+            writer.flush()
+            checkpoint.mark_done(name, item[2], writer.shards, writer.chunks)
+            logger.info(f"✅ {name}: {writer.chunks} chunks in {len(writer.shards)} shards.")
+        elif kind == "failed":
+            pending[:] = [(n, doc) for n, doc in pending if n != name]
+            writers.pop(name, None)
 
-# Save metadata
-import json
-metadata = [
-    {"content": doc.content, "source": doc.source, "page_number": doc.page_number, "category": doc.category}
-    for doc in documents
-]
-with open("document_metadata.json", "w") as f:
-    json.dump(metadata, f, indent=4)
-logger.info("Metadata saved to document_metadata.json")
-
-logger.info("✅ PDF processing and embedding generation completed!")
+def page_tasks(pdf_files, pages_per_task):
+    """
+    Yields (pdf_path, start, end, is_last_task_of_file), opening PDFs lazily.
+    """
+    for pdf_path in pdf_files:
+        try:
+            pages = count_pages(pdf_path)
+        except Exception as e:
+            logger.error(f"❌ Could not read {pdf_path.name}: {e}")
+            continue
+        logger.info(f"Processing: {pdf_path.name} ({pages} pages)")
+        if pages == 0:
+            yield pdf_path, 0, 0, True
+        for start in range(0, pages, pages_per_task):
+            end = min(start + pages_per_task, pages)
+            yield pdf_path, start, end, end == pages
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chunk and embed lecture PDFs into an on-disk chunk store.")
+    parser.add_argument("--input-dir", type=Path, default=KB_DIRECTORY)
+    parser.add_argument("--output-dir", type=Path, default=DOC_STORE_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes extracting and chunking pages")
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding batch")
+    parser.add_argument("--queue-size", type=int, default=64, help="Page tasks buffered ahead of the embedder")
+    parser.add_argument("--shard-size", type=int, default=4096, help="Chunks per on-disk shard")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-ingest every PDF")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    pdf_files = sorted(args.input_dir.glob("*.pdf"))
+    checkpoint = Checkpoint(args.output_dir / CHECKPOINT_NAME,
+                            {"model": MODEL_NAME, "chunk_size": args.chunk_size}, restart=args.restart)
+    remove_stale_shards(args.output_dir, checkpoint, pdf_files)
+
+    todo = [pdf for pdf in pdf_files if not checkpoint.is_done(pdf.name, fingerprint(pdf))]
+    logger.info(f"{len(pdf_files) - len(todo)} PDFs up to date, {len(todo)} to process.")
+    if not todo:
+        sys.exit(0)
+
+    # Spawned (not forked) workers only import PyPDF2, never the embedding model
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        logger.info("Loading embedding model...")
+        model = load_model()
+
+        chunk_queue = queue.Queue(maxsize=args.queue_size)
+        errors = []
+
+        def run_embedder():
+            try:
+                embed_worker(chunk_queue, model, args.output_dir, checkpoint, args.batch_size, args.shard_size)
+            except Exception as e:
+                logger.exception("❌ Embedding failed")
+                errors.append(e)
+
+        embedder = threading.Thread(target=run_embedder, daemon=True)
+        embedder.start()
+
+        def put(item):
+            # Blocks while the embedder is behind, so extraction never runs far ahead of it
+            while True:
+                try:
+                    chunk_queue.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if not embedder.is_alive():
+                        raise RuntimeError("Embedding thread stopped unexpectedly")
+
+        failed = set()
+
+        def drain(in_flight):
+            future, pdf_path, last = in_flight.popleft()
+            if pdf_path.name in failed:
+                return
+            try:
+                documents = future.result()
+            except Exception as e:
+                logger.error(f"❌ Failed to extract {pdf_path.name}: {e}")
+                failed.add(pdf_path.name)
+                put(("failed", pdf_path.name))
+                return
+            put(("chunks", pdf_path.name, documents))
+            if last:
+                put(("done", pdf_path.name, fingerprint(pdf_path)))
+
+        # Results are consumed in submission order with at most `workers * 2` tasks in flight
+        in_flight = deque()
+        for pdf_path, start, end, last in page_tasks(todo, args.pages_per_task):
+            in_flight.append((pool.submit(extract_pages, str(pdf_path), start, end, args.chunk_size), pdf_path, last))
+            if len(in_flight) >= args.workers * 2:
+                drain(in_flight)
+        while in_flight:
+            drain(in_flight)
+
+        put(None)
+        embedder.join()
+
+    if errors:
+        logger.error("Stopped early; completed files are checkpointed and the next run resumes from there.")
+        sys.exit(1)
+
+    total = sum(entry["chunks"] for entry in checkpoint.files.values())
+    logger.info(f"✅ PDF processing and embedding generation completed: {total} chunks in {args.output_dir}")
@@ -1,15 +1,304 @@
+import os
+import argparse
+import json
+import time
 import faiss
 import numpy as np
 from pathlib import Path
 
-# Load document and QA embeddings
 ROOT_DIR = Path(__file__).resolve().parent
-qa_embeddings = np.load(ROOT_DIR / "backend" / "qa_embeddings.npy").astype(np.float32)
+BACKEND_DIR = ROOT_DIR / "backend"
 
-# Create FAISS indexes
-dimension = qa_embeddings.shape[1]
-qa_index = faiss.IndexFlatL2(dimension)
-qa_index.add(qa_embeddings)
-faiss.write_index(qa_index, "qa_faiss.index")
+INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
 
-print("✅ QA FAISS indexes stored.")
+
+def manifest_path_for(index_path):
+    """
+    The manifest lives next to the index, e.g. qa_faiss.index -> qa_faiss.manifest.json
+    """
+    return Path(index_path).with_suffix(".manifest.json")
+
+
+def ids_path_for(index_path):
+    """
+    Sidecar with the (stable id, content hash) pairs the index was built from, e.g. qa_faiss.ids.npy
+    """
+    return Path(index_path).with_suffix(".ids.npy")
+
+
+def base_index(index):
+    """
+    The index wrapped by an IndexIDMap, or the index itself.
+    """
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def build_index(embeddings, index_type="flat", nlist=64, pq_m=16, pq_nbits=8, hnsw_m=32, ef_construction=200, ids=None):
+    """
+    Builds an inner-product FAISS index over L2-normalized embeddings.
+    With `ids`, vectors are stored under those stable int64 ids (IndexIDMap2)
+    so that later runs can remove and re-add single rows.
+    """
+    dimension = embeddings.shape[1]
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "ivf":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+    elif index_type == "ivfpq":
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, hnsw_m, metric)
+        index.hnsw.efConstruction = ef_construction
+    else:
+        raise ValueError(f"❌ Unknown index type: {index_type}")
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is not None:
+        index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    return index
+
+
+def update_index(index, indexed_ids, current_ids, embeddings):
+    """
+    Applies the difference between two (id, content hash) tables to an IndexIDMap2 in place:
+    removed and changed rows are deleted, new and changed rows are added.
+    Returns (added, removed) counts. Raises RuntimeError if the index cannot remove vectors (HNSW).
+    """
+    indexed = dict(zip(indexed_ids[:, 0].tolist(), indexed_ids[:, 1].tolist()))
+    current = dict(zip(current_ids[:, 0].tolist(), current_ids[:, 1].tolist()))
+
+    to_remove = [i for i, h in indexed.items() if current.get(i) != h]
+    to_add = [row for row, (i, h) in enumerate(current_ids.tolist()) if indexed.get(i) != h]
+
+    if to_remove:
+        index.remove_ids(np.array(to_remove, dtype=np.int64))
+    if to_add:
+        vectors = np.ascontiguousarray(embeddings[to_add], dtype=np.float32)
+        index.add_with_ids(vectors, np.ascontiguousarray(current_ids[to_add, 0], dtype=np.int64))
+    return len(to_add), len(to_remove)
+
+
+def write_index(index, index_path):
+    """
+    Writes through a temporary file; the backend may have the old index memory-mapped.
+    """
+    tmp_path = Path(index_path).with_suffix(f".{os.getpid()}.tmp")
+    faiss.write_index(index, str(tmp_path))
+    os.replace(tmp_path, index_path)
+
+
+def apply_search_params(index, nprobe=None, ef_search=None):
+    """
+    Sets query-time parameters; values that do not apply to the index type are ignored.
+    """
+    params = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", int(nprobe))
+    if ef_search is not None and isinstance(base_index(index), faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", int(ef_search))
+
+
+def load_doc_store(doc_store):
+    """
+    Returns the chunk embeddings of a doc-chunking.py store in row order, and the
+    (shard, row count) list that maps index rows back to chunk metadata.
+    """
+    with open(Path(doc_store) / "checkpoint.json", "r") as f:
+        files = json.load(f)["files"]
+
+    shards, arrays = [], []
+    for entry in files.values():
+        for name in entry["shards"]:
+            embeddings = np.load(Path(doc_store) / f"{name}.npy", mmap_mode="r")
+            shards.append([name, len(embeddings)])
+            arrays.append(embeddings)
+    if not arrays:
+        raise ValueError(f"❌ No chunks in {doc_store}, run doc-chunking.py first")
+    return np.concatenate(arrays).astype(np.float32), shards
+
+
+def write_manifest(index_path, index, args, changes=None, doc_shards=None):
+    manifest = {
+        "index_type": args.type,
+        "metric": "inner_product",
+        "dimension": index.d,
+        "ntotal": index.ntotal,
+        "build_params": {
+            "nlist": args.nlist,
+            "pq_m": args.pq_m,
+            "pq_nbits": args.pq_nbits,
+            "hnsw_m": args.hnsw_m,
+            "ef_construction": args.ef_construction,
+        },
+        "search_params": {"nprobe": args.nprobe, "efSearch": args.ef_search},
+        "embeddings": str(args.embeddings),
+        "id_map": isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)),
+        "built_at": time.time(),
+    }
+    if doc_shards is not None:
+        manifest["embeddings"] = str(args.doc_store)
+        manifest["doc_shards"] = doc_shards
+    if changes is not None:
+        manifest["last_update"] = {"added": changes[0], "removed": changes[1]}
+
+    # The manifest is written last: the backend hot-swaps the index when it changes
+    manifest_path = manifest_path_for(index_path)
+    tmp_path = manifest_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def measure(index, queries, k):
+    start = time.perf_counter()
+    _, indices = index.search(queries, k)
+    elapsed = time.perf_counter() - start
+    return indices, elapsed * 1000 / len(queries)
+
+
+def recall_at_k(truth, found):
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def report(index, embeddings, args, ids=None):
+    """
+    Prints recall@k and mean per-query latency of the built index against the flat baseline.
+    """
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(embeddings), size=min(args.report_queries, len(embeddings)), replace=False)
+    queries = np.ascontiguousarray(embeddings[sample])
+
+    baseline = build_index(embeddings, "flat")
+    truth, flat_ms = measure(baseline, queries, args.k)
+    if ids is not None:
+        # The built index returns stable ids, the baseline returns row numbers
+        truth = ids[truth]
+
+    print(f"\n📊 recall@{args.k} vs. latency over {len(queries)} queries (baseline: flat, {flat_ms:.3f} ms/query)")
+    print(f"{'index':<10}{'setting':<16}{'recall':>10}{'ms/query':>12}")
+
+    if args.type == "hnsw":
+        sweep = [("efSearch", v) for v in args.sweep]
+    elif args.type in ("ivf", "ivfpq"):
+        sweep = [("nprobe", v) for v in args.sweep if v <= args.nlist]
+    else:
+        sweep = [("-", None)]
+
+    for name, value in sweep:
+        if name == "nprobe":
+            apply_search_params(index, nprobe=value)
+        elif name == "efSearch":
+            apply_search_params(index, ef_search=value)
+        found, ms = measure(index, queries, args.k)
+        setting = f"{name}={value}" if value is not None else "exact"
+        print(f"{args.type:<10}{setting:<16}{recall_at_k(truth, found):>10.3f}{ms:>12.3f}")
+
+    # Restore the configured search parameters before the index is written
+    apply_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the QA FAISS index and its manifest.")
+    parser.add_argument("--type", choices=INDEX_TYPES, default="flat", help="Index type to build")
+    parser.add_argument("--embeddings", type=Path, default=BACKEND_DIR / "qa_embeddings.npy")
+    parser.add_argument("--ids", type=Path, default=BACKEND_DIR / "qa_ids.npy",
+                        help="(stable id, content hash) per embedding row, written by qapair-embedder.py")
+    parser.add_argument("--doc-store", type=Path, default=None,
+                        help="Index the PDF chunks written by doc-chunking.py (e.g. backend/doc_store) instead of the QA pairs")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Defaults to backend/qa_faiss.index, or backend/doc_faiss.index with --doc-store")
+    parser.add_argument("--update", action="store_true",
+                        help="Apply added/changed/removed rows to the existing index instead of rebuilding it")
+    parser.add_argument("--nlist", type=int, default=64, help="IVF: number of inverted lists")
+    parser.add_argument("--pq-m", type=int, default=16, help="IVF-PQ: number of sub-quantizers")
+    parser.add_argument("--pq-nbits", type=int, default=8, help="IVF-PQ: bits per sub-quantizer code")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW: neighbours per node")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW: build-time beam width")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF: lists visited per query")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW: query-time beam width")
+    parser.add_argument("--report", action="store_true", help="Print a recall@k vs. latency report")
+    parser.add_argument("--k", type=int, default=3, help="k used for the recall report")
+    parser.add_argument("--report-queries", type=int, default=500)
+    parser.add_argument("--sweep", type=lambda s: [int(v) for v in s.split(",")], default=[1, 4, 8, 16, 32, 64, 128],
+                        help="Comma-separated nprobe/efSearch values for the report")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = BACKEND_DIR / ("doc_faiss.index" if args.doc_store else "qa_faiss.index")
+    return args
+
+
+def load_for_update(args):
+    """
+    Returns the existing index and the id table it was built from, or None if it cannot be updated in place.
+    """
+    ids_path = ids_path_for(args.output)
+    if not (args.output.exists() and ids_path.exists() and manifest_path_for(args.output).exists()):
+        return None
+    with open(manifest_path_for(args.output), "r") as f:
+        manifest = json.load(f)
+    if manifest.get("index_type") != args.type or not manifest.get("id_map"):
+        return None
+    return faiss.read_index(str(args.output)), np.load(ids_path)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Load QA embeddings and their stable ids, or the document chunk embeddings (row ids)
+    doc_shards = None
+    if args.doc_store:
+        qa_embeddings, doc_shards = load_doc_store(args.doc_store)
+        qa_ids = None
+    else:
+        qa_embeddings = np.load(args.embeddings, mmap_mode="r")
+        qa_ids = np.load(args.ids) if args.ids.exists() else None
+        if qa_ids is not None and len(qa_ids) != len(qa_embeddings):
+            raise ValueError(f"❌ {args.ids} does not match {args.embeddings}, re-run qapair-embedder.py")
+
+    qa_index, changes = None, None
+    existing = load_for_update(args) if args.update and qa_ids is not None else None
+    if args.update and existing is None:
+        print("⚠️ No id-mapped index of this type to update, rebuilding from scratch.")
+    if existing is not None:
+        qa_index, indexed_ids = existing
+        try:
+            changes = update_index(qa_index, indexed_ids, qa_ids, qa_embeddings)
+            print(f"⚡ Incremental update: {changes[0]} vectors added, {changes[1]} removed.")
+        except RuntimeError as e:
+            print(f"⚠️ {args.type} index cannot be updated in place ({e}), rebuilding from scratch.")
+            qa_index, changes = None, None
+
+    # Create FAISS index
+    if qa_index is None:
+        qa_index = build_index(
+            np.ascontiguousarray(qa_embeddings, dtype=np.float32), args.type,
+            nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits,
+            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+            ids=qa_ids[:, 0] if qa_ids is not None else None,
+        )
+    apply_search_params(qa_index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+    if args.report:
+        report(qa_index, np.ascontiguousarray(qa_embeddings, dtype=np.float32), args,
+               ids=qa_ids[:, 0] if qa_ids is not None else None)
+
+    write_index(qa_index, args.output)
+    if qa_ids is not None:
+        np.save(ids_path_for(args.output), qa_ids)
+    write_manifest(args.output, qa_index, args, changes, doc_shards)
+
+    print(f"✅ {'Document' if args.doc_store else 'QA'} FAISS index ({args.type}, {qa_index.ntotal} vectors) stored at {args.output}")
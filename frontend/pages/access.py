@@ -85,6 +85,7 @@ with tab1:
 
                     if "user_id" in data:
                         st.session_state["user_id"] = data["user_id"]
+                        st.session_state["token"] = data.get("token")
                         print(f"✅ Debug: Stored user_id = {st.session_state['user_id']}")
 
                         # Reset chat history state so it reloads fresh in chat UI
@@ -142,6 +143,7 @@ with tab2:
                         # ✅ Store `user_id` after signup
                         if "user_id" in data:
                             st.session_state["user_id"] = data["user_id"]
+                            st.session_state["token"] = data.get("token")
                             print(f"✅ Debug: Stored user_id after signup: {st.session_state['user_id']}")
                         else:
                             print("❌ Debug: `user_id` missing from signup response.")
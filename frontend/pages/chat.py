@@ -3,6 +3,7 @@ import requests
 import json
 
 API_URL = "http://127.0.0.1:8000"
+HISTORY_PAGE_SIZE = 20
 
 st.set_page_config(
     page_title="CyberBOT - Chat",
@@ -20,27 +21,36 @@ if "user_id" not in st.session_state or not st.session_state["user_id"]:
     st.stop()
 
 user_id = st.session_state["user_id"]
-
-# 🔄 Load stored Q/A history from DB only if it's not loaded OR user switched
+# Session token from /login or /register, sent with every request made on the user's behalf
+auth_headers = {"Authorization": f"Bearer {st.session_state['token']}"} if st.session_state.get("token") else {}
+
+def load_history_page(cursor=None):
+    """
+    Fetches one page of stored Q/A pairs, newest first. Returns (chats oldest first, next cursor).
+    """
+    params = {"limit": HISTORY_PAGE_SIZE, "fields": "question,answer"}
+    if cursor is not None:
+        params["after_id"] = cursor
+    history_response = requests.get(f"{API_URL}/questions/{user_id}", params=params, headers=auth_headers)
+    if history_response.status_code == 404:  # No stored history yet
+        return [], None
+    history_response.raise_for_status()
+    data = history_response.json()
+    chats = [{"user": qa["question"], "bot": qa["answer"]} for qa in reversed(data["items"])]
+    return chats, data["next_cursor"]
+
+# 🔄 Load the most recent page of stored Q/A history only if it's not loaded OR user switched
 if (
     "chat_history" not in st.session_state
     or "last_loaded_user_id" not in st.session_state
     or st.session_state["last_loaded_user_id"] != user_id
 ):
     try:
-        history_response = requests.get(f"{API_URL}/questions/{user_id}")
-        if history_response.status_code == 200:
-            data = history_response.json()
-            st.session_state["chat_history"] = [{"user": qa["question"], "bot": qa["answer"]} for qa in data]
-            st.session_state["last_loaded_user_id"] = user_id  # ✅ Mark which user's history was loaded
-        else:
-            st.warning("⚠️ Could not load stored chat history from server.")
-            st.session_state["chat_history"] = []
-            st.session_state["last_loaded_user_id"] = user_id
+        st.session_state["chat_history"], st.session_state["history_cursor"] = load_history_page()
     except Exception as e:
         st.warning(f"⚠️ Error loading history: {e}")
-        st.session_state["chat_history"] = []
-        st.session_state["last_loaded_user_id"] = user_id
+        st.session_state["chat_history"], st.session_state["history_cursor"] = [], None
+    st.session_state["last_loaded_user_id"] = user_id  # ✅ Mark which user's history was loaded
 
 # Sidebar Logout
 with st.sidebar:
@@ -74,6 +84,15 @@ st.markdown("### Your Learning History 📖")
 if not st.session_state["chat_history"]:
     st.info("Dive In – Start Building Your Knowledge Library!")
 
+# Older history is fetched one page at a time, on request
+if st.session_state.get("history_cursor") is not None and st.button("Load older messages ⬆️"):
+    try:
+        older, st.session_state["history_cursor"] = load_history_page(st.session_state["history_cursor"])
+        st.session_state["chat_history"] = older + st.session_state["chat_history"]
+    except Exception as e:
+        st.warning(f"⚠️ Error loading history: {e}")
+    st.rerun()
+
 for chat in st.session_state["chat_history"]:
     with st.container():
         st.markdown(f"🧑‍💻 **You:** {chat['user']}")
@@ -89,55 +108,59 @@ if send_button:
     if not user_message.strip():
         st.error("⚠️ Please enter a valid question.")
     else:
-        # ✅ Send message to FastAPI `/query` endpoint
-        response = requests.post(f"{API_URL}/query", json={
-            "user_id": user_id,
-            "question": user_message
-        })
-
-        if response.status_code == 200:
-            data = response.json()
-            bot_response = data.get("generated_answer", "🤖 AI did not respond.")
-            validation_result = data.get("validation_result", "Error")
-            confidence_score = data.get("confidence_score", 0.0)
+        # ✅ Stream the answer from FastAPI `/query/stream` endpoint
+        with st.container():
+            st.markdown(f"🧑‍💻 **You:** {user_message}")
+            answer_placeholder = st.empty()
+        answer_placeholder.markdown("🤖 **CyberBOT:** ...")
+
+        bot_response = ""
+        validation_result = "Error"
+        confidence_score = 0.0
+        stream_ok = False
+
+        try:
+            with requests.post(f"{API_URL}/query/stream", json={
+                "user_id": user_id,
+                "question": user_message
+            }, headers=auth_headers, stream=True) as response:
+                if response.status_code == 200:
+                    stream_ok = True
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line:
+                            continue
+                        event = json.loads(line)
+
+                        if event["event"] == "token":
+                            bot_response += event["content"]
+                            answer_placeholder.markdown(f"🤖 **CyberBOT:** {bot_response}▌")
+                        elif event["event"] == "validation":
+                            # The final event carries the verdict and the answer to keep
+                            bot_response = event.get("generated_answer", bot_response)
+                            validation_result = event.get("validation_result", "Error")
+                            confidence_score = event.get("confidence_score", 0.0)
+                            answer_placeholder.markdown(f"🤖 **CyberBOT:** {bot_response}")
+                else:
+                    print(f"❌ Debug: API `/query/stream` request failed: {response.status_code} - {response.text}")
+        except requests.RequestException as e:
+            print(f"❌ Debug: API `/query/stream` request failed: {e}")
+
+        if stream_ok:
+            if not bot_response:
+                bot_response = "🤖 AI did not respond."
 
             # ✅ Debugging: Print AI response
             print(f"💬 User asked: {user_message}")
             print(f"🤖 AI responded: {bot_response}")
             print(f"📜 Validation Result: {validation_result} | Confidence Score: {confidence_score}")
 
-            # ✅ Ensure response is valid before storing
+            # ✅ Ensure response is valid before displaying
             if not bot_response.strip():
                 bot_response = "⚠️ Sorry, I couldn't generate an answer."
 
-            # ✅ Store the question-answer pair in the database
-            store_payload = {
-                "user_id": user_id,  # Ensure user_id is included
-                "question": user_message,
-                "answer": bot_response,
-                "validation_result": validation_result,
-                "confidence_score": confidence_score
-            }
-
-            # ✅ Debug: Print the request payload before sending
-            print(f"📝 Debug: Payload sent to `/questions/`: {store_payload}")
-
-            # ✅ Store the question-answer pair in the database
-            store_response = requests.post(
-                f"{API_URL}/questions/",
-                data=json.dumps(store_payload),
-                headers={"Content-Type": "application/json"}
-            )
-
-            # ✅ Debug API response
-            print(f"📝 Debug: `/questions/` API response: {store_response.status_code} - {store_response.text}")
-
-            if store_response.status_code != 200:
-                st.warning(f"⚠️ Failed to store the chat history: {store_response.text}")
-
+            # The backend stores the question-answer pair itself as part of /query/stream
         else:
             bot_response = "⚠️ Failed to get a response from AI."
-            print(f"❌ Debug: API `/query` request failed: {response.status_code} - {response.text}")
 
         # ✅ Store response in chat history
         st.session_state["chat_history"].append(
@@ -1,4 +1,5 @@
 import os
+import sys
 import torch
 import pandas as pd
 import numpy as np
@@ -8,6 +9,11 @@ from sentence_transformers import SentenceTransformer
 
 ROOT_DIR = Path(__file__).resolve().parent
 kb_path = ROOT_DIR / "dataset" / "kb"
+output_dir = ROOT_DIR / "backend"
+
+sys.path.insert(0, str(output_dir))
+from metadata_store import write_store, stable_id, content_hash, save_array
+from bm25 import BM25Index
 
 # Set device for computation
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
@@ -23,15 +29,33 @@ def load_qa_kb(name='kb.csv', path=kb_path):
     kb = pd.read_csv(kb_path)
     return kb
 
+EMBEDDINGS_PATH = output_dir / "qa_embeddings.npy"
+METADATA_PATH = output_dir / "qa_metadata.records"
+IDS_PATH = output_dir / "qa_ids.npy"  # one (stable id, content hash) pair per embedding row
+BM25_PATH = output_dir / "qa_bm25.npz"
+
+# Load the previous run's embeddings, keyed by stable id
+def load_previous_embeddings():
+    """
+    Returns {stable id: (content hash, embedding)} from the last run, or {} when
+    there is nothing consistent to reuse.
+    """
+    try:
+        ids = np.load(IDS_PATH)
+        embeddings = np.load(EMBEDDINGS_PATH, mmap_mode="r")
+    except FileNotFoundError:
+        return {}
+    if len(ids) != len(embeddings):
+        print("⚠️ qa_ids.npy does not match qa_embeddings.npy, re-embedding everything.")
+        return {}
+    return {int(row_id): (int(row_hash), embeddings[row]) for row, (row_id, row_hash) in enumerate(ids)}
+
 # Compute embeddings for text pairs
 def compute_embedding(texts, model):
     embeddings = model.encode(texts, normalize_embeddings=True)
     return np.array(embeddings, dtype=np.float32)  # Convert to NumPy array
 
 if __name__ == '__main__':
-    print("⚡ Loading embedding model...")
-    model = load_qa_retriever()
-
     print("⚡ Loading KB dataset...")
     kb = load_qa_kb()
 
@@ -39,19 +63,7 @@ if __name__ == '__main__':
     if "Question" not in kb.columns or "Answer" not in kb.columns:
         raise ValueError("❌ 'Question' or 'Answer' column not found in kb.csv!")
 
-    print("⚡ Generating embeddings for KB question-answer pairs...")
-
-    # Concatenate Question + Answer for embeddings
-    qa_texts = kb.apply(lambda row: f"Q: {row['Question']} A: {row['Answer']}", axis=1).tolist()
-
-    # Compute embeddings
-    qa_embeddings = compute_embedding(qa_texts, model)
-
-    # Save KB embeddings
-    np.save("qa_embeddings.npy", qa_embeddings)
-    print(f"✅ qa embeddings saved to qa_embeddings.npy with shape {qa_embeddings.shape}")
-
-    # Create metadata for KB
+    # Create metadata for KB, one row per embedding
     kb_metadata = []
     for i, row in kb.iterrows():
         kb_metadata.append({
@@ -63,7 +75,65 @@ if __name__ == '__main__':
             "source": "kb.csv"
         })
 
-    # Save KB metadata
-    with open("qa_metadata.json", "w") as f:
-        json.dump(kb_metadata, f, indent=4)
-    print("✅ QA metadata saved to qa_metadata.json")
+    ids = np.array([stable_id(qa["qid"]) for qa in kb_metadata], dtype=np.int64)
+    hashes = np.array([content_hash(qa["question"], qa["answer"]) for qa in kb_metadata], dtype=np.int64)
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("❌ Duplicate QIDs in kb.csv, stable ids would collide!")
+
+    # Reuse embeddings of unchanged rows; only new or edited rows go through the model
+    previous = {} if "--full" in sys.argv else load_previous_embeddings()
+    reused, to_embed = {}, []
+    for row, (row_id, row_hash) in enumerate(zip(ids.tolist(), hashes.tolist())):
+        cached = previous.get(row_id)
+        if cached is not None and cached[0] == row_hash:
+            reused[row] = cached[1]
+        else:
+            to_embed.append(row)
+
+    removed = len(set(previous) - set(ids.tolist()))
+    print(f"⚡ {len(reused)} unchanged, {len(to_embed)} new or changed, {removed} removed QA pairs.")
+
+    qa_embeddings = None
+    if to_embed:
+        print("⚡ Loading embedding model...")
+        model = load_qa_retriever()
+
+        print("⚡ Generating embeddings for new or changed question-answer pairs...")
+
+        # Concatenate Question + Answer for embeddings
+        qa_texts = [f"Q: {kb_metadata[row]['question']} A: {kb_metadata[row]['answer']}" for row in to_embed]
+        new_embeddings = compute_embedding(qa_texts, model)
+        qa_embeddings = np.empty((len(kb_metadata), new_embeddings.shape[1]), dtype=np.float32)
+        qa_embeddings[to_embed] = new_embeddings
+    elif reused:
+        qa_embeddings = np.empty((len(kb_metadata), len(next(iter(reused.values())))), dtype=np.float32)
+
+    if qa_embeddings is None:
+        raise ValueError("❌ kb.csv has no rows to embed!")
+    for row, embedding in reused.items():
+        qa_embeddings[row] = embedding
+    previous.clear()
+
+    # Save KB embeddings, ids and metadata (each written atomically; the backend maps them)
+    save_array(qa_embeddings, EMBEDDINGS_PATH)
+    print(f"✅ qa embeddings saved to qa_embeddings.npy with shape {qa_embeddings.shape}")
+
+    save_array(np.stack([ids, hashes], axis=1), IDS_PATH)
+    print("✅ Stable ids and content hashes saved to qa_ids.npy")
+
+    # Save KB metadata as a memory-mapped columnar store (O(1) row fetch, no parse at startup)
+    write_store(kb_metadata, METADATA_PATH,
+                columns=["qid", "question", "answer", "ontology", "relation", "source"])
+    print("✅ QA metadata saved to qa_metadata.records")
+
+    # Lexical index over the same rows, for hybrid BM25 + dense retrieval
+    bm25 = BM25Index.build([f"{qa['question']} {qa['answer']}" for qa in kb_metadata])
+    bm25.save(BM25_PATH)
+    print(f"✅ BM25 index ({len(bm25.vocab)} terms) saved to qa_bm25.npz")
+
+    if "--json" in sys.argv:
+        with open(output_dir / "qa_metadata.json", "w") as f:
+            json.dump(kb_metadata, f, indent=4, default=str)
+        print("✅ QA metadata also saved to qa_metadata.json")
+
+    print("➡️ Run `python faiss_index.py --update` to apply the changes to the live index.")